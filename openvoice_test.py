@@ -1,5 +1,5 @@
 import torch
-from openvoice import se_extractor
+import se_cache
 from openvoice.api import BaseSpeakerTTS, ToneColorConverter
 
 # Paths to checkpoints (adjust based on your downloaded files)
@@ -26,12 +26,13 @@ output_path = "output_cloned_voice.wav"
 text_to_speak = "Hello, this is a test of voice cloning with OpenVoice!"  # Text to generate
 
 # Step 1: Extract source speaker embedding (default English speaker)
-source_se = torch.load(
-    "checkpoints_v2/base_speakers/EN/en_default_se.pth").to(device)
+source_se = se_cache.load_se(
+    "checkpoints_v2/base_speakers/EN/en_default_se.pth", device)
 
 # Step 2: Extract target speaker embedding from reference audio
-target_se, _ = se_extractor.get_se(
-    reference_audio, converter, target_sample_rate=16000)
+# (cached by audio content and converter checkpoint, see se_cache.py)
+target_se = se_cache.get_se(
+    reference_audio, converter, converter_checkpoint, device, target_sample_rate=16000)
 
 # Step 3: Generate base audio with the source speaker
 tts.tts(text_to_speak, output_path, speaker="default", speed=1.0)
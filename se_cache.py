@@ -0,0 +1,89 @@
+"""Persistent cache of OpenVoice speaker embeddings.
+
+se_extractor.get_se runs VAD, segmentation and the tone-color encoder over the whole
+reference clip on every call. Brand voices are reused thousands of times, so their
+embeddings are stored on disk under the SHA-256 of the reference audio and of the
+converter checkpoint, and each one is loaded into memory once per process.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+SE_CACHE_DIR = os.getenv("SE_CACHE_DIR", ".se_cache")
+
+_lock = threading.Lock()
+# Embeddings already loaded in this process, by cache key and device
+_embeddings = {}
+# Content hashes by (path, size, mtime), so a checkpoint is hashed once per process
+_hashes = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file's content, memoized while its size and mtime stay the same."""
+    stat = os.stat(path)
+    fingerprint = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if fingerprint in _hashes:
+            return _hashes[fingerprint]
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    with _lock:
+        _hashes[fingerprint] = sha.hexdigest()
+    return _hashes[fingerprint]
+
+
+def cache_key(reference_audio, checkpoint, options=None):
+    """Key of one embedding: reference audio, converter checkpoint and extraction options."""
+    key = f"{file_digest(reference_audio)[:32]}_{file_digest(checkpoint)[:16]}"
+    if options:
+        encoded = json.dumps(options, sort_keys=True, default=str).encode('utf-8')
+        key += f"_{hashlib.sha256(encoded).hexdigest()[:8]}"
+    return key
+
+
+def _remember(key, device, load):
+    """Load an embedding once per process and device."""
+    with _lock:
+        if (key, device) in _embeddings:
+            return _embeddings[(key, device)]
+    se = load().to(device)
+    with _lock:
+        return _embeddings.setdefault((key, device), se)
+
+
+def get_se(reference_audio, converter, checkpoint, device=None, **options):
+    """Speaker embedding of reference_audio for the converter loaded from checkpoint.
+
+    Only the first call for a given audio, checkpoint and options runs se_extractor;
+    options are passed on to se_extractor.get_se.
+    """
+    import torch
+    device = device or getattr(converter, 'device', 'cpu')
+    key = cache_key(reference_audio, checkpoint, options)
+    path = os.path.join(SE_CACHE_DIR, f"{key}.pth")
+
+    def load():
+        if os.path.exists(path):
+            return torch.load(path, map_location='cpu')
+        from openvoice import se_extractor
+        print(f"Extracting speaker embedding of {reference_audio}...")
+        se, _ = se_extractor.get_se(reference_audio, converter, **options)
+        se = se.detach().cpu()
+        # Written under a temporary name so concurrent runs never read a partial file
+        os.makedirs(SE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        torch.save(se, tmp_path)
+        os.replace(tmp_path, path)
+        return se
+
+    return _remember(key, str(device), load)
+
+
+def load_se(path, device='cpu'):
+    """A saved embedding such as a base speaker's en_default_se.pth, read from disk once per process."""
+    import torch
+    return _remember(f"file:{file_digest(path)}", str(device), lambda: torch.load(path, map_location='cpu'))
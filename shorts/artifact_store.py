@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+STORE_ROOT = os.getenv("SHORTS_CACHE_DIR", ".shorts_cache")
+
+# Bump a stage's version when its output format or algorithm changes
+STAGE_VERSIONS = {
+    'download': 1,
+    'detections': 1,
+    'crop_plan': 1,
+    'subtitles': 1,
+    'render': 1,
+    'final': 1,
+}
+
+
+def digest(data):
+    """Stable SHA-256 of any JSON-serializable value."""
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def is_local_source(source):
+    return os.path.isfile(source)
+
+
+def source_fingerprint(source):
+    """Identity of a job source: the URL, or path, size and mtime of a local file."""
+    if is_local_source(source):
+        stat = os.stat(source)
+        return {'path': os.path.abspath(source), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    return source
+
+
+def atomic_write_json(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class ArtifactStore:
+    """Content-addressed store of stage outputs.
+
+    A stage's key hashes its name, version, parameters and the keys of its inputs,
+    so identical work always maps to the same artifact and any change upstream
+    produces a new key downstream.
+    """
+
+    def __init__(self, root=STORE_ROOT):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'manifests'), exist_ok=True)
+
+    def key(self, stage, **params):
+        return digest({'stage': stage, 'version': STAGE_VERSIONS.get(stage, 1), 'params': params})
+
+    def path(self, key, suffix=''):
+        return os.path.join(self.root, 'objects', key[:2], key + suffix)
+
+    def get(self, key, suffix=''):
+        """Path of a stored artifact, or None if it was never produced."""
+        path = self.path(key, suffix)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return path
+        return None
+
+    def put(self, key, src_path, suffix=''):
+        """Move a finished file into the store. Readers never see a partial artifact."""
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        shutil.move(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def export(self, key, suffix, dest_path):
+        """Copy an artifact out of the store.
+
+        Always a real copy: a hard link would let any in-place write to the published file
+        corrupt the stored artifact that later cache hits return. The copy replaces dest_path
+        atomically, so an older export (even a hard-linked one) is never written through.
+        """
+        src = self.path(key, suffix)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex[:8]}.tmp"
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dest_path)
+        return dest_path
+
+    def manifest(self, job_id):
+        return JobManifest(self, job_id)
+
+
+class JobManifest:
+    """Per-job record of which artifact each stage of each segment produced."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.path = os.path.join(store.root, 'manifests', f"{job_id}.json")
+        self.data = {'job_id': job_id, 'created': time.time(), 'segments': {}}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    def record(self, segment_id, stage, key, status, path=None):
+        segment = self.data['segments'].setdefault(str(segment_id), {})
+        segment[stage] = {'key': key, 'status': status,
+                          'path': path, 'time': time.time()}
+        self.save()
+
+    def save(self):
+        self.data['updated'] = time.time()
+        atomic_write_json(self.path, self.data)
@@ -0,0 +1,156 @@
+import subprocess
+import numpy as np
+
+# Low sample rate is plenty for loudness/energy features and keeps the pipe tiny
+AUDIO_SAMPLE_RATE = 8000
+WINDOW_SECONDS = 0.5
+# Sub-window frame used for the syllable envelope (20ms)
+ENVELOPE_SECONDS = 0.02
+# Windows decoded per read from the ffmpeg pipe
+WINDOWS_PER_READ = 64
+
+FEATURE_DTYPE = np.dtype([
+    ('time', 'f8'),         # window start in seconds
+    ('loudness', 'f4'),     # RMS level in dBFS
+    ('spike', 'f4'),        # laughter/applause-like energy jump in dB
+    ('speech_rate', 'f4'),  # syllable-like onsets per second
+])
+
+SILENCE_DB = -50.0
+
+
+def _window_features(windows, sample_rate, state):
+    """Compute features for a block of equally sized windows, updating the running baseline."""
+    samples = windows.astype(np.float32) / 32768.0
+
+    # Loudness per window
+    rms = np.sqrt(np.mean(samples * samples, axis=1))
+    loudness = 20 * np.log10(rms + 1e-6)
+
+    # Zero-crossing rate: applause and laughter are broadband, speech is not
+    signs = np.signbit(samples)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+    # Syllable-like onsets from a 20ms energy envelope
+    env_size = max(1, int(sample_rate * ENVELOPE_SECONDS))
+    env_count = samples.shape[1] // env_size
+    env = samples[:, :env_count * env_size].reshape(len(samples), env_count, env_size)
+    env_db = 10 * np.log10(np.mean(env * env, axis=2) + 1e-10)
+    threshold = np.maximum(env_db.max(axis=1, keepdims=True) - 12, SILENCE_DB)
+    active = env_db > threshold
+    onsets = np.count_nonzero(active[:, 1:] & ~active[:, :-1], axis=1)
+    window_seconds = samples.shape[1] / sample_rate
+    speech_rate = onsets / window_seconds
+
+    # Energy jump over a slow running baseline (~30s), weighted by noisiness
+    spike = np.zeros(len(samples), dtype=np.float32)
+    decay = min(1.0, window_seconds / 30.0)
+    baseline = state.get('baseline')
+    for i, level in enumerate(loudness):
+        if baseline is None:
+            baseline = level
+        noisiness = min(1.0, zcr[i] / 0.3)
+        spike[i] = max(0.0, level - baseline) * (0.5 + noisiness)
+        baseline += decay * (level - baseline)
+    state['baseline'] = baseline
+
+    return loudness, spike, speech_rate
+
+
+def extract_audio_features(source, start_time=None, end_time=None,
+                           sample_rate=AUDIO_SAMPLE_RATE, window=WINDOW_SECONDS):
+    """Stream audio from a file or URL through ffmpeg and compute per-window highlight features in one pass."""
+    cmd = ['ffmpeg', '-nostdin', '-v', 'error']
+    if start_time:
+        cmd += ['-ss', str(start_time)]
+    cmd += ['-i', source]
+    if end_time is not None:
+        cmd += ['-t', str(end_time - (start_time or 0))]
+    cmd += [
+        '-vn',                   # Audio only
+        '-ac', '1',              # Mono
+        '-ar', str(sample_rate),  # Downsample in ffmpeg, not in Python
+        '-f', 's16le',
+        'pipe:1'
+    ]
+
+    window_size = int(sample_rate * window)
+    read_size = window_size * WINDOWS_PER_READ * 2  # 16-bit samples
+    offset = float(start_time or 0)
+
+    blocks = []
+    state = {}
+    window_index = 0
+    pending = b''
+
+    try:
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        print(f"Error starting ffmpeg for audio features: {e}")
+        return None
+
+    try:
+        while True:
+            data = proc.stdout.read(read_size)
+            if not data:
+                break
+            pending += data
+
+            usable = len(pending) // (window_size * 2)
+            if usable == 0:
+                continue
+
+            chunk = np.frombuffer(
+                pending[:usable * window_size * 2], dtype='<i2').reshape(usable, window_size)
+            pending = pending[usable * window_size * 2:]
+
+            loudness, spike, speech_rate = _window_features(
+                chunk, sample_rate, state)
+
+            block = np.empty(usable, dtype=FEATURE_DTYPE)
+            block['time'] = offset + \
+                (window_index + np.arange(usable)) * window
+            block['loudness'] = loudness
+            block['spike'] = spike
+            block['speech_rate'] = speech_rate
+            blocks.append(block)
+            window_index += usable
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode(errors='replace')
+        proc.stderr.close()
+        proc.wait()
+
+    if proc.returncode != 0:
+        # A truncated feature array would silently skew selection; let callers fall back to
+        # transcript-only scoring instead.
+        print(f"Error extracting audio features (ffmpeg exited {proc.returncode} "
+              f"after {window_index} windows): {stderr.strip()[-500:]}")
+        return None
+
+    if not blocks:
+        return np.empty(0, dtype=FEATURE_DTYPE)
+
+    features = np.concatenate(blocks)
+    print(
+        f"Extracted audio features for {len(features) * window:.1f}s of audio ({len(features)} windows)")
+    return features
+
+
+def top_moments(features, count=10, min_gap=20.0):
+    """Return the strongest energy spikes as (time, spike_db) pairs at least min_gap seconds apart."""
+    if features is None or len(features) == 0:
+        return []
+
+    order = np.argsort(features['spike'])[::-1]
+    moments = []
+    for idx in order:
+        spike = float(features['spike'][idx])
+        if spike <= 0 or len(moments) >= count:
+            break
+        t = float(features['time'][idx])
+        if all(abs(t - other) >= min_gap for other, _ in moments):
+            moments.append((t, spike))
+
+    return sorted(moments)
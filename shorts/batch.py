@@ -0,0 +1,267 @@
+"""Non-interactive batch mode: process many videos through shared pools.
+
+Usage:
+    python batch.py jobs.json [--cpus N] [--analysis-concurrency N] [--download-concurrency N]
+
+The job file is a JSON list (or JSON lines) of jobs such as:
+    {"url": "https://www.youtube.com/watch?v=...", "aspect_ratio": "9:16", "font_size": 42, "words_per_subtitle": 2}
+    {"path": "talk.mp4", "transcript": "talk_transcript.txt", "segments": [{"start_time": 10, "end_time": 50}]}
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from youtube_utils import get_video_id, fetch_transcript, get_audio_stream_url
+from audio_features import extract_audio_features
+from model_router import route_extraction
+from transcript import as_transcript, load_transcript_file
+from scheduler import StageScheduler, stage_budgets
+from artifact_store import ArtifactStore, is_local_source
+from main import add_segment_stages, get_job_id, resolve_detector
+from llm_client import close_clients
+from process_runner import warm_stage_workers
+import tracing
+
+JOB_DEFAULTS = {
+    'aspect_ratio': '9:16',
+    'font_size': 42,
+    'words_per_subtitle': 2,
+}
+
+
+def load_jobs(path):
+    """Read a JSON list or JSON-lines job file and fill in defaults."""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+
+    if content.startswith('['):
+        raw_jobs = json.loads(content)
+    else:
+        raw_jobs = [json.loads(line)
+                    for line in content.splitlines() if line.strip()]
+
+    jobs = []
+    names = set()
+    for i, raw_job in enumerate(raw_jobs):
+        job = normalize_job(raw_job, i, names)
+        if job is None:
+            print(f"Skipping job {i+1}: needs a 'url' or 'path'")
+            continue
+        jobs.append(job)
+    return jobs
+
+
+def normalize_job(raw_job, index, names=None):
+    """Fill in defaults and a unique name for one job dict. Returns None without a source."""
+    source = raw_job.get('url') or raw_job.get('path')
+    if not source:
+        return None
+    job = dict(JOB_DEFAULTS, **raw_job)
+    job['source'] = source
+    job.setdefault('name', default_job_name(source, index))
+    if names is not None:
+        if job['name'] in names:
+            job['name'] = f"{job['name']}_{index+1}"
+        names.add(job['name'])
+    return job
+
+
+def default_job_name(source, index):
+    if is_local_source(source):
+        return os.path.splitext(os.path.basename(source))[0]
+    return get_video_id(source) or f"job_{index+1}"
+
+
+async def analyze_job(job, analysis_limiter):
+    """Fetch the transcript and pick segments for one job. Returns (transcript, segments)."""
+    loop = asyncio.get_running_loop()
+    source = job['source']
+
+    async with analysis_limiter:
+        if job.get('transcript'):
+            transcript = load_transcript_file(job['transcript'])
+        elif is_local_source(source):
+            transcript = []
+        else:
+            transcript = await loop.run_in_executor(
+                None, fetch_transcript, get_video_id(source))
+
+        if job.get('segments'):
+            return transcript or [], job['segments']
+
+        if not transcript:
+            print(f"[{job['name']}] Could not retrieve transcript, skipping")
+            return None, None
+
+        # Audio features are a few seconds of ffmpeg, run off the event loop
+        audio_source = source if is_local_source(source) else await loop.run_in_executor(
+            None, get_audio_stream_url, source)
+        audio_features = None
+        if audio_source:
+            with tracing.span('audio_features', cat='analysis', job=job['name']):
+                audio_features = await loop.run_in_executor(
+                    None, extract_audio_features, audio_source)
+
+        segments, report = await route_extraction(transcript, audio_features)
+        print(
+            f"[{job['name']}] {len(segments)} segments chosen by {report['model']}")
+        return transcript, segments
+
+
+def parse_stage_key(stage_key):
+    """Split a "{job_key}/{stage}:{segment_id}" stage key into its parts (segment_id may be None)."""
+    job_key, _, name = stage_key.partition('/')
+    stage, _, segment_id = name.partition(':')
+    return job_key, stage, int(segment_id) if segment_id else None
+
+
+def queue_job(scheduler, budgets, store, job, job_key, analysis_limiter, download_limiter=None,
+              output_root="shorts_output", on_finish=None):
+    """Add a job's analysis stage to a shared scheduler.
+
+    Once analysis has picked segments it queues their stages under the "{job_key}/"
+    prefix, plus a finish stage that runs after every segment is published and cleaned
+    up. on_finish(job, results, error) gets {segment_id: output path or None}.
+    """
+    output_dir = os.path.join(output_root, job['name'])
+
+    def finish(publish_stages):
+        async def finish_job():
+            results = {}
+            for segment_id, stage_key in publish_stages.items():
+                ok = scheduler.stages[stage_key].status == 'done'
+                results[segment_id] = os.path.join(
+                    output_dir, f"short_{segment_id}.mp4") if ok else None
+            if on_finish:
+                on_finish(job, results, None)
+            return True
+        return finish_job
+
+    async def analyze():
+        try:
+            transcript, segments = await analyze_job(job, analysis_limiter)
+        except Exception as e:
+            print(f"[{job['name']}] Analysis failed: {e}")
+            segments = None
+        if not segments:
+            if on_finish:
+                on_finish(job, {}, 'analysis failed')
+            return False
+
+        # Queue this job's segments on the shared scheduler while it runs
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = store.manifest(get_job_id(
+            job['source'], segments, job['aspect_ratio'], job['font_size'], job['words_per_subtitle']))
+        indexed_transcript = as_transcript(transcript)
+        detector = await resolve_detector(job['source'], segments)
+        publish_stages = {}
+        for i, segment in enumerate(segments):
+            publish_stages[i+1] = add_segment_stages(
+                scheduler, budgets, store, manifest,
+                segment=segment,
+                segment_id=i+1,
+                total_segments=len(segments),
+                source=job['source'],
+                transcript_data=indexed_transcript,
+                aspect_ratio=job['aspect_ratio'],
+                font_size=job['font_size'],
+                words_per_subtitle=job['words_per_subtitle'],
+                output_dir=output_dir,
+                stage_prefix=f"{job_key}/",
+                download_limiter=download_limiter,
+                detector=detector
+            )
+        cleanup_stages = [f"{job_key}/cleanup:{segment_id}" for segment_id in publish_stages]
+        scheduler.add(f"{job_key}/finish", finish(publish_stages), cpus=0,
+                      deps=[*publish_stages.values(), *cleanup_stages], always=True)
+        return True
+
+    # Analysis only waits on the network and the LLM, so it takes no CPU budget
+    return scheduler.add(f"{job_key}/analyze", analyze, cpus=0, priority=-1)
+
+
+async def run_batch(jobs, total_cpus=None, analysis_concurrency=4, download_concurrency=4,
+                    output_root="shorts_output"):
+    """Analyze and render all jobs on one scheduler with global limits. Returns a per-job report."""
+    total_cpus = total_cpus or os.cpu_count() or 4
+    budgets = stage_budgets(total_cpus)
+    store = ArtifactStore()
+    scheduler = StageScheduler(total_cpus)
+    analysis_limiter = asyncio.Semaphore(analysis_concurrency)
+    download_limiter = asyncio.Semaphore(download_concurrency)
+
+    report = {job['name']: {'source': job['source'], 'segments': {}} for job in jobs}
+
+    def on_finish(job, results, error):
+        if error:
+            report[job['name']]['error'] = error
+        for segment_id, output in results.items():
+            report[job['name']]['segments'][segment_id] = {
+                'ok': output is not None, 'output': output}
+        done = sum(output is not None for output in results.values())
+        print(f"[{job['name']}] Finished: {done}/{len(results)} shorts")
+
+    warm_stage_workers()
+    for job_index, job in enumerate(jobs):
+        queue_job(scheduler, budgets, store, job, str(job_index), analysis_limiter,
+                  download_limiter, output_root, on_finish)
+
+    def on_complete(stage):
+        job_key, name, segment_id = parse_stage_key(stage.key)
+        if name == 'publish':
+            ok = stage.status == 'done'
+            print(f"{'✅' if ok else '❌'} [{jobs[int(job_key)]['name']}] short {segment_id}")
+
+    try:
+        await scheduler.run(on_complete)
+    finally:
+        await close_clients()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Process many videos into shorts without prompts.")
+    parser.add_argument('job_file', help="JSON list or JSON-lines job file")
+    parser.add_argument('--cpus', type=int, default=None,
+                        help="CPU budget shared by all jobs (default: all cores)")
+    parser.add_argument('--analysis-concurrency', type=int, default=4,
+                        help="Jobs analyzed (transcript + LLM) at once")
+    parser.add_argument('--download-concurrency', type=int, default=4,
+                        help="Segments downloaded at once")
+    parser.add_argument('--output-dir', default="shorts_output",
+                        help="Each job writes to a subdirectory of this")
+    parser.add_argument('--trace', default=None,
+                        help="Write per-stage timing spans (JSON lines) to this file")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+
+    jobs = load_jobs(args.job_file)
+    if not jobs:
+        print("No jobs to run.")
+        return
+
+    print(f"Running {len(jobs)} jobs...")
+    start_time = time.time()
+    report = asyncio.run(run_batch(jobs, args.cpus, args.analysis_concurrency,
+                                   args.download_concurrency, args.output_dir))
+    total_time = time.time() - start_time
+
+    report_path = os.path.join(args.output_dir, "batch_report.json")
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'elapsed': total_time, 'jobs': report}, f, indent=2)
+
+    done = sum(segment['ok'] for job in report.values()
+               for segment in job['segments'].values())
+    total = sum(len(job['segments']) for job in report.values())
+    print(f"\nBatch completed in {total_time:.2f} seconds: {done}/{total} shorts")
+    print(f"Report written to {report_path}")
+    if args.trace:
+        print(f"Trace written to {args.trace} (python tracing.py {args.trace} -o trace.json)")
+
+
+if __name__ == "__main__":
+    main()
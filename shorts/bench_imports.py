@@ -0,0 +1,108 @@
+"""Import-time benchmark for the pipeline modules.
+
+Usage:
+    python bench_imports.py [--repeat 5] [--baseline import_baseline.json] [--save]
+
+Each module is imported in a fresh interpreter. The check fails if a module pulls in
+one of the heavy packages at import time (they belong inside the functions that use
+them), or if it got more than --tolerance slower than the stored baseline.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Entry points and the modules they import at startup
+MODULES = ['main', 'batch', 'daemon', 'youtube_utils', 'ai_extractor', 'model_router',
+           'video_processor', 'face_tracker', 'face_detectors', 'subtitle_generator', 'scheduler',
+           'process_runner', 'media_probe']
+
+# Packages that take seconds to import and must only load when actually used
+HEAVY_PACKAGES = ['cv2', 'mediapipe', 'openai', 'httpx',
+                  'yt_dlp', 'youtube_transcript_api', 'torch']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'elapsed': elapsed, 'heavy': heavy}}))
+"""
+
+
+def time_import(module, repeat=5):
+    """Best-of-N import time of a module in a fresh interpreter, plus the heavy packages it loaded."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    heavy = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+            cwd=here, capture_output=True, text=True)
+        if result.returncode != 0:
+            return {'error': result.stderr.strip().splitlines()[-1]}
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        best = data['elapsed'] if best is None else min(best, data['elapsed'])
+        heavy = data['heavy']
+    return {'elapsed': best, 'heavy': heavy}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure module import times and catch eager heavy imports.")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Fresh interpreters per module; the fastest run counts")
+    parser.add_argument('--baseline', default="import_baseline.json",
+                        help="Stored timings to compare against")
+    parser.add_argument('--save', action='store_true',
+                        help="Write this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="Allowed slowdown over the baseline (0.5 = 50%%)")
+    parser.add_argument('--min-delta', type=float, default=0.02,
+                        help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    print(f"{'module':<20}{'import (ms)':>12}{'baseline':>12}  notes")
+    for module in MODULES:
+        result = time_import(module, args.repeat)
+        results[module] = result
+        if 'error' in result:
+            failures.append(module)
+            print(f"{module:<20}{'-':>12}{'-':>12}  {result['error']}")
+            continue
+
+        notes = []
+        if result['heavy']:
+            failures.append(module)
+            notes.append("imports " + ", ".join(result['heavy']))
+        previous = baseline.get(module, {}).get('elapsed')
+        if previous is not None:
+            slowdown = result['elapsed'] - previous
+            if slowdown > args.min_delta and slowdown > previous * args.tolerance:
+                failures.append(module)
+                notes.append(f"{slowdown * 1000:+.0f} ms over baseline")
+        previous_ms = f"{previous * 1000:.1f}" if previous is not None else '-'
+        print(f"{module:<20}{result['elapsed'] * 1000:>12.1f}{previous_ms:>12}  {'; '.join(notes)}")
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({module: result for module, result in results.items()
+                       if 'error' not in result}, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+
+    if failures:
+        print(f"\nFailed or regressed imports: {', '.join(sorted(set(failures)))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Micro-benchmarks for the face tracker, the subtitle generator and the ffmpeg stages.
+
+Usage:
+    python benchmark.py [--sizes 720p,1080p] [--fps 30] [--duration 10] [--only tracker,subtitles,ffmpeg]
+                        [--output bench_results.json] [--baseline bench_baseline.json] [--save-baseline]
+
+Test clips are generated locally with ffmpeg (testsrc2 background, a moving
+face-like sprite and a sine tone) and cached, so runs are repeatable offline.
+Metrics ending in _fps or _per_s are better when higher, metrics ending in _s
+are better when lower; anything worse than --tolerance against the baseline fails.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from artifact_store import STORE_ROOT
+from ffmpeg_runner import monitor as encode_monitor, run_ffmpeg_sync
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+
+BENCH_DIR = os.path.join(STORE_ROOT, 'bench')
+# Bump when the generated test clips change, so cached clips are regenerated
+CLIP_VERSION = 2
+
+WORDS = ("so the thing about building a product is that nobody tells you how much "
+         "of it is just talking to people and listening to what they actually need").split()
+
+
+def face_sprite(fps, height):
+    """Filtergraph for a frontal cartoon face labelled [face], about a third of the frame tall.
+
+    A plain disc with two dots was found by the detector in only about half the frames,
+    so the tracker benchmark mostly timed the no-face path. This oval has the hair line,
+    brows, eyes with pupils, nose and mouth the detectors key on; bench_tracker reports
+    the measured hit rate alongside the timings.
+    """
+    fh = height // 3
+    fw = fh * 4 // 5
+
+    def box(x, y, w, h, color):
+        return (f"drawbox=x={int(fw * x)}:y={int(fh * y)}:w={max(2, int(fw * w))}:h={max(2, int(fh * h))}:"
+                f"c={color}:t=fill,")
+
+    return (
+        f"color=c=0xE0AC69:s={fw}x{fh}:r={fps},format=yuva420p,"
+        f"geq=lum='lum(X,Y)':cb='cb(X,Y)':cr='cr(X,Y)':"
+        f"a='if(lte(hypot((X-W/2)/(W/2),(Y-H/2)/(H/2)),1),255,0)',"
+        + box(0, 0, 1, 0.2, '0x2B1D14')               # hair
+        + box(0.16, 0.31, 0.24, 0.035, '0x2B1D14')    # brows
+        + box(0.60, 0.31, 0.24, 0.035, '0x2B1D14')
+        + box(0.16, 0.38, 0.24, 0.08, 'white')        # eyes
+        + box(0.60, 0.38, 0.24, 0.08, 'white')
+        + box(0.24, 0.385, 0.09, 0.07, '0x1E1410')    # pupils
+        + box(0.68, 0.385, 0.09, 0.07, '0x1E1410')
+        + box(0.45, 0.46, 0.10, 0.17, '0xC68E5A')     # nose
+        + box(0.32, 0.72, 0.36, 0.05, '0x8E3B3B')     # mouth
+        + "null[face];"
+    )
+
+
+def make_test_clip(size, fps, duration, directory=BENCH_DIR):
+    """Render (or reuse) a synthetic clip with a cartoon face drifting over a test pattern."""
+    width, height = RESOLUTIONS[size]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"clip_{size}_{fps}fps_{duration}s_v{CLIP_VERSION}.mp4")
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        return path
+
+    graph = (
+        f"testsrc2=s={width}x{height}:r={fps}:d={duration}[bg];"
+        + face_sprite(fps, height) +
+        "[bg][face]overlay=x='(W-w)/2+W/4*sin(t/2)':y='(H-h)/2+H/10*cos(t/3)':shortest=1[v]"
+    )
+    cmd = [
+        'ffmpeg', '-y',
+        '-filter_complex', graph,
+        '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        '-map', '[v]', '-map', '0:a',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-t', str(duration),
+        path
+    ]
+    print(f"Generating {size} {fps}fps test clip...")
+    run_ffmpeg_sync(cmd, duration=duration, label=f"generate {size}@{fps}")
+    return path
+
+
+def synthetic_transcript(entries, seed=0):
+    """Transcript entries of 4-12 words each, back to back, like auto-generated captions."""
+    rng = random.Random(seed)
+    transcript = []
+    start = 0.0
+    for _ in range(entries):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 12))]
+        duration = 0.3 * len(words)
+        transcript.append({'start': start, 'duration': duration, 'text': ' '.join(words)})
+        start += duration
+    return transcript
+
+
+def face_hit_rate(clip, samples=40):
+    """Share of sampled frames in which the configured face detector finds a face."""
+    from face_detectors import open_detector, sample_frames
+
+    frames = sample_frames(clip, samples)
+    detector = open_detector(clip)
+    try:
+        hits = sum(detector.center(frame) is not None for frame in frames)
+    finally:
+        detector.close()
+    return hits / max(1, len(frames))
+
+
+def bench_tracker(clip, fps, duration, work_dir):
+    """Frames per second of the full track-and-crop pipeline, with its crop encode split out."""
+    from face_tracker import track_face_and_crop_mediapipe
+
+    output = os.path.join(work_dir, "tracked.mp4")
+    encodes_before = len(encode_monitor.finished)
+    start = time.perf_counter()
+    ok = track_face_and_crop_mediapipe(clip, output, "9:16")
+    elapsed = time.perf_counter() - start
+    frames = int(fps * duration)
+
+    result = {'ok': bool(ok), 'wall_s': elapsed, 'tracker_fps': frames / elapsed,
+              'face_hit_rate': face_hit_rate(clip)}
+    if result['face_hit_rate'] < 0.9:
+        print(f"Warning: face found in only {result['face_hit_rate']:.0%} of sampled frames, "
+              f"the tracker timing is mostly the no-face path")
+    crop_encodes = list(encode_monitor.finished)[encodes_before:]
+    if crop_encodes:
+        encode_s = crop_encodes[-1]['elapsed']
+        result['crop_encode_s'] = encode_s
+        # Detection + Python crop loop, without the final libx264 mux
+        result['frame_loop_fps'] = frames / max(1e-9, elapsed - encode_s)
+    return result
+
+
+def bench_subtitles(entries, work_dir, repeat=3):
+    """Throughput of create_word_by_word_subtitle_file over a whole synthetic transcript."""
+    from subtitle_generator import create_word_by_word_subtitle_file
+    from transcript import Transcript
+
+    transcript = synthetic_transcript(entries)
+    indexed = Transcript.from_entries(transcript)
+    end_time = transcript[-1]['start'] + transcript[-1]['duration']
+    words = sum(len(entry['text'].split()) for entry in transcript)
+    output = os.path.join(work_dir, "bench.srt")
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        create_word_by_word_subtitle_file(indexed, 0, end_time, output, 2)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {'entries': entries, 'wall_s': best,
+            'entries_per_s': entries / best, 'words_per_s': words / best}
+
+
+def bench_ffmpeg_stages(clip, duration, work_dir):
+    """Wall time of each ffmpeg stage the pipeline runs on a segment."""
+    from video_processor import extract_segment_async, burn_subtitles_async, create_segment_subtitles
+
+    segment = {'start_time': 0, 'end_time': duration}
+    extracted = os.path.join(work_dir, "extract.mp4")
+    srt = os.path.join(work_dir, "stage.srt")
+    burned = os.path.join(work_dir, "burned.mp4")
+    create_segment_subtitles(segment, synthetic_transcript(int(duration)), srt)
+
+    async def run():
+        timings = {}
+        start = time.perf_counter()
+        await extract_segment_async(clip, 0, duration, extracted)
+        timings['extract_s'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await burn_subtitles_async(extracted, srt, burned, duration=duration)
+        timings['subtitle_burn_s'] = time.perf_counter() - start
+        return timings
+
+    timings = asyncio.run(run())
+    timings['extract_speed_per_s'] = duration / timings['extract_s']
+    timings['subtitle_burn_speed_per_s'] = duration / timings['subtitle_burn_s']
+    return timings
+
+
+def machine_info():
+    try:
+        ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True,
+                                        text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg_version = None
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'ffmpeg': ffmpeg_version,
+        'time': time.time(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print each metric next to its baseline and return the regressed metric names."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            previous = baseline.get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not previous:
+                continue
+            if metric.endswith('_fps') or metric.endswith('_per_s'):
+                change = value / previous - 1
+            elif metric.endswith('_s'):
+                change = previous / value - 1 if value else 0
+            else:
+                continue
+            flag = ""
+            if change < -tolerance:
+                regressions.append(f"{name}.{metric}")
+                flag = "  REGRESSION"
+            print(f"  {name}.{metric}: {value:.3f} vs {previous:.3f} ({change * 100:+.1f}%){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracker, subtitles and ffmpeg stages.")
+    parser.add_argument('--sizes', default="720p,1080p",
+                        help=f"Comma-separated clip sizes from {', '.join(RESOLUTIONS)}")
+    parser.add_argument('--fps', default="30", help="Comma-separated frame rates, e.g. 24,30,60")
+    parser.add_argument('--duration', type=int, default=10, help="Clip length in seconds")
+    parser.add_argument('--subtitle-entries', default="1000,10000",
+                        help="Comma-separated transcript sizes for the subtitle benchmark")
+    parser.add_argument('--only', default="tracker,subtitles,ffmpeg",
+                        help="Comma-separated benchmarks to run")
+    parser.add_argument('--output', default="bench_results.json")
+    parser.add_argument('--baseline', default="bench_baseline.json")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Allowed slowdown against the baseline (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    only = set(args.only.split(','))
+    work_dir = os.path.join(BENCH_DIR, 'work')
+    os.makedirs(work_dir, exist_ok=True)
+    results = {}
+
+    if 'subtitles' in only:
+        for entries in (int(n) for n in args.subtitle_entries.split(',')):
+            print(f"Subtitles: {entries} entries...")
+            results[f"subtitles_{entries}"] = bench_subtitles(entries, work_dir)
+
+    for size in args.sizes.split(','):
+        for fps in (int(f) for f in args.fps.split(',')):
+            if not only & {'tracker', 'ffmpeg'}:
+                break
+            clip = make_test_clip(size, fps, args.duration)
+            if 'tracker' in only:
+                print(f"Tracker: {size} @ {fps}fps...")
+                results[f"tracker_{size}_{fps}"] = bench_tracker(clip, fps, args.duration, work_dir)
+            if 'ffmpeg' in only:
+                print(f"ffmpeg stages: {size} @ {fps}fps...")
+                results[f"ffmpeg_{size}_{fps}"] = bench_ffmpeg_stages(clip, args.duration, work_dir)
+
+    report = {'machine': machine_info(), 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline}:")
+        regressions = compare(results, baseline['results'], args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Long-lived worker daemon: a local HTTP API in front of a persistent job queue.
+
+Usage:
+    python daemon.py [--port 8765 | --socket /tmp/shorts.sock] [--cpus N]
+
+Endpoints (JSON in and out):
+    POST /jobs              enqueue a job, same fields as a batch job; returns {"id": ...}
+    GET  /jobs              list jobs and their status
+    GET  /jobs/<id>         one job with its results
+    GET  /jobs/<id>/events  stream progress events as JSON lines until the job ends
+    GET  /encoders          live throughput of the encodes this process is running
+
+The heavy modules, the LLM connection pool and a preloaded forkserver for stage
+processes are set up once at startup, so a new job starts working immediately.
+The queue is saved on every change; jobs that were queued or running when the
+daemon stopped are resumed on the next start from the artifact store.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+import uuid
+from batch import normalize_job, queue_job, parse_stage_key
+from scheduler import StageScheduler, stage_budgets
+from artifact_store import ArtifactStore, STORE_ROOT, atomic_write_json
+from process_runner import warm_stage_workers
+from llm_client import get_client, close_clients
+import tracing
+from ffmpeg_runner import monitor as encode_monitor
+
+TERMINAL_STATES = ('done', 'failed')
+
+HTTP_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request',
+                404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error',
+                503: 'Service Unavailable'}
+
+
+class JobQueue:
+    """Jobs and their progress events, persisted under state_dir."""
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, 'jobs.json')
+        os.makedirs(os.path.join(state_dir, 'events'), exist_ok=True)
+        self.jobs = {}
+        self.events = {}
+        self.updated = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for record in json.load(f)['jobs']:
+                    self.jobs[record['id']] = record
+
+    def save(self):
+        atomic_write_json(self.path, {'jobs': list(self.jobs.values())})
+
+    def add(self, job):
+        job_id = uuid.uuid4().hex[:12]
+        self.jobs[job_id] = {'id': job_id, 'job': job, 'status': 'queued',
+                             'created': time.time(), 'results': {}, 'error': None}
+        self.save()
+        self.emit(job_id, 'queued')
+        return self.jobs[job_id]
+
+    def set_status(self, job_id, status, **fields):
+        record = self.jobs[job_id]
+        record['status'] = status
+        record.update(fields)
+        self.save()
+        self.emit(job_id, status, **fields)
+
+    def events_path(self, job_id):
+        return os.path.join(self.state_dir, 'events', f"{job_id}.jsonl")
+
+    def get_events(self, job_id):
+        """Events of a job so far, read back from disk for jobs of an earlier run."""
+        if job_id not in self.events:
+            self.events[job_id] = []
+            if os.path.exists(self.events_path(job_id)):
+                with open(self.events_path(job_id), 'r', encoding='utf-8') as f:
+                    self.events[job_id] = [json.loads(line) for line in f if line.strip()]
+        return self.events[job_id]
+
+    def emit(self, job_id, event_type, **fields):
+        event = dict({'time': time.time(), 'job': job_id, 'type': event_type}, **fields)
+        self.get_events(job_id).append(event)
+        with open(self.events_path(job_id), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event) + '\n')
+
+        # Wake every stream waiting on this job
+        waiter = self.updated.pop(job_id, None)
+        if waiter:
+            waiter.set()
+
+    async def wait_for_update(self, job_id):
+        await self.updated.setdefault(job_id, asyncio.Event()).wait()
+
+
+class ShortsDaemon:
+    """Runs every job on one scheduler that lives as long as the process."""
+
+    def __init__(self, state_dir=None, total_cpus=None, analysis_concurrency=4,
+                 download_concurrency=4, output_root="shorts_output"):
+        self.queue = JobQueue(state_dir or os.path.join(STORE_ROOT, 'daemon'))
+        self.total_cpus = total_cpus or os.cpu_count() or 4
+        self.budgets = stage_budgets(self.total_cpus)
+        self.store = ArtifactStore()
+        self.scheduler = StageScheduler(self.total_cpus)
+        self.output_root = output_root
+        self.analysis_concurrency = analysis_concurrency
+        self.download_concurrency = download_concurrency
+        self.stopping = None
+        self.worker = None
+
+    async def start(self):
+        """Warm up shared state and resume unfinished jobs."""
+        print("Warming up stage workers...")
+        await asyncio.get_running_loop().run_in_executor(None, warm_stage_workers)
+        get_client()
+
+        self.analysis_limiter = asyncio.Semaphore(self.analysis_concurrency)
+        self.download_limiter = asyncio.Semaphore(self.download_concurrency)
+        self.stopping = asyncio.Event()
+        self.worker = asyncio.ensure_future(
+            self.scheduler.run(self.on_complete, stop=self.stopping))
+
+        for record in self.queue.jobs.values():
+            if record['status'] not in TERMINAL_STATES:
+                print(f"Resuming job {record['id']} ({record['job']['name']})")
+                self.start_job(record)
+
+    async def stop(self):
+        """Kill running stages; their jobs stay in the queue and resume on the next start."""
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        await close_clients()
+
+    def submit(self, raw_job):
+        for field in ('url', 'path'):
+            if raw_job.get(field) is not None and not isinstance(raw_job[field], str):
+                raise ValueError(f"'{field}' must be a string")
+        job = normalize_job(raw_job, len(self.queue.jobs))
+        if job is None:
+            raise ValueError("job needs a 'url' or 'path'")
+        # Keep every job's output directory separate
+        if any(record['job']['name'] == job['name'] for record in self.queue.jobs.values()):
+            job['name'] = f"{job['name']}_{uuid.uuid4().hex[:6]}"
+        record = self.queue.add(job)
+        self.start_job(record)
+        return record
+
+    def start_job(self, record):
+        self.queue.set_status(record['id'], 'running', started=time.time())
+        queue_job(self.scheduler, self.budgets, self.store, record['job'], record['id'],
+                  self.analysis_limiter, self.download_limiter, self.output_root, self.on_finish)
+
+    def on_finish(self, job, results, error):
+        job_id = next(record['id'] for record in self.queue.jobs.values() if record['job'] is job)
+        ok = not error and bool(results) and all(results.values())
+        self.queue.set_status(job_id, 'done' if ok else 'failed', finished=time.time(),
+                              results={str(segment_id): output for segment_id, output in results.items()},
+                              error=error)
+
+    def on_complete(self, stage):
+        job_id, name, segment_id = parse_stage_key(stage.key)
+        if job_id not in self.queue.jobs:
+            return
+        self.queue.emit(job_id, 'stage', stage=name, segment=segment_id,
+                        status=stage.status, elapsed=stage.elapsed)
+        # Drop the stage records of finished jobs
+        if name == 'finish' or (name == 'analyze' and stage.status != 'done'):
+            self.scheduler.discard(f"{job_id}/")
+
+    async def handle(self, reader, writer):
+        """Serve one HTTP/1.1 request per connection."""
+        try:
+            request = await read_request(reader)
+            if request is None:
+                return
+            method, path, body = request
+            await self.route(method, path.rstrip('/').split('/')[1:], body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:
+            await self.send_error(writer, 400, str(e))
+        except Exception as e:
+            # Never close a connection without an answer
+            print(f"Error handling request: {type(e).__name__}: {e}")
+            await self.send_error(writer, 500, 'internal error')
+        finally:
+            writer.close()
+
+    async def send_error(self, writer, status, message):
+        try:
+            await send_json(writer, status, {'error': message})
+        except ConnectionError:
+            pass
+
+    async def route(self, method, parts, body, writer):
+        if parts == ['encoders'] and method == 'GET':
+            return await send_json(writer, 200, {'running': encode_monitor.aggregate(),
+                                                 'recent': list(encode_monitor.finished)[-50:]})
+        if parts[:1] != ['jobs']:
+            return await send_json(writer, 404, {'error': 'not found'})
+
+        if len(parts) == 1:
+            if method == 'POST':
+                try:
+                    payload = json.loads(body or b'{}')
+                    if not isinstance(payload, dict):
+                        raise ValueError("job must be a JSON object")
+                    record = self.submit(payload)
+                except (ValueError, TypeError) as e:
+                    return await send_json(writer, 400, {'error': str(e)})
+                return await send_json(writer, 201, record)
+            if method == 'GET':
+                return await send_json(writer, 200, {'jobs': list(self.queue.jobs.values())})
+            return await send_json(writer, 405, {'error': 'method not allowed'})
+
+        record = self.queue.jobs.get(parts[1])
+        if record is None or method != 'GET':
+            if record is None:
+                return await send_json(writer, 404, {'error': 'not found'})
+            return await send_json(writer, 405, {'error': 'method not allowed'})
+        if len(parts) == 2:
+            return await send_json(writer, 200, record)
+        if parts[2] == 'events':
+            return await self.stream_events(record['id'], writer)
+        return await send_json(writer, 404, {'error': 'not found'})
+
+    async def stream_events(self, job_id, writer):
+        """Write the job's events so far, then each new one, until the job ends."""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        sent = 0
+        while True:
+            events = self.queue.get_events(job_id)
+            if sent < len(events):
+                for event in events[sent:]:
+                    writer.write(json.dumps(event).encode('utf-8') + b'\n')
+                sent = len(events)
+                # More events may arrive while draining, so check again before waiting
+                await writer.drain()
+                continue
+            if self.queue.jobs[job_id]['status'] in TERMINAL_STATES:
+                return
+            await self.queue.wait_for_update(job_id)
+
+
+async def read_request(reader):
+    """Read one HTTP request. Returns (method, path, body), or None for a malformed request line.
+
+    Raises ValueError for an invalid Content-Length.
+    """
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) < 2:
+        return None
+    method, path = request_line[0], request_line[1].split('?')[0]
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if line in ('\r\n', '\n', ''):
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise ValueError(f"invalid Content-Length {headers.get('content-length')!r}")
+    body = await reader.readexactly(length)
+    return method, path, body
+
+
+async def send_json(writer, status, data):
+    body = json.dumps(data).encode('utf-8')
+    writer.write(f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+
+
+async def serve(daemon, host="127.0.0.1", port=8765, socket_path=None):
+    await daemon.start()
+    if socket_path:
+        server = await asyncio.start_unix_server(daemon.handle, path=socket_path)
+        print(f"Listening on {socket_path}")
+    else:
+        server = await asyncio.start_server(daemon.handle, host, port)
+        print(f"Listening on http://{host}:{port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        print("\nShutting down, unfinished jobs resume on the next start.")
+        server.close()
+        await daemon.stop()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the shorts worker daemon with a local HTTP API.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', default=None,
+                        help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--cpus', type=int, default=None,
+                        help="CPU budget shared by all jobs (default: all cores)")
+    parser.add_argument('--analysis-concurrency', type=int, default=4,
+                        help="Jobs analyzed (transcript + LLM) at once")
+    parser.add_argument('--download-concurrency', type=int, default=4,
+                        help="Segments downloaded at once")
+    parser.add_argument('--output-dir', default="shorts_output",
+                        help="Each job writes to a subdirectory of this")
+    parser.add_argument('--state-dir', default=None,
+                        help="Where the job queue is kept (default: <cache>/daemon)")
+    parser.add_argument('--trace', default=None,
+                        help="Write per-stage timing spans (JSON lines) to this file")
+    args = parser.parse_args()
+    if args.trace:
+        # Before the forkserver starts, so stage processes inherit it
+        tracing.enable(args.trace)
+
+    daemon = ShortsDaemon(args.state_dir, args.cpus, args.analysis_concurrency,
+                          args.download_concurrency, args.output_dir)
+    asyncio.run(serve(daemon, args.host, args.port, args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""Face detector backends behind one interface, with a benchmark and per-clip auto-selection.
+
+Usage:
+    python face_detectors.py clip.mp4 [--samples 40] [--recall 0.9] [--backends haar,yunet]
+
+Backends:
+    mediapipe-short  MediaPipe short-range model (faces within ~2 m; the previous default)
+    mediapipe-full   MediaPipe full-range model (smaller, farther faces; slower)
+    yunet            OpenCV DNN YuNet (needs the ONNX model, see SHORTS_YUNET_MODEL)
+    haar             OpenCV Haar cascade on a downscaled frame, the cheapest option
+
+SHORTS_FACE_DETECTOR picks the backend (default mediapipe-short). "auto" benchmarks the
+available backends on a sample of each clip and uses the fastest one whose recall
+against the most accurate backend reaches SHORTS_DETECTOR_RECALL. Pipelines resolve
+"auto" once per job (resolve_backend) and hand the name to every detection stage.
+"""
+import argparse
+import os
+import time
+from media_probe import probe
+
+DEFAULT_BACKEND = os.getenv("SHORTS_FACE_DETECTOR", "mediapipe-short")
+YUNET_MODEL = os.getenv("SHORTS_YUNET_MODEL", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'models', 'face_detection_yunet_2023mar.onnx'))
+AUTO_RECALL = float(os.getenv("SHORTS_DETECTOR_RECALL", "0.9"))
+AUTO_SAMPLES = 40
+# Used when "auto" cannot read any frames to benchmark on
+FALLBACK_BACKEND = 'mediapipe-short'
+
+# Recall is measured against the first available of these, most accurate first
+REFERENCE_ORDER = ['mediapipe-full', 'yunet', 'mediapipe-short', 'haar']
+# Two detections closer than this fraction of the frame width are the same face
+MATCH_DISTANCE = 0.1
+# Haar runs on frames scaled down to this width
+HAAR_WIDTH = 320
+
+
+class DetectorUnavailable(Exception):
+    """A backend's library or model file is missing."""
+
+
+class MediaPipeDetector:
+    def __init__(self, model_selection=0, min_confidence=0.5):
+        try:
+            import mediapipe as mp
+        except ImportError as e:
+            raise DetectorUnavailable(f"mediapipe not installed: {e}")
+        self.detection = mp.solutions.face_detection.FaceDetection(
+            model_selection=model_selection, min_detection_confidence=min_confidence)
+        self.rgb = None
+
+    def center(self, frame):
+        """Center of the most prominent face in a BGR frame, or None."""
+        import cv2
+        height, width = frame.shape[:2]
+        # Convert into the same RGB buffer every frame
+        if self.rgb is None or self.rgb.shape != frame.shape:
+            self.rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        results = self.detection.process(self.rgb)
+        if not results.detections:
+            return None
+        bbox = results.detections[0].location_data.relative_bounding_box
+        x = int(bbox.xmin * width)
+        y = int(bbox.ymin * height)
+        return [x + int(bbox.width * width) // 2, y + int(bbox.height * height) // 2]
+
+    def close(self):
+        self.detection.close()
+
+
+class YuNetDetector:
+    def __init__(self, score_threshold=0.6):
+        import cv2
+        if not hasattr(cv2, 'FaceDetectorYN'):
+            raise DetectorUnavailable("OpenCV build has no FaceDetectorYN (needs 4.5.4+)")
+        if not os.path.exists(YUNET_MODEL):
+            raise DetectorUnavailable(f"YuNet model not found at {YUNET_MODEL}")
+        self.detector = cv2.FaceDetectorYN.create(YUNET_MODEL, "", (320, 320), score_threshold)
+        self.size = None
+
+    def center(self, frame):
+        height, width = frame.shape[:2]
+        if self.size != (width, height):
+            self.detector.setInputSize((width, height))
+            self.size = (width, height)
+        _, faces = self.detector.detect(frame)
+        if faces is None or len(faces) == 0:
+            return None
+        # Rows are x, y, w, h, five landmarks, score: take the most confident face
+        x, y, w, h = faces[faces[:, -1].argmax()][:4]
+        return [int(x + w / 2), int(y + h / 2)]
+
+    def close(self):
+        pass
+
+
+class HaarDetector:
+    def __init__(self):
+        import cv2
+        cascade_dir = getattr(getattr(cv2, 'data', None), 'haarcascades', '')
+        self.cascade = cv2.CascadeClassifier(
+            os.path.join(cascade_dir, 'haarcascade_frontalface_default.xml'))
+        if self.cascade.empty():
+            raise DetectorUnavailable("Haar cascade file not found")
+        self.gray = None
+        self.small = None
+
+    def center(self, frame):
+        import cv2
+        height, width = frame.shape[:2]
+        scale = min(1.0, HAAR_WIDTH / width)
+        # Reuse the grayscale and downscaled buffers across frames
+        if self.gray is None or self.gray.shape != (height, width):
+            self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        gray = self.gray
+        if scale < 1.0:
+            size = (int(width * scale), int(height * scale))
+            if self.small is None or self.small.shape != (size[1], size[0]):
+                self.small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+            else:
+                cv2.resize(gray, size, dst=self.small, interpolation=cv2.INTER_AREA)
+            gray = self.small
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(24, 24))
+        if len(faces) == 0:
+            return None
+        # Largest face is the most prominent one
+        x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+        return [int((x + w / 2) / scale), int((y + h / 2) / scale)]
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    'mediapipe-short': lambda: MediaPipeDetector(model_selection=0),
+    'mediapipe-full': lambda: MediaPipeDetector(model_selection=1),
+    'yunet': YuNetDetector,
+    'haar': HaarDetector,
+}
+
+ALIASES = {'mediapipe': 'mediapipe-short'}
+
+# Per-process cache of auto-selected backends, by clip path and sampled ranges
+_selected = {}
+
+
+def create_detector(name):
+    name = ALIASES.get(name, name)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown face detector {name!r}, choose from {', '.join(BACKENDS)} or auto")
+    return BACKENDS[name]()
+
+
+def sample_times(ranges, samples):
+    """`samples` times spread evenly over the total length of (start, end) ranges."""
+    lengths = [max(0.0, end - start) for start, end in ranges]
+    total = sum(lengths)
+    times = []
+    for i in range(samples):
+        offset = (i + 0.5) * total / samples
+        for (start, _), length in zip(ranges, lengths):
+            if offset < length:
+                break
+            offset -= length
+        times.append(start + min(offset, length))
+    return times
+
+
+def sample_frames(input_file, samples=AUTO_SAMPLES, ranges=None):
+    """About `samples` frames spread evenly over a clip, or over its (start, end) time ranges.
+
+    Each sample is read after a seek to its time, so a long source is not decoded end to
+    end to benchmark the detectors on a few dozen frames.
+    """
+    import cv2
+    cap = cv2.VideoCapture(input_file)
+    if not cap.isOpened():
+        return []
+    if not ranges:
+        info = probe(input_file)
+        duration = info and info['duration']
+        if not duration:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps if fps else 0
+        ranges = [(0.0, duration)]
+    frames = []
+    try:
+        if sum(end - start for start, end in ranges) <= 0:
+            # Unknown length: the first frames are all that can be sampled
+            while len(frames) < samples:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            return frames
+        for t in sample_times(ranges, samples):
+            cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+    finally:
+        cap.release()
+    return frames
+
+
+def benchmark_detectors(frames, backends=None):
+    """Latency, hit rate and recall of each backend on the same frames.
+
+    Recall is the share of the reference backend's faces that a backend also finds
+    within MATCH_DISTANCE; the reference is the first available of REFERENCE_ORDER.
+    """
+    results = {}
+    centers = {}
+    for name in backends or BACKENDS:
+        try:
+            detector = create_detector(name)
+        except DetectorUnavailable as e:
+            results[name] = {'available': False, 'reason': str(e)}
+            continue
+        try:
+            # The first call loads models and allocates buffers; keep it out of the timing
+            if frames:
+                detector.center(frames[0])
+            start = time.perf_counter()
+            centers[name] = [detector.center(frame) for frame in frames]
+            elapsed = time.perf_counter() - start
+        finally:
+            detector.close()
+        hits = sum(center is not None for center in centers[name])
+        results[name] = {
+            'available': True,
+            'latency_ms': elapsed / max(1, len(frames)) * 1000,
+            'hit_rate': hits / max(1, len(frames)),
+        }
+
+    reference = next((name for name in REFERENCE_ORDER if name in centers), None)
+    if reference is None:
+        return results
+    width = frames[0].shape[1] if frames else 1
+    reference_hits = [i for i, center in enumerate(centers[reference]) if center is not None]
+    for name, found in centers.items():
+        matched = 0
+        for i in reference_hits:
+            ref, center = centers[reference][i], found[i]
+            if center is not None and abs(center[0] - ref[0]) + abs(center[1] - ref[1]) <= MATCH_DISTANCE * width:
+                matched += 1
+        results[name]['recall'] = matched / len(reference_hits) if reference_hits else 1.0
+        results[name]['reference'] = reference
+    return results
+
+
+def choose_backend(results, recall=AUTO_RECALL):
+    """Fastest backend meeting the recall threshold, else the reference backend."""
+    candidates = [(result['latency_ms'], name) for name, result in results.items()
+                  if result['available'] and result.get('recall', 0) >= recall]
+    if candidates:
+        return min(candidates)[1]
+    return next((name for name in REFERENCE_ORDER if results.get(name, {}).get('available')), None)
+
+
+def select_backend(input_file, recall=AUTO_RECALL, samples=AUTO_SAMPLES, ranges=None):
+    """Benchmark the backends on a sample of the clip (or of its time ranges) and return the chosen one."""
+    cache_key = (input_file, tuple(tuple(r) for r in ranges or ()))
+    if cache_key not in _selected:
+        frames = sample_frames(input_file, samples, ranges)
+        if not frames:
+            print(f"Face detector auto-selection could not read {input_file}, using {FALLBACK_BACKEND}")
+            _selected[cache_key] = FALLBACK_BACKEND
+            return FALLBACK_BACKEND
+        results = benchmark_detectors(frames)
+        name = choose_backend(results, recall) or FALLBACK_BACKEND
+        summary = ', '.join(f"{backend} {result['latency_ms']:.1f}ms/{result['recall']:.0%}"
+                            for backend, result in results.items() if 'recall' in result)
+        print(f"Face detector auto-selected {name} ({summary})")
+        _selected[cache_key] = name
+    return _selected[cache_key]
+
+
+def resolve_backend(input_file, name=None, ranges=None):
+    """Concrete backend name for a clip: aliases expanded and "auto" benchmarked on the clip."""
+    name = name or DEFAULT_BACKEND
+    name = ALIASES.get(name, name)
+    if name == 'auto':
+        name = select_backend(input_file, ranges=ranges)
+    return name
+
+
+def open_detector(input_file, name=None):
+    """The detector for a clip; name defaults to SHORTS_FACE_DETECTOR, "auto" is resolved on the clip."""
+    return create_detector(resolve_backend(input_file, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face detector backends on a clip.")
+    parser.add_argument('clip')
+    parser.add_argument('--samples', type=int, default=AUTO_SAMPLES,
+                        help="Frames sampled evenly across the clip")
+    parser.add_argument('--recall', type=float, default=AUTO_RECALL,
+                        help="Recall the auto mode requires against the reference backend")
+    parser.add_argument('--backends', default=None,
+                        help=f"Comma-separated backends (default: {','.join(BACKENDS)})")
+    args = parser.parse_args()
+
+    frames = sample_frames(args.clip, args.samples)
+    if not frames:
+        print(f"Could not read frames from {args.clip}")
+        return
+    results = benchmark_detectors(frames, args.backends.split(',') if args.backends else None)
+
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    print(f"{'backend':<18}{'latency ms':>12}{'hit rate':>10}{'recall':>8}")
+    for name, result in results.items():
+        if not result['available']:
+            print(f"{name:<18}  unavailable: {result['reason']}")
+            continue
+        recall = f"{result['recall']:.0%}" if 'recall' in result else '-'
+        print(f"{name:<18}{result['latency_ms']:>12.2f}{result['hit_rate']:>10.0%}{recall:>8}")
+    print(f"auto would choose: {choose_backend(results, args.recall)}")
+
+
+if __name__ == "__main__":
+    main()
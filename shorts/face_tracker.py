@@ -1,32 +1,71 @@
-import cv2
-import mediapipe as mp
 import collections
+import json
+import math
 import os
-import subprocess
+import threading
+from face_detectors import open_detector, resolve_backend
+from ffmpeg_runner import run_ffmpeg_sync
+from media_probe import probe
+from workspace import Workspace, open_fifo_writer
 
+# Gaps between segments up to this many frames are decoded through instead of seeked over
+SEEK_GAP_FRAMES = 120
+# Seeks land this many seconds before the wanted frame and grab forward to it
+SEEK_PREROLL = 1.0
 
-def track_face_and_crop_mediapipe(input_file, output_file, aspect_ratio="9:16", segment_id=1, total_segments=1):
-    """Track faces using MediaPipe with improved smoothing for stable tracking"""
-    print(
-        f"[Segment {segment_id}/{total_segments}] Processing face tracking...")
+# Clips longer than this are tracked in parallel time shards of about this length
+SHARD_SECONDS = float(os.getenv("SHORTS_SHARD_SECONDS", "60"))
 
-    mp_face_detection = mp.solutions.face_detection
-    face_detection = mp_face_detection.FaceDetection(
-        min_detection_confidence=0.5)
+# Static-crop probe: sample detections at this rate before tracking every frame
+PROBE_FPS = 1.0
+# Largest spread of the sampled face centers, as a fraction of the frame size, that still
+# gets one fixed crop window (0 turns the fast path off)
+STATIC_TOLERANCE = float(os.getenv("SHORTS_STATIC_TOLERANCE", "0.04"))
+# A few close hits prove nothing when most samples miss the face: the fixed crop
+# needs at least this many hits, in at least this share of the samples
+STATIC_MIN_HITS = 3
+STATIC_MIN_HIT_RATE = 0.5
 
-    cap = cv2.VideoCapture(input_file)
-    if not cap.isOpened():
-        print(
-            f"[Segment {segment_id}] Error: Could not open video {input_file}")
-        return False
+# Draft renders, for checking framing and subtitle timing: this tall, encoded as fast as possible
+DRAFT_HEIGHT = int(os.getenv("SHORTS_DRAFT_HEIGHT", "480"))
+
+
+def encode_args(draft=False):
+    """libx264 settings of the crop render, or of a quick low-quality draft."""
+    if draft:
+        return ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '28']
+    return [
+        '-c:v', 'libx264',     # Use libx264 for better quality
+        '-preset', 'medium',   # Balance between quality and speed
+        '-crf', '18',          # High quality (lower is better)
+    ]
 
-    # Get video properties
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-    # Calculate target dimensions
+def draft_scale():
+    """Filter shrinking a crop to at most the draft height (even width, aspect kept)."""
+    return f"scale=-2:'min(ih,{DRAFT_HEIGHT})'"
+
+
+def limit_threads(threads):
+    """Cap OpenCV's internal thread pool for this process."""
+    if threads:
+        import cv2
+        cv2.setNumThreads(int(threads))
+
+
+def video_properties(input_file, cap):
+    """Width, height, fps and frame count of a clip from the shared probe, else OpenCV's estimates."""
+    info = probe(input_file)
+    video = info and info['video']
+    if video and video['width'] and video['fps']:
+        return video['width'], video['height'], video['fps'], video['frames'] or 0
+    import cv2
+    return (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+
+
+def compute_target_dimensions(width, height, aspect_ratio):
+    """Size of the crop window for the requested aspect ratio."""
     if aspect_ratio == "9:16":
         target_width = height * 9 // 16
         target_height = height
@@ -47,26 +86,86 @@ def track_face_and_crop_mediapipe(input_file, output_file, aspect_ratio="9:16",
         elif aspect_ratio == "4:5":
             target_height = width * 5 // 4
 
-    # Setup temporary video file
-    temp_video = f"temp_tracked_video_{segment_id}.mp4"
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(temp_video, fourcc, fps,
-                          (target_width, target_height))
+    # libx264 rejects odd frame sizes with 4:2:0 chroma (720 * 9 // 16 == 405)
+    return target_width - target_width % 2, target_height - target_height % 2
 
-    # Initialize smooth tracking with a longer history window for even smoother movement
-    history_size = 60  # Increased history for ultra-smooth motion
-    position_history_x = collections.deque(maxlen=history_size)
-    position_history_y = collections.deque(maxlen=history_size)
 
-    # Fill position history with initial center
-    for _ in range(history_size):
-        position_history_x.append(width // 2)
-        position_history_y.append(height // 2)
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    import resource
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class FrameBuffers:
+    """Preallocated frame buffers reused by a decode loop, counting every (re)allocation.
+
+    read() decodes into the same array each time, so a frame is only valid until the
+    next read(). report() prints allocations, GC collections and peak RSS, which stay
+    flat whatever the resolution or clip length.
+    """
+
+    def __init__(self):
+        import gc
+        self.frame = None
+        self.frames = 0
+        self.allocations = 0
+        self._gc_start = sum(stats['collections'] for stats in gc.get_stats())
+
+    def read(self, cap):
+        return self._keep(*(cap.read(self.frame) if self.frame is not None else cap.read()))
+
+    def retrieve(self, cap):
+        """Decode the frame of the last grab() into the buffer."""
+        return self._keep(*(cap.retrieve(self.frame) if self.frame is not None else cap.retrieve()))
+
+    def _keep(self, ret, frame):
+        if not ret:
+            return False, None
+        if frame is not self.frame:
+            # First frame, or OpenCV had to reallocate for a new size
+            self.frame = frame
+            self.allocations += 1
+        self.frames += 1
+        return True, frame
+
+    def report(self, label):
+        import gc
+        collections = sum(stats['collections'] for stats in gc.get_stats()) - self._gc_start
+        print(f"{label}: {self.frames} frames, {self.allocations} frame buffer allocations, "
+              f"{collections} GC collections, peak RSS {peak_rss_mb():.0f} MB")
+
+
+def detect_faces(input_file, segment_id=1, total_segments=1, detector=None):
+    """Run face detection over a clip and return the face center of every frame (None when no face).
+
+    detector is a backend name (default SHORTS_FACE_DETECTOR).
+    """
+    # Heavy imports live in the stage functions so planning code can import this module cheaply
+    import cv2
+
+    print(
+        f"[Segment {segment_id}/{total_segments}] Processing face tracking...")
+
+    cap = cv2.VideoCapture(input_file)
+    if not cap.isOpened():
+        print(
+            f"[Segment {segment_id}] Error: Could not open video {input_file}")
+        return None
+
+    # Get video properties
+    width, height, fps, frame_count = video_properties(input_file, cap)
+
+    detector = open_detector(input_file, detector)
+    buffers = FrameBuffers()
+    centers = []
 
     # Process frames
     frame_number = 0
     while cap.isOpened():
-        ret, frame = cap.read()
+        ret, frame = buffers.read(cap)
         if not ret:
             break
 
@@ -74,34 +173,150 @@ def track_face_and_crop_mediapipe(input_file, output_file, aspect_ratio="9:16",
         # Status update every 5 seconds
         if frame_number % (fps * 5) == 0 or frame_number == 1:
             print(
-                f"[Segment {segment_id}] Processing frame {frame_number}/{frame_count} ({frame_number/frame_count*100:.1f}%)")
+                f"[Segment {segment_id}] Processing frame {frame_number}/{frame_count} ({frame_number/max(1, frame_count)*100:.1f}%)")
+
+        centers.append(detector.center(frame))
 
-        # Convert frame color for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    cap.release()
+    detector.close()
+    buffers.report(f"[Segment {segment_id}] Detection")
 
-        # Process with MediaPipe
-        results = face_detection.process(rgb_frame)
+    return {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'centers': centers
+    }
 
-        if results.detections:
-            # Get the most prominent face
-            detection = results.detections[0]
 
-            # Get bounding box
-            bbox = detection.location_data.relative_bounding_box
+def probe_static_face(input_file, segment_id=1, threads=None, detector=None):
+    """Sample face detections at PROBE_FPS and return static detections if the face barely moves.
 
-            # Convert relative coordinates to absolute
-            x = int(bbox.xmin * width)
-            y = int(bbox.ymin * height)
-            w = int(bbox.width * width)
-            h = int(bbox.height * height)
+    Static detections hold one face center instead of one per frame; with no face in any
+    sample the center is None and the crop stays in the middle of the frame. Returns None
+    as soon as the sampled centers spread wider than STATIC_TOLERANCE, or when only a few
+    samples found a face (fewer than STATIC_MIN_HITS or STATIC_MIN_HIT_RATE of them), so
+    the caller tracks every frame rather than cut out a subject that may move.
+    """
+    if STATIC_TOLERANCE <= 0:
+        return None
 
-            # Calculate center of face
-            face_x_center = x + w // 2
-            face_y_center = y + h // 2
+    import cv2
+    limit_threads(threads)
 
+    cap = cv2.VideoCapture(input_file)
+    if not cap.isOpened():
+        return None
+
+    width, height, fps, _ = video_properties(input_file, cap)
+    step = max(1, int(round(fps / PROBE_FPS))) if fps else 1
+    max_dx = STATIC_TOLERANCE * width
+    max_dy = STATIC_TOLERANCE * height
+
+    detector = open_detector(input_file, detector)
+    buffers = FrameBuffers()
+    xs = []
+    ys = []
+    frames = 0
+    samples = 0
+    try:
+        while True:
+            # Skipped frames are only grabbed: no color conversion and no detection
+            if frames % step:
+                if not cap.grab():
+                    break
+                frames += 1
+                continue
+
+            ret, frame = buffers.read(cap)
+            if not ret:
+                break
+            frames += 1
+            samples += 1
+            center = detector.center(frame)
+            if center is None:
+                continue
+            xs.append(center[0])
+            ys.append(center[1])
+            if max(xs) - min(xs) > max_dx or max(ys) - min(ys) > max_dy:
+                return None
+    finally:
+        cap.release()
+        detector.close()
+
+    if 0 < len(xs) < max(STATIC_MIN_HITS, STATIC_MIN_HIT_RATE * samples):
+        print(f"[Segment {segment_id}] Face found in only {len(xs)}/{samples} samples, tracking every frame")
+        return None
+
+    if xs:
+        static_center = [sorted(xs)[len(xs) // 2], sorted(ys)[len(ys) // 2]]
+        print(f"[Segment {segment_id}] Face stays put over {len(xs)}/{samples} samples, using a fixed crop")
+    else:
+        static_center = None
+        print(f"[Segment {segment_id}] No face in {samples} samples, using a fixed center crop")
+    return {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'frames': frames,
+        'static': True,
+        'static_center': static_center,
+        'centers': []
+    }
+
+
+def plan_static_crop(detections, aspect_ratio="9:16"):
+    """One crop window for the whole clip, centered on the static face (or the frame)."""
+    width = detections['width']
+    height = detections['height']
+    target_width, target_height = compute_target_dimensions(
+        width, height, aspect_ratio)
+    x_center, y_center = detections['static_center'] or (width // 2, height // 2)
+    x_start = max(0, min(x_center - target_width // 2, width - target_width))
+    y_start = max(0, min(y_center - target_height // 2, height - target_height))
+
+    # A one-entry plan also works for per-frame renderers: later frames keep the last position
+    return {
+        'width': width,
+        'height': height,
+        'fps': detections['fps'],
+        'target_width': target_width,
+        'target_height': target_height,
+        'static': True,
+        'frames': detections['frames'],
+        'x': [x_start],
+        'y': [y_start]
+    }
+
+
+def plan_crop(detections, aspect_ratio="9:16"):
+    """Turn per-frame face centers into smoothed crop positions for an aspect ratio."""
+    if detections.get('static'):
+        return plan_static_crop(detections, aspect_ratio)
+
+    width = detections['width']
+    height = detections['height']
+    target_width, target_height = compute_target_dimensions(
+        width, height, aspect_ratio)
+
+    # Initialize smooth tracking with a longer history window for even smoother movement
+    history_size = 60  # Increased history for ultra-smooth motion
+    position_history_x = collections.deque(maxlen=history_size)
+    position_history_y = collections.deque(maxlen=history_size)
+
+    # Fill position history with initial center
+    for _ in range(history_size):
+        position_history_x.append(width // 2)
+        position_history_y.append(height // 2)
+
+    crop_x = []
+    crop_y = []
+
+    for center in detections['centers']:
+        if center is not None:
             # Add to position history
-            position_history_x.append(face_x_center)
-            position_history_y.append(face_y_center)
+            position_history_x.append(center[0])
+            position_history_y.append(center[1])
 
         # Calculate smooth position using exponential moving average
         alpha = 0.05  # Low alpha for ultra-smooth movement
@@ -122,47 +337,616 @@ def track_face_and_crop_mediapipe(input_file, output_file, aspect_ratio="9:16",
         y_start = max(0, min(y_center - target_height //
                       2, height - target_height))
 
-        # Crop the frame
+        crop_x.append(x_start)
+        crop_y.append(y_start)
+
+    return {
+        'width': width,
+        'height': height,
+        'fps': detections['fps'],
+        'target_width': target_width,
+        'target_height': target_height,
+        'x': crop_x,
+        'y': crop_y
+    }
+
+
+def detect_crop_plan(input_file, aspect_ratio="9:16", segment_id=1, total_segments=1):
+    """Run face detection over a clip and return the smoothed per-frame crop positions."""
+    detections = probe_static_face(input_file, segment_id)
+    if detections is None:
+        detections = detect_faces(input_file, segment_id, total_segments)
+    if detections is None:
+        return None
+    return plan_crop(detections, aspect_ratio)
+
+
+def save_json(data, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return path
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def detect_and_save_faces(input_file, detections_file, segment_id=1, total_segments=1, threads=None,
+                          detector=None):
+    """Detection stage entry point for stage processes: detect and write the detections to disk."""
+    limit_threads(threads)
+    detections = probe_static_face(input_file, segment_id, threads, detector)
+    if detections is None:
+        detections = detect_faces(input_file, segment_id, total_segments, detector)
+    if detections is None:
+        return False
+    save_json(detections, detections_file)
+    return True
+
+
+def crop_frame(frame, plan, index, segment_id=1):
+    """Cut the planned crop window out of frame number index of a segment."""
+    width = plan['width']
+    height = plan['height']
+    target_width = plan['target_width']
+    target_height = plan['target_height']
+
+    # Frames beyond the plan keep the last planned position
+    index = min(index, len(plan['x']) - 1)
+    x_start = plan['x'][index] if index >= 0 else (width - target_width) // 2
+    y_start = plan['y'][index] if index >= 0 else (height - target_height) // 2
+
+    cropped_frame = frame[y_start:y_start + target_height, x_start:x_start + target_width]
+    if cropped_frame.shape[:2] != (target_height, target_width):
+        # Raw video needs every frame at full size: fall back to center crop
+        print(f"[Segment {segment_id}] Error cropping frame {index + 1}, using center crop")
+        x_start = (width - target_width) // 2
+        y_start = (height - target_height) // 2
+        cropped_frame = frame[y_start:y_start + target_height, x_start:x_start + target_width]
+    return cropped_frame
+
+
+class CropEncoder:
+    """libx264 encode of raw cropped frames, fed through a FIFO and muxed with the source audio.
+
+    The encoder runs in a background thread; write() blocks when it falls behind.
+    audio_range=(start, duration) takes the audio from that part of audio_input; without
+    audio_input the output is video only (a shard to be concatenated later). A draft
+    encoder scales down to DRAFT_HEIGHT and uses the fastest preset.
+    """
+
+    def __init__(self, workspace, audio_input, output_file, plan, segment_id=1, threads=None,
+                 timeout=None, audio_range=None, frames=None, label=None, draft=False):
+        self.segment_id = segment_id
+        self.label = label or f"[Segment {segment_id}] crop encode"
+        self.fifo = workspace.fifo(f"frames_{segment_id}_{os.path.basename(output_file)}.bgr")
+        self.pipe = None
+        self.broken = False
+        self.error = None
+        self.buffer = None
+        self.allocations = 0
+
+        audio_args = []
+        if audio_range:
+            audio_args = ['-ss', str(audio_range[0]), '-t', str(audio_range[1])]
+        if audio_input:
+            audio_args += ['-i', audio_input]
+            map_args = ['-map', '0:v:0', '-map', '1:a:0', '-shortest']
+        else:
+            map_args = ['-map', '0:v:0', '-an']
+        self.cmd = [
+            'ffmpeg', '-y',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f"{plan['target_width']}x{plan['target_height']}",
+            '-r', str(plan['fps']),
+            '-i', self.fifo,
+            *audio_args,
+            *(['-vf', draft_scale()] if draft else []),
+            *encode_args(draft),
+            '-vsync', 'cfr',       # Constant frame rate
+            '-pix_fmt', 'yuv420p',  # Standard pixel format for compatibility
+            *map_args,
+        ]
+        if threads:
+            self.cmd += ['-threads', str(threads)]
+        self.cmd.append(output_file)
+
+        frames = plan.get('frames', len(plan['x'])) if frames is None else frames
+        duration = frames / plan['fps'] if plan['fps'] else None
+        self.thread = threading.Thread(
+            target=self._encode, args=(duration, timeout), daemon=True)
+        self.thread.start()
+
+    def _encode(self, duration, timeout):
         try:
-            cropped_frame = frame[y_start:y_start +
-                                  target_height, x_start:x_start + target_width]
-            out.write(cropped_frame)
+            run_ffmpeg_sync(self.cmd, duration=duration, timeout=timeout, label=self.label)
         except Exception as e:
-            print(f"[Segment {segment_id}] Error cropping frame: {e}")
-            # Fallback to center crop
-            x_start = (width - target_width) // 2
-            y_start = (height - target_height) // 2
-            cropped_frame = frame[y_start:y_start +
-                                  target_height, x_start:x_start + target_width]
-            out.write(cropped_frame)
-
-    # Release OpenCV resources
-    cap.release()
-    out.release()
-    face_detection.close()
+            self.error = e
 
-    # Now combine the video with the original audio using ffmpeg
-    print(
-        f"[Segment {segment_id}] Merging tracked video with original audio...")
+    def write(self, frame):
+        """Send one cropped frame. Crop slices are copied once, into a reused contiguous buffer."""
+        if self.broken:
+            return
+        if not frame.flags['C_CONTIGUOUS']:
+            import numpy as np
+            if self.buffer is None or self.buffer.shape != frame.shape:
+                self.buffer = np.empty(frame.shape, frame.dtype)
+                self.allocations += 1
+            np.copyto(self.buffer, frame)
+            frame = self.buffer
+        try:
+            if self.pipe is None:
+                self.pipe = open_fifo_writer(self.fifo, self.thread.is_alive)
+            self.pipe.write(frame.data.cast('B'))
+        except BrokenPipeError:
+            self.broken = True  # The encoder exited early; its error is raised by close()
+
+    def finish_input(self):
+        """Signal end of video, leaving the encoder to finish in the background."""
+        try:
+            if self.pipe is None and not self.broken:
+                # Open once so an encoder that got no frames sees end of file
+                self.pipe = open_fifo_writer(self.fifo, self.thread.is_alive)
+            if self.pipe is not None:
+                self.pipe.close()
+        except BrokenPipeError:
+            pass
+        self.broken = True
+
+    def close(self):
+        """Finish the encode and raise its error, if any."""
+        self.finish_input()
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+
+def render_static_crop(input_file, plan, output_file, segment_id=1, threads=None, timeout=None, draft=False):
+    """Render a static plan with one ffmpeg crop filter, without a Python frame loop."""
+    crop = f"crop={plan['target_width']}:{plan['target_height']}:{plan['x'][0]}:{plan['y'][0]}"
+    if draft:
+        crop += f",{draft_scale()}"
     cmd = [
         'ffmpeg', '-y',
-        '-i', temp_video,
         '-i', input_file,
-        '-c:v', 'libx264',     # Use libx264 for better quality
-        '-preset', 'medium',   # Balance between quality and speed
-        '-crf', '18',          # High quality (lower is better)
-        '-vsync', 'cfr',       # Constant frame rate
-        '-pix_fmt', 'yuv420p',  # Standard pixel format for compatibility
+        '-vf', crop,
+        *encode_args(draft),   # Same encoder settings as the tracked render
+        '-vsync', 'cfr',
+        '-pix_fmt', 'yuv420p',
+        '-map', '0:v:0',
+        '-map', '0:a:0',
+    ]
+    if threads:
+        cmd += ['-threads', str(threads)]
+    cmd.append(output_file)
+
+    print(f"[Segment {segment_id}] Encoding fixed crop with original audio...")
+    run_ffmpeg_sync(cmd, duration=plan['frames'] / plan['fps'] if plan['fps'] else None,
+                    timeout=timeout, label=f"[Segment {segment_id}] static crop encode")
+    print(f"[Segment {segment_id}] Face tracking with audio completed")
+    return True
+
+
+def render_crop_plan(input_file, plan, output_file, segment_id=1, threads=None, timeout=None, draft=False):
+    """Crop every frame at its planned position and mux the result with the original audio.
+
+    draft renders a small, fast preview from the same plan (see DRAFT_HEIGHT).
+    """
+    if plan.get('static'):
+        return render_static_crop(input_file, plan, output_file, segment_id, threads, timeout, draft)
+
+    import cv2
+    limit_threads(threads)
+
+    cap = cv2.VideoCapture(input_file)
+    if not cap.isOpened():
+        print(
+            f"[Segment {segment_id}] Error: Could not open video {input_file}")
+        return False
+
+    # Stream raw cropped frames to the encoder through a FIFO instead of writing
+    # an intermediate mp4v file and decoding it again for the mux
+    workspace = Workspace(f"render{segment_id}")
+    try:
+        print(
+            f"[Segment {segment_id}] Encoding tracked video with original audio...")
+        encoder = CropEncoder(workspace, input_file, output_file, plan, segment_id, threads, timeout,
+                              draft=draft)
+        buffers = FrameBuffers()
+        try:
+            frame_number = 0
+            while cap.isOpened():
+                ret, frame = buffers.read(cap)
+                if not ret:
+                    break
+                encoder.write(crop_frame(frame, plan, frame_number, segment_id))
+                frame_number += 1
+        finally:
+            # Release OpenCV resources
+            cap.release()
+            encoder.finish_input()
+        encoder.close()
+        buffers.allocations += encoder.allocations
+        buffers.report(f"[Segment {segment_id}] Render")
+    finally:
+        workspace.cleanup()
+
+    print(f"[Segment {segment_id}] Face tracking with audio completed")
+    return True
+
+
+def frame_range(start_time, end_time, fps):
+    """First frame and end frame (exclusive) of a time range."""
+    return int(round(start_time * fps)), max(int(round(start_time * fps)) + 1, int(round(end_time * fps)))
+
+
+def seek_frame(cap, index, fps):
+    """Grab the frame at index (timestamp index / fps); read it next with retrieve().
+
+    CAP_PROP_POS_FRAMES seeks are estimated from timestamps and land a few frames off on
+    variable frame rate streams, which shifts the pixels against a crop plan and makes
+    shards overlap or leave gaps. This seeks by time to SEEK_PREROLL before the frame and
+    grabs forward until the decoder's timestamp (CAP_PROP_POS_MSEC) reaches it, seeking
+    further back when the seek overshot. Returns False at the end of the video.
+    """
+    import cv2
+    target = index / fps * 1000
+    half_frame = 500 / fps
+    preroll = SEEK_PREROLL * 1000
+    for _ in range(3):
+        start = max(0.0, target - preroll)
+        cap.set(cv2.CAP_PROP_POS_MSEC, start)
+        if not cap.grab():
+            return False
+        if cap.get(cv2.CAP_PROP_POS_MSEC) <= target + half_frame or start == 0:
+            break
+        preroll *= 4
+    while cap.get(cv2.CAP_PROP_POS_MSEC) < target - half_frame:
+        if not cap.grab():
+            return False
+    return True
+
+
+def decode_ranges(cap, ranges, buffers=None, fps=None):
+    """Decode the union of several frame ranges of one video, once and in order.
+
+    ranges is {key: (first_frame, end_frame)}. Yields (frame_index, frame, keys of the
+    ranges containing that frame), so overlapping ranges share each decoded frame.
+    Gaps shorter than SEEK_GAP_FRAMES are skipped with grab(), longer ones by seeking
+    (frame-accurately with seek_frame when fps is given). Frames are decoded into the
+    reused buffer of buffers (a FrameBuffers), so each one is only valid until the next
+    is yielded.
+    """
+    import cv2
+    buffers = buffers or FrameBuffers()
+
+    order = sorted(ranges.items(), key=lambda item: item[1])
+    next_range = 0
+    active = {}
+    position = None
+    grabbed = False
+
+    while True:
+        if not active:
+            if next_range == len(order):
+                return
+            first = order[next_range][1][0]
+            if (position is None and first > 0) or (position is not None and (
+                    first < position or first - position > SEEK_GAP_FRAMES)):
+                if fps:
+                    if not seek_frame(cap, first, fps):
+                        return
+                    grabbed = True
+                else:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+                position = first
+            position = position or 0
+            while position < first:
+                if not cap.grab():
+                    return
+                position += 1
+
+        # Ranges starting at this frame join the ones already running
+        while next_range < len(order) and order[next_range][1][0] <= position:
+            key, (_, end) = order[next_range]
+            active[key] = end
+            next_range += 1
+
+        ret, frame = buffers.retrieve(cap) if grabbed else buffers.read(cap)
+        grabbed = False
+        if not ret:
+            return
+        yield position, frame, list(active)
+
+        position += 1
+        active = {key: end for key, end in active.items() if end > position}
+
+
+def detect_faces_shared(source, ranges, threads=None, detector=None):
+    """Face detections for several segments of one source from a single decode.
+
+    ranges is {segment_id: (start_time, end_time)}. Returns {segment_id: detections} in
+    the format of detect_faces; frames in overlapping segments are detected once.
+    """
+    import cv2
+    limit_threads(threads)
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"Error: Could not open video {source}")
+        return None
+
+    width, height, fps, _ = video_properties(source, cap)
+    frame_ranges = {segment_id: frame_range(start, end, fps)
+                    for segment_id, (start, end) in ranges.items()}
+    total_frames = sum(end - first for first, end in frame_ranges.values())
+    print(f"Detecting faces in {len(ranges)} ranges of {source} in one pass...")
+
+    detector = open_detector(source, detector)
+    buffers = FrameBuffers()
+    centers = {segment_id: [] for segment_id in ranges}
+    decoded = 0
+    try:
+        for _, frame, segment_ids in decode_ranges(cap, frame_ranges, buffers, fps):
+            decoded += 1
+            if decoded % int(fps * 5 or 150) == 0:
+                print(f"Detection: frame {decoded} ({len(segment_ids)} ranges on it)")
+            center = detector.center(frame)
+            for segment_id in segment_ids:
+                centers[segment_id].append(center)
+    finally:
+        cap.release()
+        detector.close()
+
+    print(f"Detection decoded {decoded} frames for {total_frames} range frames")
+    buffers.report("Detection")
+    return {segment_id: {'width': width, 'height': height, 'fps': fps, 'centers': segment_centers}
+            for segment_id, segment_centers in centers.items()}
+
+
+def render_crop_plans_shared(source, jobs, threads=None, timeout=None, draft=False):
+    """Render several segments of one source from a single decode, one encoder per segment.
+
+    jobs is {segment_id: (start_time, end_time, plan, output_file)}. Encoders start when
+    their segment's first frame is decoded and get end of file after its last one, so
+    only overlapping segments encode at the same time. Returns {segment_id: success}.
+    """
+    import cv2
+    limit_threads(threads)
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"Error: Could not open video {source}")
+        return {segment_id: False for segment_id in jobs}
+
+    fps = video_properties(source, cap)[2]
+    frame_ranges = {segment_id: frame_range(start, end, fps)
+                    for segment_id, (start, end, _, _) in jobs.items()}
+    print(f"Rendering {len(jobs)} segments in one pass over {source}...")
+
+    workspace = Workspace("render_shared")
+    buffers = FrameBuffers()
+    encoders = {}
+    results = {}
+    try:
+        try:
+            for index, frame, segment_ids in decode_ranges(cap, frame_ranges, buffers, fps):
+                for segment_id in segment_ids:
+                    encoder = encoders.get(segment_id)
+                    if encoder is None:
+                        start, end, plan, output_file = jobs[segment_id]
+                        encoder = encoders[segment_id] = CropEncoder(
+                            workspace, source, output_file, plan, segment_id, threads, timeout,
+                            audio_range=(start, end - start), draft=draft)
+                    encoder.write(crop_frame(
+                        frame, jobs[segment_id][2], index - frame_ranges[segment_id][0], segment_id))
+
+                # Segments that ended on the previous frame can finish encoding
+                for segment_id, encoder in encoders.items():
+                    if segment_id not in segment_ids and not encoder.broken:
+                        encoder.finish_input()
+        finally:
+            cap.release()
+            for encoder in encoders.values():
+                encoder.finish_input()
+
+        for segment_id in jobs:
+            encoder = encoders.get(segment_id)
+            if encoder is None:
+                print(f"[Segment {segment_id}] Error: no frames decoded")
+                results[segment_id] = False
+                continue
+            try:
+                encoder.close()
+                print(f"[Segment {segment_id}] Face tracking with audio completed")
+                results[segment_id] = True
+            except Exception as e:
+                print(f"[Segment {segment_id}] Error encoding tracked video: {e}")
+                results[segment_id] = False
+        buffers.allocations += sum(encoder.allocations for encoder in encoders.values())
+        buffers.report("Shared render")
+    finally:
+        for encoder in encoders.values():
+            encoder.thread.join()
+        workspace.cleanup()
+    return results
+
+
+def render_saved_crop_plan(input_file, plan_file, output_file, segment_id=1, threads=None, timeout=None,
+                           draft=False):
+    """Render stage entry point for stage processes."""
+    return render_crop_plan(input_file, load_json(plan_file), output_file, segment_id, threads, timeout, draft)
+
+
+def detect_and_save_faces_shared(source, jobs, threads=None, detector=None):
+    """Shared detection stage entry point. jobs is {segment_id: (start_time, end_time, detections_file)}.
+
+    Returns {segment_id: success}.
+    """
+    detections = detect_faces_shared(
+        source, {segment_id: (start, end) for segment_id, (start, end, _) in jobs.items()}, threads, detector)
+    if detections is None:
+        return {segment_id: False for segment_id in jobs}
+    for segment_id, (_, _, detections_file) in jobs.items():
+        save_json(detections[segment_id], detections_file)
+    return {segment_id: bool(detections[segment_id]['centers']) for segment_id in jobs}
+
+
+def render_saved_crop_plans_shared(source, jobs, threads=None, timeout=None, draft=False):
+    """Shared render stage entry point. jobs is {segment_id: (start_time, end_time, plan_file, output_file)}."""
+    return render_crop_plans_shared(
+        source, {segment_id: (start, end, load_json(plan_file), output_file)
+                 for segment_id, (start, end, plan_file, output_file) in jobs.items()},
+        threads, timeout, draft)
+
+
+def shard_count(duration, max_shards):
+    """Number of time shards for a clip: one per SHARD_SECONDS, at most max_shards."""
+    if SHARD_SECONDS <= 0:
+        return 1
+    return max(1, min(int(max_shards), math.ceil(duration / SHARD_SECONDS)))
+
+
+def shard_times(duration, shards):
+    """Split a clip into back-to-back (start, end) time ranges.
+
+    The last range runs past the nominal duration so it reaches the real last frame.
+    """
+    bounds = [duration * i / shards for i in range(shards)] + [duration + 10]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def detect_faces_shard(input_file, start_time, end_time, threads=None, detector=None):
+    """Detection stage entry point for one time shard of a clip. Returns its detections.
+
+    Shards of one clip must get the same resolved detector name, not "auto".
+    """
+    detections = detect_faces_shared(input_file, {0: (start_time, end_time)}, threads, detector)
+    return detections[0] if detections else None
+
+
+def merge_detections(parts):
+    """Stitch the detections of consecutive shards back into one clip's detections."""
+    if not parts or any(part is None for part in parts):
+        return None
+    merged = dict(parts[0])
+    merged['centers'] = [center for part in parts for center in part['centers']]
+    return merged
+
+
+def render_crop_shard(input_file, plan, start_time, end_time, output_file, segment_id=1,
+                      threads=None, timeout=None):
+    """Encode the cropped frames of one time shard of a clip, video only.
+
+    Shards use identical encoder settings so concat_shards() can join them by stream copy.
+    """
+    import cv2
+    limit_threads(threads)
+
+    cap = cv2.VideoCapture(input_file)
+    if not cap.isOpened():
+        print(
+            f"[Segment {segment_id}] Error: Could not open video {input_file}")
+        return False
+
+    first, end = frame_range(start_time, end_time, plan['fps'])
+    workspace = Workspace(f"shard{segment_id}")
+    try:
+        encoder = CropEncoder(workspace, None, output_file, plan, segment_id, threads, timeout,
+                              frames=min(end, len(plan['x'])) - first,
+                              label=f"[Segment {segment_id}] crop encode {start_time:.0f}s+")
+        buffers = FrameBuffers()
+        try:
+            # Crop positions come from the plan of the whole clip, so shards join seamlessly
+            for index, frame, _ in decode_ranges(cap, {0: (first, end)}, buffers, plan['fps']):
+                encoder.write(crop_frame(frame, plan, index, segment_id))
+        finally:
+            cap.release()
+            encoder.finish_input()
+        encoder.close()
+        buffers.allocations += encoder.allocations
+        buffers.report(f"[Segment {segment_id}] Render shard {start_time:.0f}s+")
+    finally:
+        workspace.cleanup()
+    return True
+
+
+def render_saved_crop_shard(input_file, plan_file, start_time, end_time, output_file, segment_id=1,
+                            threads=None, timeout=None):
+    """Render shard entry point for stage processes."""
+    return render_crop_shard(input_file, load_json(plan_file), start_time, end_time, output_file,
+                             segment_id, threads, timeout)
+
+
+def concat_shards_cmd(list_file, shard_files, audio_input, output_file):
+    """Write the concat list and return the ffmpeg command joining the shards with the clip's audio."""
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for shard_file in shard_files:
+            escaped = os.path.abspath(shard_file).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return [
+        'ffmpeg', '-y',
+        '-f', 'concat', '-safe', '0', '-i', list_file,
+        '-i', audio_input,
         '-map', '0:v:0',
         '-map', '1:a:0',
+        '-c:v', 'copy',        # Shards share one encoder profile: no re-encode
         '-shortest',
         output_file
     ]
-    subprocess.run(cmd, check=True)
 
-    # Clean up temp file
-    if os.path.exists(temp_video):
-        os.remove(temp_video)
 
-    print(f"[Segment {segment_id}] Face tracking with audio completed")
-    return True
+def track_face_and_crop_sharded(input_file, output_file, aspect_ratio, duration, shards, segment_id=1,
+                                threads=None):
+    """track_face_and_crop_mediapipe with detection and rendering split over parallel processes."""
+    from concurrent.futures import ProcessPoolExecutor
+    from process_runner import get_stage_context
+
+    # Resolved here so every shard process uses the same backend
+    detector = resolve_backend(input_file)
+    static = probe_static_face(input_file, segment_id, threads, detector)
+    if static is not None:
+        return render_crop_plan(input_file, plan_crop(static, aspect_ratio), output_file, segment_id, threads)
+
+    ranges = shard_times(duration, shards)
+    print(f"[Segment {segment_id}] Tracking in {shards} shards of {duration / shards:.0f}s")
+    workspace = Workspace(f"track{segment_id}")
+    try:
+        with ProcessPoolExecutor(shards, mp_context=get_stage_context()) as pool:
+            detections = merge_detections(list(pool.map(
+                detect_faces_shard, *zip(*[(input_file, start, end, 1, detector) for start, end in ranges]))))
+            if detections is None:
+                return False
+            plan = plan_crop(detections, aspect_ratio)
+
+            shard_files = [workspace.path(f"shard_{i}.mp4") for i in range(shards)]
+            rendered = pool.map(render_crop_shard, *zip(*[
+                (input_file, plan, start, end, shard_file, segment_id, threads)
+                for (start, end), shard_file in zip(ranges, shard_files)]))
+            if not all(rendered):
+                return False
+
+        cmd = concat_shards_cmd(workspace.path("shards.txt"), shard_files, input_file, output_file)
+        run_ffmpeg_sync(cmd, duration=duration, label=f"[Segment {segment_id}] shard concat")
+        return True
+    finally:
+        workspace.cleanup()
+
+
+def track_face_and_crop_mediapipe(input_file, output_file, aspect_ratio="9:16", segment_id=1, total_segments=1, threads=None,
+                                  duration=None, max_shards=1):
+    """Track faces using MediaPipe with improved smoothing for stable tracking
+
+    Given the clip duration and max_shards > 1, long clips are tracked in parallel time shards.
+    """
+    shards = shard_count(duration, max_shards) if duration else 1
+    if shards > 1:
+        return track_face_and_crop_sharded(
+            input_file, output_file, aspect_ratio, duration, shards, segment_id, threads)
+    plan = detect_crop_plan(input_file, aspect_ratio,
+                            segment_id, total_segments)
+    if plan is None:
+        return False
+    return render_crop_plan(input_file, plan, output_file, segment_id, threads)
@@ -0,0 +1,321 @@
+import asyncio
+import collections
+import itertools
+import os
+import subprocess
+import threading
+import time
+from process_runner import kill_process_tree, kill_process_tree_sync
+from tracing import span
+
+# Seconds between live progress lines per encode (0 turns them off)
+PROGRESS_INTERVAL = float(os.getenv("FFMPEG_PROGRESS_INTERVAL", "5"))
+
+# Encodes slower than this multiple of real time are flagged in progress lines
+SLOW_SPEED = 1.0
+
+
+def with_progress(cmd):
+    """Insert the global options that make ffmpeg write key=value progress to stdout."""
+    return [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+
+
+def _number(value, suffix=''):
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None  # "N/A" before the first frame
+
+
+class ProgressParser:
+    """Turn ffmpeg -progress output into one snapshot per progress block."""
+
+    def __init__(self, duration=None):
+        self.duration = duration
+        self.fields = {}
+        self.last = None
+
+    def feed(self, line):
+        """Consume one line; returns a snapshot dict when a block ends, else None."""
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return None
+        self.fields[key] = value
+        if key != 'progress':
+            return None
+        self.last = self.snapshot(done=value == 'end')
+        return self.last
+
+    def snapshot(self, done=False):
+        fields = self.fields
+        # out_time_ms is in microseconds as well (a long-standing ffmpeg quirk)
+        out_time_us = _number(fields.get('out_time_us', fields.get('out_time_ms', 'N/A')))
+        out_time = out_time_us / 1e6 if out_time_us is not None else None
+        speed = _number(fields.get('speed', 'N/A'), 'x')
+
+        progress = eta = None
+        if self.duration and out_time is not None:
+            progress = min(1.0, max(0.0, out_time / self.duration))
+            if speed:
+                eta = max(0.0, (self.duration - out_time) / speed)
+
+        return {
+            'frame': int(_number(fields.get('frame', '0')) or 0),
+            'fps': _number(fields.get('fps', 'N/A')),
+            'bitrate_kbps': _number(fields.get('bitrate', 'N/A'), 'kbits/s'),
+            'size_bytes': int(_number(fields.get('total_size', '0')) or 0),
+            'out_time': out_time,
+            'speed': speed,
+            'progress': progress,
+            'eta': eta,
+            'done': done,
+        }
+
+
+class EncodeMonitor:
+    """Latest progress of every ffmpeg encode in this process, and stats of finished ones.
+
+    Encodes running in stage processes are included too: the stage forwards its
+    events through relay and the parent replays them with apply_remote.
+    """
+
+    def __init__(self):
+        self.active = {}
+        self.finished = collections.deque(maxlen=1000)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._last_summary = 0.0
+        # Called with ('start' | 'update' | 'finish', encode_id, payload) when set
+        self.relay = None
+
+    def _forward(self, event):
+        if self.relay:
+            self.relay(event)
+
+    def start(self, label):
+        encode_id = next(self._ids)
+        with self._lock:
+            self.active[encode_id] = {'label': label, 'started': time.time(),
+                                      'snapshot': None, 'reported': 0.0}
+        self._forward(('start', encode_id, label))
+        return encode_id
+
+    def update(self, encode_id, snapshot):
+        self._forward(('update', encode_id, snapshot))
+        with self._lock:
+            encode = self.active[encode_id]
+            encode['snapshot'] = snapshot
+            now = time.time()
+            report = PROGRESS_INTERVAL > 0 and now - encode['reported'] >= PROGRESS_INTERVAL
+            if report:
+                encode['reported'] = now
+            summary = (report and len(self.active) > 1
+                       and now - self._last_summary >= PROGRESS_INTERVAL)
+            if summary:
+                self._last_summary = now
+
+        if report:
+            print(f"{encode['label']}: {format_snapshot(snapshot)}")
+        if summary:
+            totals = self.aggregate()
+            print(f"[encoders] {totals['active']} running, {totals['fps']:.0f} fps total, "
+                  f"slowest {totals['slowest']} at {totals['min_speed'] or 0:.2f}x")
+
+    def finish(self, encode_id, parser):
+        """Close an encode and return its final stats."""
+        with self._lock:
+            encode = self.active.pop(encode_id)
+        elapsed = time.time() - encode['started']
+        last = parser.last or parser.snapshot()
+        stats = {
+            'label': encode['label'],
+            'elapsed': elapsed,
+            'frames': last['frame'],
+            'avg_fps': last['frame'] / elapsed if elapsed > 0 else None,
+            'out_time': last['out_time'],
+            'speed': last['out_time'] / elapsed if last['out_time'] and elapsed > 0 else None,
+            'bitrate_kbps': last['bitrate_kbps'],
+            'size_bytes': last['size_bytes'],
+        }
+        self.finished.append(stats)
+        self._forward(('finish', encode_id, stats))
+        return stats
+
+    def apply_remote(self, event, ids):
+        """Replay an encode event relayed by a stage process.
+
+        ids maps the stage's encode ids to ids in this monitor and is kept by the
+        caller for the life of the stage. Progress lines are left to the stage.
+        """
+        kind, remote_id, payload = event
+        with self._lock:
+            if kind == 'start':
+                ids[remote_id] = next(self._ids)
+                self.active[ids[remote_id]] = {'label': payload, 'started': time.time(),
+                                               'snapshot': None, 'reported': 0.0}
+            elif kind == 'update' and ids.get(remote_id) in self.active:
+                self.active[ids[remote_id]]['snapshot'] = payload
+            elif kind == 'finish':
+                self.active.pop(ids.pop(remote_id, None), None)
+                self.finished.append(payload)
+
+    def drop_remote(self, ids):
+        """Forget the encodes of a stage that ended without finishing them."""
+        with self._lock:
+            for encode_id in ids.values():
+                self.active.pop(encode_id, None)
+        ids.clear()
+
+    def aggregate(self):
+        """Combined throughput of the encodes running right now."""
+        with self._lock:
+            encodes = [(encode['label'], encode['snapshot'])
+                       for encode in self.active.values() if encode['snapshot']]
+        speeds = [(snapshot['speed'], label) for label, snapshot in encodes if snapshot['speed']]
+        min_speed, slowest = min(speeds) if speeds else (None, None)
+        return {
+            'active': len(self.active),
+            'fps': sum(snapshot['fps'] or 0 for _, snapshot in encodes),
+            'bitrate_kbps': sum(snapshot['bitrate_kbps'] or 0 for _, snapshot in encodes),
+            'min_speed': min_speed,
+            'slowest': slowest,
+        }
+
+
+monitor = EncodeMonitor()
+
+
+def format_snapshot(snapshot):
+    parts = []
+    if snapshot['progress'] is not None:
+        parts.append(f"{snapshot['progress'] * 100:.0f}%")
+    if snapshot['fps'] is not None:
+        parts.append(f"{snapshot['fps']:.0f} fps")
+    if snapshot['speed'] is not None:
+        parts.append(f"{snapshot['speed']:.2f}x" +
+                     (" (slow)" if snapshot['speed'] < SLOW_SPEED else ""))
+    if snapshot['bitrate_kbps'] is not None:
+        parts.append(f"{snapshot['bitrate_kbps']:.0f} kbit/s")
+    if snapshot['eta'] is not None:
+        parts.append(f"eta {snapshot['eta']:.0f}s")
+    return ', '.join(parts) or 'starting'
+
+
+def format_stats(stats):
+    text = f"encoded {stats['out_time'] or 0:.1f}s in {stats['elapsed']:.1f}s"
+    if stats['speed']:
+        text += f" ({stats['speed']:.2f}x"
+        if stats['avg_fps']:
+            text += f", {stats['avg_fps']:.0f} fps avg"
+        text += ")"
+    return text
+
+
+async def run_ffmpeg(cmd, duration=None, timeout=None, label=None, trace_attrs=None):
+    """Run an ffmpeg command without blocking the event loop, reporting live progress.
+
+    duration is the expected output length in seconds, used for percent and ETA.
+    Returns the final encode stats. Raises subprocess.TimeoutExpired and
+    subprocess.CalledProcessError like process_runner.run_command.
+    """
+    label = label or 'ffmpeg'
+    parser = ProgressParser(duration)
+
+    with span(label, cat='encode', duration=duration, **(trace_attrs or {})) as attrs:
+        proc = await asyncio.create_subprocess_exec(
+            *with_progress(cmd),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True)
+        encode_id = monitor.start(label)
+        # Drain stderr alongside stdout so a chatty encoder never blocks on a full pipe
+        stderr_task = asyncio.ensure_future(proc.stderr.read())
+
+        async def read_progress():
+            async for raw_line in proc.stdout:
+                snapshot = parser.feed(raw_line.decode(errors='replace'))
+                if snapshot:
+                    monitor.update(encode_id, snapshot)
+            await proc.wait()
+
+        try:
+            await asyncio.wait_for(read_progress(), timeout)
+        except asyncio.TimeoutError:
+            print(f"{label} timed out after {timeout:.0f}s, killing it")
+            stderr_task.cancel()
+            await kill_process_tree(proc)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            stderr_task.cancel()
+            await kill_process_tree(proc)
+            raise
+        finally:
+            stats = monitor.finish(encode_id, parser)
+            attrs.update(stats)
+
+        stderr = (await stderr_task).decode(errors='replace')
+        attrs['returncode'] = proc.returncode
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, None, stderr)
+    print(f"{label}: {format_stats(stats)}")
+    return stats
+
+
+def run_ffmpeg_sync(cmd, duration=None, timeout=None, label=None):
+    """Blocking run_ffmpeg for code already running in a worker process."""
+    label = label or 'ffmpeg'
+    parser = ProgressParser(duration)
+
+    with span(label, cat='encode', duration=duration) as attrs:
+        proc = subprocess.Popen(
+            with_progress(cmd),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors='replace',
+            start_new_session=True)
+        encode_id = monitor.start(label)
+
+        stderr_chunks = []
+        stderr_thread = threading.Thread(
+            target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+        stderr_thread.start()
+
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            kill_process_tree_sync(proc)
+
+        timer = threading.Timer(timeout, on_timeout) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            for line in proc.stdout:
+                snapshot = parser.feed(line)
+                if snapshot:
+                    monitor.update(encode_id, snapshot)
+            proc.wait()
+        finally:
+            if timer:
+                timer.cancel()
+            kill_process_tree_sync(proc)
+            stderr_thread.join()
+            stats = monitor.finish(encode_id, parser)
+            attrs.update(stats)
+        attrs['returncode'] = proc.returncode
+
+    if timed_out.is_set():
+        print(f"{label} timed out after {timeout:.0f}s, killed it")
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(
+            proc.returncode, cmd, None, ''.join(stderr_chunks))
+    print(f"{label}: {format_stats(stats)}")
+    return stats
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import random
+import weakref
+from dotenv import load_dotenv
+from tracing import span
+
+load_dotenv()
+
+# Point LLM_BASE_URL at a local stand-in server for offline runs
+DEFAULT_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.kluster.ai/v1")
+DEFAULT_API_KEY = os.getenv("my_klusterai_api_key", "not-set")
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+def retryable_errors():
+    """OpenAI errors worth retrying. openai and httpx are imported on first use, not at import time."""
+    import openai
+    return (
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+class LLMError(Exception):
+    """Raised when an LLM request fails permanently or runs out of retries."""
+
+    def __init__(self, message, attempts=0, cause=None):
+        super().__init__(message)
+        self.attempts = attempts
+        self.cause = cause
+
+
+# One pooled client and limiter per event loop, since httpx connections are loop-bound
+_clients = weakref.WeakKeyDictionary()
+_limiters = weakref.WeakKeyDictionary()
+
+
+def get_client(base_url=None, api_key=None):
+    """Return the shared pooled async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    base_url = base_url or DEFAULT_BASE_URL
+    clients = _clients.setdefault(loop, {})
+
+    if base_url not in clients:
+        import httpx
+        import openai
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONCURRENCY * 2,
+                max_keepalive_connections=MAX_CONCURRENCY),
+            timeout=DEFAULT_TIMEOUT)
+        clients[base_url] = openai.AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key or DEFAULT_API_KEY,
+            max_retries=0,  # Retries are handled here with backoff
+            timeout=DEFAULT_TIMEOUT,
+            http_client=http_client)
+
+    return clients[base_url]
+
+
+def get_limiter():
+    """Return the concurrency limiter for the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _limiters:
+        _limiters[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _limiters[loop]
+
+
+async def close_clients():
+    """Close the pooled clients of the running event loop."""
+    loop = asyncio.get_running_loop()
+    for client in _clients.pop(loop, {}).values():
+        await client.close()
+
+
+def _backoff_delay(attempt, error):
+    """Exponential backoff with jitter, honouring Retry-After when the server sends it."""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        retry_after = response.headers.get('retry-after')
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+
+    delay = min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+    return delay * (0.5 + random.random() / 2)
+
+
+async def chat_completion(messages, model, timeout=None, retries=MAX_RETRIES, base_url=None, **kwargs):
+    """Send a chat completion through the shared client and return the message content."""
+    import openai
+    client = get_client(base_url)
+    limiter = get_limiter()
+    timeout = timeout or DEFAULT_TIMEOUT
+
+    for attempt in range(retries + 1):
+        try:
+            async with limiter:
+                with span('llm_call', cat='llm', model=model, attempt=attempt + 1) as attrs:
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        timeout=timeout,
+                        **kwargs
+                    )
+                    usage = getattr(response, 'usage', None)
+                    if usage is not None:
+                        attrs['completion_tokens'] = getattr(usage, 'completion_tokens', None)
+            # A filtered reply has no choices, a refusal has no content
+            choices = getattr(response, 'choices', None)
+            if not choices:
+                raise LLMError("LLM response has no choices", attempt + 1)
+            message = choices[0].message
+            if message.content is None:
+                reason = getattr(message, 'refusal', None) or getattr(choices[0], 'finish_reason', None)
+                raise LLMError(f"LLM response has no content ({reason})", attempt + 1)
+            return message.content.strip()
+        except retryable_errors() as e:
+            if attempt == retries:
+                raise LLMError(
+                    f"LLM request failed after {attempt + 1} attempts: {e}", attempt + 1, e) from e
+            delay = _backoff_delay(attempt, e)
+            print(
+                f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+        except openai.OpenAIError as e:
+            raise LLMError(f"LLM request failed: {e}", attempt + 1, e) from e
+
+
+async def gather_chat_completions(requests):
+    """Run many chat completions concurrently; failed requests come back as LLMError instances."""
+    return await asyncio.gather(
+        *(chat_completion(**request) for request in requests),
+        return_exceptions=True)
+
+
+def run_chat_completion(messages, model, **kwargs):
+    """Synchronous wrapper around chat_completion for one-off callers."""
+    async def _run():
+        try:
+            return await chat_completion(messages, model, **kwargs)
+        finally:
+            await close_clients()
+
+    return asyncio.run(_run())
@@ -1,69 +1,524 @@
 import os
-import concurrent.futures
+import asyncio
+import contextlib
 import time
-import uuid
-from youtube_utils import get_video_id, fetch_transcript, download_video_segment
+from youtube_utils import (get_video_id, fetch_transcript, download_video_segment_async, get_audio_stream_url,
+                           get_video_stream_url)
 from ai_extractor import extract_important_parts
-from video_processor import process_segment
+from audio_features import extract_audio_features
+from transcript import as_transcript
+from video_processor import (create_segment_subtitles, burn_subtitle_renditions_async, extract_segment_async,
+                             rendition_path, RENDITION_LADDER, RENDITIONS)
+from face_tracker import (detect_and_save_faces, render_saved_crop_plan, plan_crop, load_json, save_json,
+                          detect_and_save_faces_shared, render_saved_crop_plans_shared, shard_count, shard_times,
+                          detect_faces_shard, merge_detections, render_saved_crop_shard, concat_shards_cmd,
+                          probe_static_face, DRAFT_HEIGHT)
+from face_detectors import DEFAULT_BACKEND, FALLBACK_BACKEND, resolve_backend
+from ffmpeg_runner import run_ffmpeg
+from scheduler import StageScheduler, stage_budgets
+from process_runner import run_python_stage, warm_stage_workers, stage_timeout, DETECT_TIMEOUT, RENDER_TIMEOUT, ENCODE_TIMEOUT
+from artifact_store import ArtifactStore, digest, source_fingerprint, is_local_source
+from workspace import segment_workspace
+from media_probe import probe
+import tracing
 import json
 
+# Stage order doubles as scheduling priority: later stages of started segments go first
+STAGE_ORDER = ['download', 'detect', 'plan', 'render',
+               'subtitle', 'publish', 'cleanup']
 
-def process_individual_segment(segment, segment_id, total_segments, youtube_url, transcript_data, aspect_ratio, font_size, words_per_subtitle=2):
-    """Process a single segment completely independently"""
-    try:
-        # Create unique IDs for this segment's files
-        unique_id = str(uuid.uuid4())[:8]
-        temp_dir = f"temp_{segment_id}_{unique_id}"
-        os.makedirs(temp_dir, exist_ok=True)
+# File suffix of each stored artifact
+ARTIFACT_SUFFIXES = {
+    'download': '.mp4',
+    'detections': '.json',
+    'crop_plan': '.json',
+    'subtitles': '.srt',
+    'render': '.mp4',
+    'final': '.mp4',
+}
+# Extra renditions of the final short are stored as final_<name>
+ARTIFACT_SUFFIXES.update({f"final_{name}": rendition['ext'] for name, rendition in RENDITION_LADDER.items()
+                          if name != 'full'})
+
+
+def get_segment_times(segment, segment_id):
+    """Read and validate a segment's start/end times."""
+    start_time = float(segment.get('start_time', 0))
+    end_time = float(segment.get('end_time', start_time + 30))
+
+    # Validate segment duration
+    if end_time <= start_time:
+        print(
+            f"[Segment {segment_id}] Warning: Invalid segment times. Using default 30 second duration.")
+        end_time = start_time + 30
+
+    return start_time, end_time
+
+
+def get_job_id(source, segments, aspect_ratio, font_size, words_per_subtitle, draft=False):
+    """Jobs with identical inputs share an id, and therefore a manifest."""
+    inputs = [source_fingerprint(source), segments, aspect_ratio, font_size, words_per_subtitle]
+    if draft:
+        inputs.append('draft')
+    return digest(inputs)[:16]
+
+
+def segment_artifact_keys(store, source, segment_transcript, start_time, end_time,
+                          aspect_ratio, font_size, words_per_subtitle, draft=False, detector=DEFAULT_BACKEND):
+    """Keys of every artifact of one segment. Each key folds in the keys of its inputs.
+
+    A draft only changes the render (and so the final) key: the download, detections,
+    crop plan and subtitles it stores are the ones the full render reuses. detector is
+    the resolved face detector backend (see resolve_detector).
+    """
+    keys = {}
+    keys['download'] = store.key(
+        'download', source=source_fingerprint(source), start=start_time, end=end_time)
+    keys['detections'] = store.key('detections', input=keys['download'], detector=detector)
+    keys['crop_plan'] = store.key(
+        'crop_plan', detections=keys['detections'], aspect_ratio=aspect_ratio)
+    keys['subtitles'] = store.key(
+        'subtitles', transcript=digest(segment_transcript.to_entries()),
+        start=start_time, end=end_time, words_per_subtitle=words_per_subtitle)
+    if draft:
+        keys['render'] = store.key(
+            'render', input=keys['download'], crop_plan=keys['crop_plan'], draft_height=DRAFT_HEIGHT)
+    else:
+        keys['render'] = store.key(
+            'render', input=keys['download'], crop_plan=keys['crop_plan'])
+    keys['final'] = store.key(
+        'final', render=keys['render'], subtitles=keys['subtitles'], font_size=font_size)
+    for name in ([] if draft else RENDITIONS[1:]):
+        keys[f"final_{name}"] = store.key('rendition', final=keys['final'], rendition=RENDITION_LADDER[name])
+    return keys
 
-        # Output path for final video
-        output_dir = "shorts_output"
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = f"{output_dir}/short_{segment_id}.mp4"
 
-        # Get segment timestamps
+async def resolve_detector(source, segments):
+    """The face detector backend every detection stage of a job uses, resolved once here.
+
+    "auto" benchmarks the backends in one stage process on frames sampled from the
+    segments' ranges of the source (a direct stream for YouTube sources), so shards and
+    segments never pick different backends and detections are stored under the real name.
+    """
+    if DEFAULT_BACKEND != 'auto':
+        return resolve_backend(source)
+
+    media = source
+    if not is_local_source(source):
+        loop = asyncio.get_running_loop()
+        media = await loop.run_in_executor(None, get_video_stream_url, source)
+        if not media:
+            print(f"Face detector auto-selection has no stream to sample, using {FALLBACK_BACKEND}")
+            return FALLBACK_BACKEND
+    ranges = []
+    for segment in segments:
         start_time = float(segment.get('start_time', 0))
-        end_time = float(segment.get('end_time', start_time + 30))
+        ranges.append((start_time, max(start_time, float(segment.get('end_time', start_time + 30)))))
+    try:
+        return await run_python_stage(resolve_backend, media, 'auto', ranges,
+                                      timeout=stage_timeout(DETECT_TIMEOUT, 0), label="detector selection")
+    except Exception as e:
+        print(f"Face detector auto-selection failed ({e}), using {FALLBACK_BACKEND}")
+        return FALLBACK_BACKEND
 
-        # Validate segment duration
-        if end_time <= start_time:
-            print(
-                f"[Segment {segment_id}] Warning: Invalid segment times. Using default 30 second duration.")
-            end_time = start_time + 30
 
-        duration = end_time - start_time
+async def detect_in_shards(input_file, detections_file, duration, shards, segment_id, detector=None):
+    """Detect faces over time shards of a clip in parallel stage processes and stitch the results.
+
+    Detection is per frame, so the stitched detections equal a single pass; the crop plan
+    (and its smoothing) is then computed once over the whole clip.
+    """
+    parts = await asyncio.gather(*(
+        run_python_stage(detect_faces_shard, input_file, start, end, 1, detector,
+                         timeout=stage_timeout(DETECT_TIMEOUT, end - start),
+                         label=f"[Segment {segment_id}] detection shard {i+1}/{shards}")
+        for i, (start, end) in enumerate(shard_times(duration, shards))), return_exceptions=True)
+    errors = [part for part in parts if isinstance(part, BaseException)]
+    if errors:
+        print(f"[Segment {segment_id}] Detection shard failed: {errors[0]}")
+        return False
+    detections = merge_detections(parts)
+    if detections is None:
+        return False
+    save_json(detections, detections_file)
+    return True
+
+
+async def render_in_shards(input_file, plan_file, output_file, work_path, duration, shards, segment_id,
+                           threads=None):
+    """Render time shards of a clip in parallel stage processes, then join them by stream copy."""
+    ranges = shard_times(duration, shards)
+    shard_files = [work_path(f"render_shard_{i}.mp4") for i in range(shards)]
+    results = await asyncio.gather(*(
+        run_python_stage(render_saved_crop_shard, input_file, plan_file, start, end, shard_file,
+                         segment_id, threads, timeout=stage_timeout(RENDER_TIMEOUT, end - start),
+                         label=f"[Segment {segment_id}] render shard {i+1}/{shards}")
+        for i, ((start, end), shard_file) in enumerate(zip(ranges, shard_files))), return_exceptions=True)
+    if not all(result is True for result in results):
+        print(f"[Segment {segment_id}] Render shard failed: {results}")
+        return False
+
+    cmd = concat_shards_cmd(work_path("render_shards.txt"), shard_files, input_file, output_file)
+    await run_ffmpeg(cmd, duration=duration, timeout=stage_timeout(ENCODE_TIMEOUT, duration),
+                     label=f"[Segment {segment_id}] shard concat")
+    return True
+
+
+class SharedDecode:
+    """Detection and rendering of every segment of one local source in a single sequential decode.
+
+    Instead of per-segment download, detect, plan and render stages, segments register
+    what they still need here and two shared stages serve them all, so decode work
+    follows the union of the segment ranges rather than their sum.
+    """
+
+    def __init__(self, source, scheduler, budgets, stage_prefix="", draft=False, detector=None):
+        self.source = source
+        self.budgets = budgets
+        self.draft = draft
+        self.detector = detector
+        self.detect_jobs = {}
+        self.render_jobs = {}
+        self.detect_key = scheduler.add(
+            f"{stage_prefix}detect:shared", self.detect,
+            cpus=budgets['detect'], priority=STAGE_ORDER.index('detect') * 1000)
+        self.render_key = scheduler.add(
+            f"{stage_prefix}render:shared", self.render,
+            cpus=budgets['render'], deps=[self.detect_key], priority=STAGE_ORDER.index('render') * 1000)
+
+    async def detect(self):
+        # Registrations are complete by now: stages only start once all were added
+        if not self.detect_jobs:
+            return True
+        jobs = {segment_id: (job['start'], job['end'], job['output'])
+                for segment_id, job in self.detect_jobs.items()}
+        duration = sum(job['end'] - job['start'] for job in self.detect_jobs.values())
+        results = await run_python_stage(
+            detect_and_save_faces_shared, self.source, jobs, 1, self.detector,
+            timeout=stage_timeout(DETECT_TIMEOUT, duration), label="shared detection")
+        for segment_id, job in self.detect_jobs.items():
+            job['done'](bool(results and results.get(segment_id)))
+        return True
+
+    async def render(self):
+        jobs = {}
+        for segment_id, job in self.render_jobs.items():
+            if job['plan']:
+                try:
+                    await job['plan']()
+                except Exception as e:
+                    print(f"[Segment {segment_id}] Error planning crop: {e}")
+                    job['done'](False)
+                    continue
+            jobs[segment_id] = (job['start'], job['end'], job['plan_file'], job['output'])
+        if not jobs:
+            return True
+
+        duration = sum(end - start for start, end, _, _ in jobs.values())
+        results = await run_python_stage(
+            render_saved_crop_plans_shared, self.source, jobs, self.budgets['render'],
+            timeout=stage_timeout(RENDER_TIMEOUT, duration), label="shared render", draft=self.draft)
+        for segment_id in jobs:
+            self.render_jobs[segment_id]['done'](bool(results and results.get(segment_id)))
+        return True
+
+
+def add_segment_stages(scheduler, budgets, store, manifest, segment, segment_id, total_segments, source,
+                       transcript_data, aspect_ratio, font_size, words_per_subtitle=2, output_dir="shorts_output",
+                       stage_prefix="", download_limiter=None, shared=None, draft=False, detector=None):
+    """Add the stages of one segment, skipping every stage whose artifact is already stored.
+
+    source is a YouTube URL or a local video file. stage_prefix keeps stage keys unique
+    when several jobs share one scheduler; download_limiter caps concurrent downloads.
+    shared is a SharedDecode for the source, which then detects and renders this segment.
+    draft publishes a quick low-resolution short_<id>_draft.mp4 instead of the final short.
+    detector is the job's resolved face detector backend (default SHORTS_FACE_DETECTOR).
+    Returns the key of the stage that publishes the final short.
+    """
+    start_time, end_time = get_segment_times(segment, segment_id)
+
+    # A local source is probed once (and memoized) to plan the segment bounds and scratch space
+    media = probe(source) if is_local_source(source) else None
+    if media and media['duration'] and start_time < media['duration'] < end_time:
+        print(f"[Segment {segment_id}] Warning: Segment ends after the video ({media['duration']:.2f}s), trimming it")
+        end_time = media['duration']
+    # Download, render and final each take about twice the source bitrate at crf 18
+    bytes_per_second = media['bit_rate'] * 3 // 4 if media and media['bit_rate'] else None
+
+    duration = end_time - start_time
+    segment_transcript = as_transcript(
+        transcript_data).between(start_time, end_time)
+    detector = detector or DEFAULT_BACKEND
+    keys = segment_artifact_keys(store, source, segment_transcript, start_time, end_time,
+                                 aspect_ratio, font_size, words_per_subtitle, draft, detector)
+    output_path = f"{output_dir}/short_{segment_id}{'_draft' if draft else ''}.mp4"
+    renditions = ['full'] if draft else RENDITIONS
+
+    # Created on first use, so fully cached segments reserve no scratch space
+    workspace = None
+
+    def artifact(name):
+        return store.path(keys[name], ARTIFACT_SUFFIXES[name])
+
+    def cached(name):
+        return store.get(keys[name], ARTIFACT_SUFFIXES[name]) is not None
+
+    def work_path(name):
+        nonlocal workspace
+        if workspace is None:
+            workspace = segment_workspace(f"segment{segment_id}", duration, bytes_per_second)
+        return workspace.path(name)
+
+    def temp_path(name):
+        return work_path(name + ARTIFACT_SUFFIXES[name])
+
+    def store_result(name, ok, tmp_path):
+        """Move a finished stage output into the store and note it in the manifest."""
+        if not ok or not os.path.exists(tmp_path):
+            manifest.record(segment_id, name, keys[name], 'failed')
+            return False
+        path = store.put(keys[name], tmp_path, ARTIFACT_SUFFIXES[name])
+        manifest.record(segment_id, name, keys[name], 'done', path)
+        return True
+
+    # Work out which artifacts still have to be produced, from the final output backwards.
+    # All renditions come out of one subtitle burn, so a missing one redoes the whole ladder.
+    finals = ['final'] + [f"final_{name}" for name in renditions[1:]]
+    need = {'final': not all(cached(name) for name in finals)}
+    need['render'] = need['final'] and not cached('render')
+    need['subtitles'] = need['final'] and not cached('subtitles')
+    need['crop_plan'] = need['render'] and not cached('crop_plan')
+    need['detections'] = need['crop_plan'] and not cached('detections')
+    need['download'] = (need['detections'] or need['render']) and not cached('download')
+    if shared is not None:
+        need['download'] = False  # The shared stages decode the source directly
+
+    for name, needed in need.items():
+        if not needed:
+            manifest.record(segment_id, name, keys[name], 'cached', artifact(name))
+    if not need['final']:
+        print(f"[Segment {segment_id}] Reusing stored output")
+
+    def key(stage):
+        return f"{stage_prefix}{stage}:{segment_id}"
+
+    def priority(stage):
+        return STAGE_ORDER.index(stage) * 1000 - segment_id
+
+    def deps(*stages):
+        return [key(stage) for stage in stages if key(stage) in scheduler.stages]
+
+    async def download():
         print(
             f"[Segment {segment_id}/{total_segments}] Processing clip of duration: {duration:.2f}s")
+        tmp_path = temp_path('download')
+        async with download_limiter or contextlib.nullcontext():
+            if is_local_source(source):
+                ok = await extract_segment_async(
+                    source, start_time, end_time, tmp_path, budgets['download'],
+                    timeout=stage_timeout(ENCODE_TIMEOUT, duration))
+            else:
+                ok = await download_video_segment_async(
+                    source, start_time, end_time, tmp_path, budgets['download'], segment_id=segment_id)
+        return store_result('download', ok, tmp_path)
+
+    # Long clips are tracked in parallel time shards
+    shards = shard_count(duration, max(1, scheduler.total_cpus // max(1, budgets['render'])))
+
+    async def detect():
+        tmp_path = temp_path('detections')
+        static = None
+        if shards > 1:
+            # Sharding only pays off when the face moves (detect_and_save_faces probes by itself)
+            static = await run_python_stage(
+                probe_static_face, artifact('download'), segment_id, 1, detector,
+                timeout=stage_timeout(DETECT_TIMEOUT, duration), label=f"[Segment {segment_id}] static probe")
+        if static:
+            save_json(static, tmp_path)
+            ok = True
+        elif shards > 1:
+            ok = await detect_in_shards(artifact('download'), tmp_path, duration, shards, segment_id, detector)
+        else:
+            ok = await run_python_stage(
+                detect_and_save_faces, artifact('download'), tmp_path, segment_id, total_segments, 1, detector,
+                timeout=stage_timeout(DETECT_TIMEOUT, duration), label=f"[Segment {segment_id}] detection")
+        return store_result('detections', ok, tmp_path)
+
+    async def plan():
+        tmp_path = temp_path('crop_plan')
+        save_json(plan_crop(load_json(artifact('detections')), aspect_ratio), tmp_path)
+        return store_result('crop_plan', True, tmp_path)
+
+    async def render():
+        tmp_path = temp_path('render')
+        # Drafts are quick enough unsharded
+        if shards > 1 and not draft and not load_json(artifact('crop_plan')).get('static'):
+            ok = await render_in_shards(artifact('download'), artifact('crop_plan'), tmp_path, work_path,
+                                        duration, shards, segment_id, budgets['render'])
+        else:
+            ok = await run_python_stage(
+                render_saved_crop_plan, artifact('download'), artifact('crop_plan'), tmp_path, segment_id, budgets['render'],
+                timeout=stage_timeout(RENDER_TIMEOUT, duration), label=f"[Segment {segment_id}] render", draft=draft)
+        return store_result('render', ok, tmp_path)
+
+    async def subtitle():
+        if need['subtitles']:
+            srt_path = temp_path('subtitles')
+            create_segment_subtitles(
+                segment, segment_transcript, srt_path, words_per_subtitle, presliced=True)
+            store_result('subtitles', True, srt_path)
+
+        if not cached('render'):
+            print(f"[Segment {segment_id}] Error: No tracked video to add subtitles to")
+            return False
+
+        print(f"[Segment {segment_id}] Adding subtitles...")
+        outputs = {name: temp_path(artifact_name) for name, artifact_name in zip(renditions, finals)}
+        ok = await burn_subtitle_renditions_async(
+            artifact('render'), artifact('subtitles'), outputs, font_size, segment_id, budgets['subtitle'],
+            timeout=stage_timeout(ENCODE_TIMEOUT, duration), duration=duration, draft=draft)
+        return all([store_result(artifact_name, ok, outputs[name])
+                    for name, artifact_name in zip(renditions, finals)])
+
+    async def publish():
+        for name, artifact_name in zip(renditions, finals):
+            store.export(keys[artifact_name], ARTIFACT_SUFFIXES[artifact_name], rendition_path(output_path, name))
+        return True
+
+    async def cleanup():
+        if workspace is not None:
+            workspace.cleanup()
+        return True
+
+    if shared is not None:
+        if need['detections']:
+            shared.detect_jobs[segment_id] = {
+                'start': start_time, 'end': end_time, 'output': temp_path('detections'),
+                'done': lambda ok: store_result('detections', ok, temp_path('detections'))}
+        if need['render']:
+            shared.render_jobs[segment_id] = {
+                'start': start_time, 'end': end_time, 'plan': plan if need['crop_plan'] else None,
+                'plan_file': artifact('crop_plan'), 'output': temp_path('render'),
+                'done': lambda ok: store_result('render', ok, temp_path('render'))}
+        if need['final']:
+            scheduler.add(key('subtitle'), subtitle, cpus=budgets['subtitle'],
+                          deps=[shared.render_key], priority=priority('subtitle'))
+    else:
+        if need['download']:
+            scheduler.add(key('download'), download,
+                          cpus=budgets['download'], priority=priority('download'))
+        if need['detections']:
+            scheduler.add(key('detect'), detect,
+                          cpus=budgets['detect'] * shards, deps=deps('download'), priority=priority('detect'))
+        if need['crop_plan']:
+            scheduler.add(key('plan'), plan,
+                          cpus=0, deps=deps('detect'), priority=priority('plan'))
+        if need['render']:
+            scheduler.add(key('render'), render,
+                          cpus=budgets['render'] * shards, deps=deps('download', 'plan'), priority=priority('render'))
+        if need['final']:
+            scheduler.add(key('subtitle'), subtitle,
+                          cpus=budgets['subtitle'], deps=deps('render'), priority=priority('subtitle'))
+    scheduler.add(key('publish'), publish,
+                  cpus=0, deps=deps('subtitle'), priority=priority('publish'))
+    scheduler.add(key('cleanup'), cleanup,
+                  cpus=budgets['cleanup'], deps=[key('publish')], priority=priority('cleanup'), always=True)
+
+    return key('publish')
+
+
+async def run_segments(segments, source, transcript, aspect_ratio, font_size, words_per_subtitle=2,
+                       output_dir="shorts_output", total_cpus=None, store=None, segment_ids=None,
+                       shared_decode=False, draft=False, total_segments=None):
+    """Supervise every segment's stages from one event loop. Returns {segment_id: success}.
+
+    total_segments is the size of the whole job when only some of its segments run here
+    (default: the highest segment id).
 
-        # Download only this segment
-        raw_segment = f"{temp_dir}/raw_segment.mp4"
-        if not download_video_segment(youtube_url, start_time, end_time, raw_segment):
-            raise Exception("Failed to download segment")
+    With shared_decode and a local source, all segments are detected and rendered from
+    one sequential decode of the source (see SharedDecode). draft renders quick previews;
+    a later run without it reuses their analysis and only renders.
+    """
+    total_cpus = total_cpus or os.cpu_count() or 4
+    budgets = stage_budgets(total_cpus)
+    store = store or ArtifactStore()
+    manifest = store.manifest(get_job_id(
+        source, segments, aspect_ratio, font_size, words_per_subtitle, draft))
+    segment_ids = segment_ids or list(range(1, len(segments) + 1))
+    total_segments = total_segments or max(segment_ids)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Subtitles are written in this process, so the indexed transcript never crosses a process boundary
+    indexed_transcript = as_transcript(transcript)
+
+    # The forkserver imports the render modules while the downloads run
+    warm_stage_workers()
 
-        # Process the segment
-        result = process_segment(
-            video_path=raw_segment,
+    # One backend for every detection of the job, so "auto" never differs between shards
+    detector = await resolve_detector(source, segments)
+
+    scheduler = StageScheduler(total_cpus)
+    shared = None
+    if shared_decode and is_local_source(source):
+        shared = SharedDecode(source, scheduler, budgets, draft=draft, detector=detector)
+    final_stages = {}
+    for segment, segment_id in zip(segments, segment_ids):
+        final_stage = add_segment_stages(
+            scheduler, budgets, store, manifest,
             segment=segment,
-            transcript_data=transcript_data,
+            segment_id=segment_id,
+            total_segments=total_segments,
+            source=source,
+            transcript_data=indexed_transcript,
             aspect_ratio=aspect_ratio,
-            output_path=output_path,
             font_size=font_size,
             words_per_subtitle=words_per_subtitle,
-            segment_id=segment_id,
-            total_segments=total_segments,
-            temp_dir=temp_dir
+            output_dir=output_dir,
+            shared=shared,
+            draft=draft,
+            detector=detector
         )
+        final_stages[final_stage] = segment_id
 
-        # Clean up temporary directory
-        try:
-            for file in os.listdir(temp_dir):
-                os.remove(os.path.join(temp_dir, file))
-            os.rmdir(temp_dir)
-        except Exception as e:
+    # Report shorts as they complete
+    completed = []
+
+    def on_complete(stage):
+        if stage.key not in final_stages:
+            return
+        segment_id = final_stages[stage.key]
+        completed.append(segment_id)
+        if stage.status == 'done':
+            print(
+                f"\n✅ Short {segment_id}/{total_segments} is ready! File: {output_dir}/short_{segment_id}{'_draft' if draft else ''}.mp4")
             print(
-                f"[Segment {segment_id}] Warning: Could not clean up temp directory: {e}")
+                f"   [{len(completed)}/{len(segments)}] segments completed")
+        else:
+            print(f"\n❌ Failed to process segment {segment_id}.")
 
-        return result
+    await scheduler.run(on_complete)
+
+    results = {}
+    for stage_key, segment_id in final_stages.items():
+        results[segment_id] = scheduler.stages[stage_key].status == 'done'
+        if scheduler.stages[stage_key].status == 'skipped':
+            print(f"\n❌ Failed to process segment {segment_id}.")
+    return results
+
+
+def process_individual_segment(segment, segment_id, total_segments, youtube_url, transcript_data, aspect_ratio, font_size, words_per_subtitle=2, total_cpus=None,
+                               draft=False):
+    """Process a single segment completely independently, resuming from stored artifacts.
+
+    total_cpus is the CPU budget of the segment's stages (default: every core). With
+    draft, a low-resolution preview is rendered in seconds; calling again without draft
+    upgrades it to the final render using the stored detections and crop plan.
+    """
+    try:
+        results = asyncio.run(run_segments(
+            [segment], youtube_url, transcript_data, aspect_ratio, font_size, words_per_subtitle,
+            total_cpus=total_cpus, segment_ids=[segment_id], draft=draft, total_segments=total_segments))
+        return results[segment_id]
     except Exception as e:
         print(f"[Segment {segment_id}] Error in segment processing: {e}")
         return False
@@ -82,8 +537,17 @@ def main():
         print("Could not retrieve transcript.")
         return
 
+    # Audio energy features from a low-rate audio stream (no video download)
+    print("Extracting audio highlight features...")
+    audio_features = None
+    audio_url = get_audio_stream_url(youtube_url)
+    if audio_url:
+        with tracing.span('audio_features', cat='analysis'):
+            audio_features = extract_audio_features(audio_url)
+
     print("Analyzing transcript to find engaging segments...")
-    segments = extract_important_parts(transcript)
+    segments = extract_important_parts(
+        transcript, audio_features=audio_features)
     print("Extracted segments:", json.dumps(segments, indent=2))
 
     # Choose aspect ratio
@@ -120,56 +584,26 @@ def main():
     output_dir = "shorts_output"
     os.makedirs(output_dir, exist_ok=True)
 
-    # Determine number of workers
-    max_workers = min(len(segments), os.cpu_count() or 4)
-    print(f"\nUsing {max_workers} workers for parallel processing")
-
-    # Process segments in parallel - each worker handles everything including download
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # Start timer
-        start_time = time.time()
-
-        # Submit tasks
-        futures = {}
-        for i, segment in enumerate(segments):
-            future = executor.submit(
-                process_individual_segment,
-                segment=segment,
-                segment_id=i+1,
-                total_segments=len(segments),
-                youtube_url=youtube_url,
-                transcript_data=transcript,
-                aspect_ratio=aspect_ratio,
-                font_size=font_size,
-                words_per_subtitle=words_per_subtitle
-            )
-            futures[future] = i+1
-
-        # Process results as they complete
-        completed = 0
-        for future in concurrent.futures.as_completed(futures):
-            segment_id = futures[future]
-            output_file = f"{output_dir}/short_{segment_id}.mp4"
-
-            try:
-                success = future.result()
-                completed += 1
-
-                if success:
-                    print(
-                        f"\n✅ Short {segment_id}/{len(segments)} is ready! File: {output_file}")
-                    print(
-                        f"   [{completed}/{len(segments)}] segments completed")
-                else:
-                    print(f"\n❌ Failed to process segment {segment_id}.")
-            except Exception as e:
-                print(f"\n❌ Error processing segment {segment_id}: {e}")
-
-        # Print total time
-        total_time = time.time() - start_time
-        print(f"\nAll processing completed in {total_time:.2f} seconds")
-        print(f"Output videos are available in the '{output_dir}' directory")
+    # Budget CPU per stage instead of one process per segment
+    total_cpus = os.cpu_count() or 4
+    print(f"\nScheduling {len(segments)} segments on {total_cpus} cores")
+
+    # Start timer
+    start_time = time.time()
+
+    try:
+        asyncio.run(run_segments(segments, youtube_url, transcript, aspect_ratio,
+                                 font_size, words_per_subtitle, output_dir, total_cpus))
+    except KeyboardInterrupt:
+        print("\nInterrupted, all running downloads and encoders were stopped.")
+        return
 
+    # Print total time
+    total_time = time.time() - start_time
+    print(f"\nAll processing completed in {total_time:.2f} seconds")
+    print(f"Output videos are available in the '{output_dir}' directory")
+    if tracing.enabled():
+        print(f"Trace written to {tracing.TRACE_PATH} (python tracing.py {tracing.TRACE_PATH} --summary)")
 
 if __name__ == "__main__":
     main()
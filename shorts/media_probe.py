@@ -0,0 +1,201 @@
+"""One ffprobe per media file: streams, frame rate, duration, audio layout and keyframes.
+
+Usage:
+    python media_probe.py clip.mp4 [--keyframes]
+
+probe() runs a single JSON ffprobe and memoizes the result by path, size and mtime,
+in memory and under the cache directory, so every stage (including stage processes)
+plans from the same numbers without probing again. Frame rate and frame count come
+from the container's average rate, which OpenCV's CAP_PROP_FPS / CAP_PROP_FRAME_COUNT
+get wrong for the variable frame rate streams YouTube serves.
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+from artifact_store import STORE_ROOT, atomic_write_json, digest, source_fingerprint
+
+PROBE_DIR = os.path.join(STORE_ROOT, 'probes')
+# Bump when the shape of a probe result changes
+PROBE_VERSION = 1
+
+_lock = threading.Lock()
+_probes = {}
+
+
+def parse_rate(rate):
+    """Frames per second from an ffprobe rate such as "30000/1001" (0.0 when unknown)."""
+    try:
+        num, _, den = str(rate).partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize(data, path):
+    """Planning summary of raw ffprobe JSON."""
+    fmt = data.get('format', {})
+    streams = data.get('streams', [])
+    duration = _number(fmt.get('duration'))
+    video = next((s for s in streams if s.get('codec_type') == 'video'
+                  and not s.get('disposition', {}).get('attached_pic')), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+    info = {
+        'path': path,
+        'format': fmt.get('format_name'),
+        'duration': duration,
+        'size': _number(fmt.get('size'), int),
+        'bit_rate': _number(fmt.get('bit_rate'), int),
+        'video': None,
+        'audio': None,
+    }
+    if video:
+        avg_fps = parse_rate(video.get('avg_frame_rate'))
+        base_fps = parse_rate(video.get('r_frame_rate'))
+        fps = avg_fps or base_fps
+        video_duration = _number(video.get('duration')) or duration
+        frames = _number(video.get('nb_frames'), int)
+        if not frames and video_duration and fps:
+            frames = int(round(video_duration * fps))
+        rotation = _number(video.get('tags', {}).get('rotate'), int) or 0
+        for side_data in video.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = _number(side_data['rotation'], int) or 0
+        width, height = video.get('width'), video.get('height')
+        # Decoders (OpenCV included) rotate frames upright, so report the displayed size
+        if abs(rotation) % 180 == 90:
+            width, height = height, width
+        info['video'] = {
+            'codec': video.get('codec_name'),
+            'width': width,
+            'height': height,
+            'pix_fmt': video.get('pix_fmt'),
+            'fps': fps,
+            'frames': frames,
+            'duration': video_duration,
+            'rotation': rotation,
+            'vfr': bool(avg_fps and base_fps and abs(avg_fps - base_fps) > 0.01),
+            'bit_rate': _number(video.get('bit_rate'), int),
+        }
+    if audio:
+        info['audio'] = {
+            'codec': audio.get('codec_name'),
+            'sample_rate': _number(audio.get('sample_rate'), int),
+            'channels': audio.get('channels'),
+            'channel_layout': audio.get('channel_layout'),
+            'bit_rate': _number(audio.get('bit_rate'), int),
+        }
+    return info
+
+
+def _run_ffprobe(args, path):
+    result = subprocess.run(['ffprobe', '-v', 'error', '-of', 'json', *args, path],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout or '{}')
+
+
+def _cache_file(key):
+    return os.path.join(PROBE_DIR, f"{key}.json")
+
+
+def _load(key, path):
+    """The memoized probe under key, from memory or disk, or None."""
+    with _lock:
+        if key in _probes:
+            return _probes[key]
+    if not os.path.exists(path):
+        return None  # URLs are only memoized in memory
+    try:
+        with open(_cache_file(key), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _lock:
+        _probes[key] = info
+    return info
+
+
+def _store(key, path, info):
+    with _lock:
+        _probes[key] = info
+    if os.path.exists(path):
+        os.makedirs(PROBE_DIR, exist_ok=True)
+        atomic_write_json(_cache_file(key), info)
+
+
+def _key(path):
+    return digest({'probe': PROBE_VERSION, 'source': source_fingerprint(path)})
+
+
+def probe(path):
+    """Summary of a media file (or URL), probed once per path, size and mtime. None if ffprobe fails."""
+    key = _key(path)
+    info = _load(key, path)
+    if info is not None:
+        return info
+    try:
+        data = _run_ffprobe(['-show_format', '-show_streams'], path)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Error probing {path}: {e}")
+        return None
+    info = summarize(data, path)
+    _store(key, path, info)
+    return info
+
+
+def keyframes(path):
+    """Presentation times of the video keyframes, read from packet flags (no decoding).
+
+    Reading every packet costs a pass over the file, so the index is only built on
+    demand and then memoized with the rest of the probe.
+    """
+    info = probe(path)
+    if info is None:
+        return None
+    if 'keyframes' not in info:
+        try:
+            data = _run_ffprobe(['-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags'], path)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            print(f"Error reading keyframes of {path}: {e}")
+            return None
+        times = [_number(packet.get('pts_time')) for packet in data.get('packets', [])
+                 if 'K' in packet.get('flags', '')]
+        info = dict(info, keyframes=sorted(t for t in times if t is not None))
+        _store(_key(path), path, info)
+    return info['keyframes']
+
+
+def video_dimensions(path, default=None):
+    """Displayed (width, height) of the first video stream, or default."""
+    info = probe(path)
+    if info and info['video'] and info['video']['width']:
+        return info['video']['width'], info['video']['height']
+    return default
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the cached probe of a media file.")
+    parser.add_argument('media')
+    parser.add_argument('--keyframes', action='store_true', help="Also build the keyframe index")
+    args = parser.parse_args()
+
+    info = probe(args.media)
+    if info is None:
+        return
+    if args.keyframes:
+        keyframes(args.media)
+        info = probe(args.media)
+    print(json.dumps(info, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from llm_client import chat_completion, LLMError
+from ai_extractor import (build_prompt, parse_segments, default_segments,
+                          DEFAULT_MODEL, SYSTEM_PROMPT)
+from transcript import as_transcript
+
+# Cheapest first; the last tier's answer is used even if it fails validation
+MODEL_TIERS = [
+    os.getenv("LLM_SMALL_MODEL", "klusterai/Meta-Llama-3.1-8B-Instruct-Turbo"),
+    os.getenv("LLM_LARGE_MODEL", DEFAULT_MODEL),
+]
+
+MIN_SEGMENT_SECONDS = 10
+MAX_SEGMENT_SECONDS = 60
+MIN_SPEECH_OVERLAP = 0.5
+MIN_CONFIDENCE = 0.6
+
+
+def speech_overlap(transcript, start_time, end_time):
+    """Fraction of [start_time, end_time) covered by transcript entries.
+
+    Overlapping entries are merged, so speech heard twice is only counted once.
+    """
+    duration = end_time - start_time
+    if duration <= 0:
+        return 0.0
+
+    window = as_transcript(transcript).overlapping(start_time, end_time)
+    covered = 0.0
+    reach = start_time  # End of the speech counted so far; entries are sorted by start
+    for entry_start, entry_duration in zip(window.starts, window.durations):
+        entry_end = min(entry_start + entry_duration, end_time)
+        if entry_end > reach:
+            covered += entry_end - max(entry_start, reach)
+            reach = entry_end
+    return covered / duration
+
+
+def validate_answer(content, transcript):
+    """Check a model answer before trusting it. Returns a list of problems (empty if valid)."""
+    try:
+        raw_segments = json.loads(content)
+    except json.JSONDecodeError:
+        return ["response is not valid JSON"]
+
+    if not isinstance(raw_segments, list) or not raw_segments:
+        return ["response is not a non-empty list"]
+
+    # Index once; every segment below looks its speech up by binary search
+    transcript = as_transcript(transcript)
+    if len(transcript):
+        video_end = float((transcript.starts + transcript.durations).max())
+    else:
+        video_end = None
+
+    problems = []
+    intervals = []
+    for i, segment in enumerate(raw_segments):
+        label = f"segment {i+1}"
+        if not isinstance(segment, dict):
+            problems.append(f"{label} is not an object")
+            continue
+
+        try:
+            start = float(segment['start_time'])
+            end = float(segment['end_time'])
+        except (KeyError, ValueError, TypeError):
+            problems.append(f"{label} has missing or non-numeric times")
+            continue
+
+        duration = end - start
+        if not MIN_SEGMENT_SECONDS <= duration <= MAX_SEGMENT_SECONDS:
+            problems.append(f"{label} lasts {duration:.1f}s")
+        if video_end is not None and start >= video_end:
+            problems.append(f"{label} starts after the video ends")
+        elif speech_overlap(transcript, start, end) < MIN_SPEECH_OVERLAP:
+            problems.append(f"{label} has too little speech")
+
+        try:
+            confidence = float(segment.get('confidence'))
+        except (ValueError, TypeError):
+            confidence = None
+        if confidence is None or confidence < MIN_CONFIDENCE:
+            problems.append(f"{label} has low confidence ({confidence})")
+
+        intervals.append((start, end))
+
+    intervals.sort()
+    for (_, prev_end), (next_start, _) in zip(intervals, intervals[1:]):
+        if next_start < prev_end:
+            problems.append("segments overlap")
+            break
+
+    return problems
+
+
+async def route_extraction(transcript, audio_features=None, tiers=None):
+    """Ask the cheapest model first and escalate only when its answer fails validation.
+
+    Returns (segments, report) where report lists the latency and outcome of every tier tried.
+    """
+    tiers = tiers or MODEL_TIERS
+    prompt = build_prompt(transcript, audio_features, with_confidence=True)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+    report = {'tiers': [], 'model': None}
+    fallback = None
+
+    for tier, model in enumerate(tiers):
+        tier_start = time.perf_counter()
+        try:
+            content = await chat_completion(messages=messages, model=model)
+            problems = validate_answer(content, transcript)
+        except LLMError as e:
+            content = None
+            problems = [str(e)]
+        latency = time.perf_counter() - tier_start
+
+        report['tiers'].append({
+            'model': model,
+            'latency': round(latency, 3),
+            'valid': not problems,
+            'problems': problems,
+        })
+        print(
+            f"[Router] Tier {tier+1} ({model}) answered in {latency:.2f}s"
+            + ("" if not problems else f", escalating: {'; '.join(problems[:3])}"))
+
+        if content is None:
+            continue
+
+        segments = parse_segments(content)
+        if not problems and segments:
+            report['model'] = model
+            return segments, report
+        if segments:
+            # Keep the best-effort answer in case every tier fails validation
+            fallback = (segments, model)
+
+    if fallback:
+        segments, report['model'] = fallback
+        return segments, report
+
+    print("No valid segments found. Creating a default segment.")
+    return default_segments(), report
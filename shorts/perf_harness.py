@@ -0,0 +1,305 @@
+"""End-to-end performance harness that runs the whole pipeline offline.
+
+Usage:
+    python perf_harness.py [--media talk.mp4] [--transcript transcript.txt] [--segments 1,2,4,8]
+                           [--llm-latency 1.5] [--llm-jitter 0.5] [--llm-error-rate 0.1] [--cpus N]
+                           [--shared-decode]
+
+Stand-ins replace every network dependency:
+    - a local media file (or a generated test clip) instead of yt-dlp downloads,
+    - a fixture transcript file instead of YouTubeTranscriptApi,
+    - a fake OpenAI-compatible server with configurable latency and errors
+      instead of the LLM API (also usable alone: python perf_harness.py --serve-llm).
+
+Each run uses a fresh artifact store, so every stage really executes. The
+results table shows how wall time scales with the number of segments.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from daemon import read_request, send_json
+from media_probe import probe
+from transcript import load_transcript_file
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class FakeLLMServer:
+    """OpenAI-compatible /chat/completions endpoint answering with evenly spaced segments.
+
+    Runs its own event loop in a background thread so the pipeline can use asyncio.run().
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, media_duration=180.0,
+                 segment_length=20.0, segment_count=3, host="127.0.0.1", port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.media_duration = media_duration
+        self.segment_length = segment_length
+        self.segment_count = segment_count
+        self.host = host
+        self.port = port
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def segments(self):
+        """Evenly spaced segments inside the media, as the model would return them."""
+        span_end = max(0.0, self.media_duration - self.segment_length)
+        count = max(1, self.segment_count)
+        segments = []
+        for i in range(count):
+            start = round(span_end * i / max(1, count - 1), 2) if count > 1 else 0.0
+            segments.append({
+                "start_time": start,
+                "end_time": round(start + self.segment_length, 2),
+                "reason": f"Synthetic segment {i+1}",
+                "confidence": 0.9
+            })
+        return segments
+
+    async def handle(self, reader, writer):
+        try:
+            request = await read_request(reader)
+            if request is None:
+                return
+            method, path, body = request
+            if method != 'POST' or not path.rstrip('/').endswith('/chat/completions'):
+                return await send_json(writer, 404, {'error': {'message': 'not found'}})
+
+            self.requests += 1
+            payload = json.loads(body or b'{}')
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                return await send_json(writer, 503, {'error': {'message': 'overloaded', 'type': 'server_error'}})
+
+            content = json.dumps(self.segments())
+            prompt_chars = sum(len(message.get('content', '')) for message in payload.get('messages', []))
+            await send_json(writer, 200, {
+                'id': f"chatcmpl-fake-{self.requests}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': payload.get('model', 'fake'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': len(content) // 4,
+                          'total_tokens': (prompt_chars + len(content)) // 4},
+            })
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:
+            await send_json(writer, 400, {'error': {'message': str(e)}})
+        finally:
+            writer.close()
+
+    def start(self):
+        started = threading.Event()
+
+        async def serve():
+            self._server = await asyncio.start_server(self.handle, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            async with self._server:
+                await self._server.serve_forever()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(serve())
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop and self._server:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._thread.join(timeout=5)
+
+
+def run_pipeline(media, transcript_path, total_cpus, work_dir, aspect_ratio="9:16", font_size=42,
+                 shared_decode=False):
+    """One full offline run: transcript, audio features, LLM routing and every segment stage."""
+    from audio_features import extract_audio_features
+    from model_router import route_extraction
+    from llm_client import close_clients
+    from artifact_store import ArtifactStore
+    from main import run_segments
+
+    timings = {}
+    run_start = time.perf_counter()
+
+    start = time.perf_counter()
+    transcript = load_transcript_file(transcript_path)
+    timings['transcript_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    audio_features = extract_audio_features(media)
+    timings['audio_features_s'] = time.perf_counter() - start
+
+    async def analyze():
+        try:
+            return await route_extraction(transcript, audio_features)
+        finally:
+            await close_clients()
+
+    start = time.perf_counter()
+    segments, report = asyncio.run(analyze())
+    timings['llm_s'] = time.perf_counter() - start
+
+    # A fresh store per run so cached artifacts never hide the real cost
+    store = ArtifactStore(root=os.path.join(work_dir, 'cache'))
+    start = time.perf_counter()
+    results = asyncio.run(run_segments(
+        segments, media, transcript, aspect_ratio, font_size,
+        output_dir=os.path.join(work_dir, 'output'), total_cpus=total_cpus, store=store,
+        shared_decode=shared_decode))
+    timings['render_s'] = time.perf_counter() - start
+    timings['total_s'] = time.perf_counter() - run_start
+
+    return {
+        'segments': len(segments),
+        'succeeded': sum(results.values()),
+        'model': report['model'],
+        'timings': timings,
+    }
+
+
+def media_duration(media):
+    """Length of the media in seconds, from the shared probe."""
+    info = probe(media)
+    if info is None or not info['duration']:
+        raise RuntimeError(f"Could not probe the duration of {media}")
+    return info['duration']
+
+
+def print_table(runs):
+    base = runs[0]
+    base_per_segment = base['timings']['total_s'] / max(1, base['segments'])
+    print(f"\n{'segments':>8}{'ok':>5}{'total s':>10}{'llm s':>8}{'render s':>10}{'s/short':>9}{'speedup':>9}")
+    for run in runs:
+        timings = run['timings']
+        per_segment = timings['total_s'] / max(1, run['segments'])
+        speedup = base_per_segment * run['segments'] / timings['total_s']
+        print(f"{run['segments']:>8}{run['succeeded']:>5}{timings['total_s']:>10.2f}{timings['llm_s']:>8.2f}"
+              f"{timings['render_s']:>10.2f}{per_segment:>9.2f}{speedup:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the full pipeline offline with local stand-ins.")
+    parser.add_argument('--media', default=None,
+                        help="Local video used as the source (default: a generated 720p test clip)")
+    parser.add_argument('--media-duration', type=int, default=180,
+                        help="Length of the generated test clip in seconds")
+    parser.add_argument('--transcript', default=os.path.join(HERE, 'transcript.txt'),
+                        help="Fixture transcript, JSON entries or \"[start] text\" lines")
+    parser.add_argument('--segments', default="1,2,4",
+                        help="Comma-separated segment counts to run, e.g. 1,2,4,8")
+    parser.add_argument('--segment-length', type=float, default=20.0)
+    parser.add_argument('--cpus', type=int, default=None)
+    parser.add_argument('--llm-latency', type=float, default=1.0,
+                        help="Seconds the fake LLM takes per request")
+    parser.add_argument('--llm-jitter', type=float, default=0.0,
+                        help="Extra random latency of up to this many seconds")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0,
+                        help="Fraction of LLM requests answered with HTTP 503")
+    parser.add_argument('--shared-decode', action='store_true',
+                        help="Detect and render all segments from one sequential decode of the media")
+    parser.add_argument('--serve-llm', action='store_true',
+                        help="Only run the fake LLM server (point LLM_BASE_URL at it)")
+    parser.add_argument('--port', type=int, default=0, help="Fake LLM port (default: any free port)")
+    parser.add_argument('--output', default="perf_results.json")
+    parser.add_argument('--trace', default=None,
+                        help="Write per-stage timing spans (JSON lines) to this file")
+    parser.add_argument('--keep', action='store_true', help="Keep outputs of every run")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.llm_latency, args.llm_jitter, args.llm_error_rate,
+                           segment_length=args.segment_length, port=args.port)
+    if args.serve_llm:
+        server.start()
+        print(f"Fake LLM listening on {server.url} (export LLM_BASE_URL={server.url})")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.stop()
+        return
+
+    if args.trace:
+        import tracing
+        tracing.enable(args.trace)
+
+    media = args.media
+    if media is None:
+        from benchmark import make_test_clip
+        media = make_test_clip('720p', 30, args.media_duration)
+    server.media_duration = media_duration(media)
+
+    server.start()
+    os.environ['LLM_BASE_URL'] = server.url
+    import llm_client
+    llm_client.DEFAULT_BASE_URL = server.url
+    print(f"Fake LLM on {server.url}, latency {args.llm_latency}s, error rate {args.llm_error_rate:.0%}")
+
+    runs = []
+    work_root = tempfile.mkdtemp(prefix='perf_harness_')
+    try:
+        for count in (int(n) for n in args.segments.split(',')):
+            server.segment_count = count
+            print(f"\n=== {count} segment(s) ===")
+            work_dir = os.path.join(work_root, f"run_{count}")
+            run = run_pipeline(media, args.transcript, args.cpus, work_dir,
+                               shared_decode=args.shared_decode)
+            run['requested'] = count
+            runs.append(run)
+            if not args.keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    print_table(runs)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'media': media, 'cpus': args.cpus or os.cpu_count(), 'shared_decode': args.shared_decode,
+                   'llm': {'latency': args.llm_latency, 'jitter': args.llm_jitter,
+                           'error_rate': args.llm_error_rate, 'requests': server.requests,
+                           'errors': server.errors},
+                   'runs': runs}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.keep:
+        print(f"Outputs kept in {work_root}")
+
+    # Failed segments skip their render, so the timings above would flatter the run
+    failed = [run for run in runs if run['succeeded'] < run['segments']]
+    if failed:
+        print(f"{len(failed)} run(s) had failed segments: "
+              + ', '.join(f"{run['segments'] - run['succeeded']}/{run['segments']} in run_{run['requested']}"
+                          for run in failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import subprocess
+import threading
+from tracing import span
+
+# Seconds a child gets to exit after SIGTERM before it is SIGKILLed
+KILL_GRACE_PERIOD = 5
+
+# Timeouts scale with the clip length: base seconds plus seconds per second of media
+DOWNLOAD_TIMEOUT = (300, 10)
+DETECT_TIMEOUT = (120, 10)
+RENDER_TIMEOUT = (120, 10)
+ENCODE_TIMEOUT = (120, 5)
+
+
+def stage_timeout(kind, duration):
+    """Timeout in seconds for a stage working on a clip of the given duration."""
+    base, per_second = kind
+    return base + per_second * max(0, duration)
+
+
+def _signal_group(pid, sig):
+    try:
+        os.killpg(pid, sig)
+        return True
+    except (ProcessLookupError, PermissionError, AttributeError):
+        return False
+
+
+async def kill_process_tree(proc):
+    """Terminate a child started in its own session together with everything it spawned."""
+    if proc.returncode is not None:
+        return
+
+    if not _signal_group(proc.pid, signal.SIGTERM):
+        proc.terminate()
+    try:
+        await asyncio.wait_for(proc.wait(), KILL_GRACE_PERIOD)
+    except asyncio.TimeoutError:
+        if not _signal_group(proc.pid, signal.SIGKILL):
+            proc.kill()
+        await proc.wait()
+
+
+def kill_process_tree_sync(proc):
+    """Blocking counterpart of kill_process_tree for subprocess.Popen children."""
+    if proc.poll() is not None:
+        return
+
+    if not _signal_group(proc.pid, signal.SIGTERM):
+        proc.terminate()
+    try:
+        proc.wait(KILL_GRACE_PERIOD)
+    except subprocess.TimeoutExpired:
+        if not _signal_group(proc.pid, signal.SIGKILL):
+            proc.kill()
+        proc.wait()
+
+
+async def run_command(cmd, timeout=None, label=None, check=True, capture_output=True, trace_attrs=None):
+    """Run an external tool without blocking the event loop.
+
+    The child gets its own process group so a timeout or cancellation kills it and
+    any helpers it started (yt-dlp spawns ffmpeg). Raises subprocess.TimeoutExpired
+    and subprocess.CalledProcessError like subprocess.run. trace_attrs are added to
+    the command's span.
+    """
+    output = subprocess.PIPE if capture_output else None
+    with span(label or cmd[0], cat='command', tool=cmd[0], **(trace_attrs or {})) as attrs:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=output,
+            stderr=output,
+            start_new_session=True)
+
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            print(f"{label or cmd[0]} timed out after {timeout:.0f}s, killing it")
+            await kill_process_tree(proc)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            await kill_process_tree(proc)
+            raise
+        attrs['returncode'] = proc.returncode
+
+    stdout = stdout.decode(errors='replace') if stdout is not None else None
+    stderr = stderr.decode(errors='replace') if stderr is not None else None
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(
+            proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def _stage_entry(conn, func, args, kwargs):
+    """Child side of run_python_stage."""
+    # Imported here: ffmpeg_runner imports this module
+    from ffmpeg_runner import monitor
+
+    # New session so ffmpeg children of this stage die with it
+    os.setsid()
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            conn.send(message)
+
+    def relay(event):
+        try:
+            send(('encode', event))
+        except OSError:
+            pass  # Parent stopped listening; the stage is being torn down
+
+    # Encodes of this stage show up in the parent's monitor (and the daemon's /encoders)
+    monitor.relay = relay
+    try:
+        send(('ok', func(*args, **kwargs)))
+    except BaseException as e:
+        send(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        monitor.relay = None
+        conn.close()
+
+
+# Imported once by the forkserver, so stage processes start with them already loaded
+STAGE_PRELOAD = ['__main__', 'cv2', 'mediapipe', 'face_tracker']
+
+# Chosen on first use by get_stage_context()
+_stage_context = None
+
+
+def use_forkserver(preload=STAGE_PRELOAD):
+    """Start Python stages from a forkserver that has already imported the preload modules.
+
+    Stage processes are then forked from a warm interpreter instead of re-importing
+    cv2 and mediapipe each time. Call before the first stage starts.
+    """
+    global _stage_context
+    ctx = multiprocessing.get_context('forkserver')
+    ctx.set_forkserver_preload(list(preload))
+    _stage_context = ctx
+    return ctx
+
+
+def get_stage_context():
+    """Multiprocessing context for Python stages.
+
+    A preloaded forkserver where the platform has one, spawn elsewhere. Neither forks
+    the parent's running event loop.
+    """
+    global _stage_context
+    if _stage_context is None:
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            use_forkserver()
+        else:
+            _stage_context = multiprocessing.get_context('spawn')
+    return _stage_context
+
+
+def warm_stage_workers():
+    """Start the forkserver now, so its imports overlap other work instead of the first stage."""
+    if get_stage_context().get_start_method() == 'forkserver':
+        from multiprocessing import forkserver
+        forkserver.ensure_running()
+
+
+async def run_python_stage(func, *args, timeout=None, label=None, **kwargs):
+    """Run a CPU-heavy Python function in its own killable process and await its result."""
+    with span(label or func.__name__, cat='process', function=func.__name__) as attrs:
+        result = await _run_python_stage(func, args, kwargs, timeout, label)
+        attrs['ok'] = bool(result)
+        return result
+
+
+def _receive(conn, encodes):
+    """Block until the child's result arrives; None if it exited without sending one.
+
+    Encode events sent before the result are applied to this process's monitor.
+    """
+    from ffmpeg_runner import monitor
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return None  # Child died before reporting a (complete) result
+        if message[0] != 'encode':
+            return message
+        monitor.apply_remote(message[1], encodes)
+
+
+async def _run_python_stage(func, args, kwargs, timeout, label):
+    ctx = get_stage_context()
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_stage_entry, args=(
+        child_conn, func, args, kwargs))
+    proc.start()
+    child_conn.close()
+
+    loop = asyncio.get_running_loop()
+    # Read while the child runs: a result larger than the pipe buffer blocks the child
+    # in send() until it is read. The read ends with EOF if the child dies instead.
+    encodes = {}
+    reading = loop.run_in_executor(None, _receive, parent_conn, encodes)
+    result = None
+    try:
+        result = await asyncio.wait_for(asyncio.shield(reading), timeout)
+    except asyncio.TimeoutError:
+        print(f"{label or func.__name__} timed out after {timeout:.0f}s, killing it")
+        raise subprocess.TimeoutExpired(label or func.__name__, timeout)
+    finally:
+        if proc.is_alive():
+            await loop.run_in_executor(None, proc.join, KILL_GRACE_PERIOD if result is not None else 0)
+        if proc.is_alive():
+            if not _signal_group(proc.pid, signal.SIGTERM):
+                proc.terminate()
+            await loop.run_in_executor(None, proc.join, KILL_GRACE_PERIOD)
+            if proc.is_alive():
+                if not _signal_group(proc.pid, signal.SIGKILL):
+                    proc.kill()
+        await loop.run_in_executor(None, proc.join)
+        # The killed child's end of the pipe is closed now, so the read has finished
+        await asyncio.wait([reading], timeout=KILL_GRACE_PERIOD)
+        parent_conn.close()
+        from ffmpeg_runner import monitor
+        monitor.drop_remote(encodes)
+
+    if result is None:
+        raise RuntimeError(
+            f"{label or func.__name__} exited with code {proc.exitcode}")
+    status, value = result
+    if status == 'error':
+        raise RuntimeError(f"{label or func.__name__} failed: {value}")
+    return value
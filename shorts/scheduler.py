@@ -0,0 +1,162 @@
+import asyncio
+import os
+import time
+from tracing import span
+
+
+def stage_budgets(total_cpus=None):
+    """CPU budget per stage kind, sized so a few concurrent stages fill the machine."""
+    total_cpus = total_cpus or os.cpu_count() or 4
+    encode_threads = max(1, min(4, total_cpus // 4))
+    return {
+        'download': encode_threads,  # yt-dlp + precise-cut re-encode
+        'detect': 1,                 # MediaPipe runs single-threaded per frame
+        'render': encode_threads,    # crop loop + libx264 mux
+        'subtitle': encode_threads,  # libass burn-in + libx264
+        'cleanup': 0,
+    }
+
+
+class Stage:
+    """One node of the job DAG. func is a coroutine function."""
+
+    def __init__(self, key, func, args=(), kwargs=None, cpus=1, deps=(), priority=0, always=False):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.cpus = cpus
+        self.deps = tuple(deps)
+        self.priority = priority
+        self.always = always  # run once deps finish, even if they failed (cleanup)
+        self.result = None
+        self.status = 'pending'  # pending, running, done, failed, skipped
+        self.elapsed = None
+
+
+class StageScheduler:
+    """Run a DAG of stages while keeping the sum of their CPU budgets near the core count.
+
+    A stage runs once all its dependencies succeeded and enough budget is free. Stages
+    with a higher priority go first, so started segments finish before new ones begin.
+    A stage fails if it raises or returns a falsy value; its dependents are skipped
+    unless they were added with always=True. Stages may add further stages while
+    run() is in progress (e.g. an analysis stage queueing its segments).
+    """
+
+    def __init__(self, total_cpus=None):
+        self.total_cpus = total_cpus or os.cpu_count() or 4
+        self.stages = {}
+        self._wakeup = None
+
+    def add(self, key, func, *args, cpus=1, deps=(), priority=0, always=False, **kwargs):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {key} depends on unknown stage {dep}")
+        self.stages[key] = Stage(key, func, args, kwargs,
+                                 min(cpus, self.total_cpus), deps, priority, always)
+        self.wake()
+        return key
+
+    def wake(self):
+        """Make a running run() look for ready stages again (after add() from outside a stage)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def discard(self, prefix):
+        """Forget finished stages whose key starts with prefix, so a long-lived scheduler stays small."""
+        for key in [key for key, stage in self.stages.items()
+                    if key.startswith(prefix) and stage.status not in ('pending', 'running')]:
+            del self.stages[key]
+
+    def _ready(self):
+        ready = []
+        changed = True
+        while changed:
+            # Repeat so skips cascade down the whole DAG in one call
+            changed = False
+            ready = []
+            for stage in self.stages.values():
+                if stage.status != 'pending':
+                    continue
+                dep_states = [self.stages[dep].status for dep in stage.deps]
+                if any(state in ('pending', 'running') for state in dep_states):
+                    continue
+                if stage.always or all(state == 'done' for state in dep_states):
+                    ready.append(stage)
+                else:
+                    stage.status = 'skipped'
+                    changed = True
+        ready.sort(key=lambda stage: -stage.priority)
+        return ready
+
+    async def _run_stage(self, stage):
+        stage_start = time.time()
+        try:
+            with span(stage.key, cat='stage', cpus=stage.cpus) as attrs:
+                result = await stage.func(*stage.args, **stage.kwargs)
+                attrs['ok'] = bool(result)
+                return result
+        finally:
+            stage.elapsed = time.time() - stage_start
+
+    async def run(self, on_complete=None, stop=None):
+        """Execute all stages on the running event loop and return {key: result}.
+
+        on_complete(stage) is called as each stage ends. Without stop, run() returns once
+        no stage is left; with an asyncio.Event it keeps waiting for new stages until the
+        event is set and the running stages finish. Cancelling run() cancels every
+        running stage, which kills their child processes.
+        """
+        free_cpus = self.total_cpus
+        running = {}
+        self._wakeup = asyncio.Event()
+
+        async def wait_for_stop():
+            await stop.wait()
+            self.wake()
+
+        stop_watcher = asyncio.ensure_future(wait_for_stop()) if stop else None
+
+        try:
+            while True:
+                self._wakeup.clear()
+                for stage in self._ready():
+                    # Always let one stage run even if its budget exceeds what is free
+                    if stage.cpus > free_cpus and running:
+                        continue
+                    stage.status = 'running'
+                    free_cpus -= stage.cpus
+                    running[asyncio.ensure_future(
+                        self._run_stage(stage))] = stage
+
+                if not running and (stop is None or stop.is_set()):
+                    break
+
+                wakeup = asyncio.ensure_future(self._wakeup.wait())
+                done, _ = await asyncio.wait(
+                    [*running, wakeup], return_when=asyncio.FIRST_COMPLETED)
+                wakeup.cancel()
+                for task in done:
+                    if task is wakeup:
+                        continue
+                    stage = running.pop(task)
+                    free_cpus += stage.cpus
+                    try:
+                        stage.result = task.result()
+                        stage.status = 'done' if stage.result else 'failed'
+                    except Exception as e:
+                        print(f"Stage {stage.key} failed: {e}")
+                        stage.status = 'failed'
+                    if on_complete:
+                        on_complete(stage)
+        finally:
+            self._wakeup = None
+            if stop_watcher:
+                stop_watcher.cancel()
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return {key: stage.result for key, stage in self.stages.items()}
@@ -1,5 +1,6 @@
 import re
 from datetime import timedelta
+from transcript import as_transcript
 
 
 def format_timestamp(seconds):
@@ -27,10 +28,8 @@ def create_word_by_word_subtitle_file(transcript_data, start_time, end_time, out
         counter = 1
 
         # Filter transcript entries within our segment
-        segment_transcript = [
-            entry for entry in transcript_data
-            if entry['start'] >= start_time and entry['start'] < end_time
-        ]
+        segment_transcript = as_transcript(
+            transcript_data).between(start_time, end_time)
 
         for entry in segment_transcript:
             # Calculate relative time within the segment
@@ -0,0 +1,202 @@
+"""Structured timing spans written as JSON lines, with a Chrome trace exporter.
+
+Tracing is off unless SHORTS_TRACE names a file (or enable() is called). Each span
+becomes one line:
+    {"name": "0/render:2", "cat": "stage", "ts": 1700000000.1, "dur": 12.4,
+     "pid": 4242, "tid": 1401, "status": "ok", "attrs": {...}}
+
+Stage processes inherit SHORTS_TRACE and append to the same file.
+
+Usage:
+    python tracing.py trace.jsonl -o trace.json   # open in chrome://tracing or Perfetto
+    python tracing.py trace.jsonl --summary
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+TRACE_PATH = os.getenv("SHORTS_TRACE")
+
+# Append-only descriptor, reopened after a fork
+_fd = None
+_fd_pid = None
+
+
+def enable(path):
+    """Trace to path from now on, in this process and in stage processes started later."""
+    global TRACE_PATH
+    TRACE_PATH = os.path.abspath(path)
+    os.environ["SHORTS_TRACE"] = TRACE_PATH
+
+
+def enabled():
+    return TRACE_PATH is not None
+
+
+def write_event(event):
+    """Append one event as a single write, so lines from concurrent processes never interleave."""
+    global _fd, _fd_pid
+    if _fd is None or _fd_pid != os.getpid():
+        _fd = os.open(TRACE_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        _fd_pid = os.getpid()
+    os.write(_fd, (json.dumps(event, default=str) + '\n').encode('utf-8'))
+
+
+@contextlib.contextmanager
+def span(name, cat='stage', **attrs):
+    """Time the enclosed block. Yields the attrs dict so the block can add results to it.
+
+    Works around awaits too; concurrent async spans simply overlap in the timeline.
+    """
+    if TRACE_PATH is None:
+        yield attrs
+        return
+
+    start = time.time()
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield attrs
+    except asyncio.CancelledError:
+        status = 'cancelled'
+        raise
+    except BaseException as e:
+        status = 'error'
+        attrs['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        write_event({
+            'name': name,
+            'cat': cat,
+            'ts': start,
+            'dur': time.perf_counter() - started,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'status': status,
+            'attrs': attrs,
+        })
+
+
+def load_events(path):
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass  # A process killed mid-write leaves a partial last line
+    return events
+
+
+def assign_lanes(events):
+    """Give overlapping spans of one thread separate lanes, since async stages share a thread.
+
+    Returns {index of event: lane number}; spans that nest inside another keep its lane.
+    """
+    lanes = {}
+    by_thread = {}
+    for i, event in enumerate(events):
+        by_thread.setdefault((event['pid'], event['tid']), []).append(i)
+
+    for indices in by_thread.values():
+        indices.sort(key=lambda i: (events[i]['ts'], -events[i]['dur']))
+        lane_spans = []  # stack of open spans per lane
+        for i in indices:
+            start = events[i]['ts']
+            end = start + events[i]['dur']
+            for lane, open_spans in enumerate(lane_spans):
+                # Drop spans that ended before this one starts
+                while open_spans and open_spans[-1] <= start:
+                    open_spans.pop()
+                if not open_spans or end <= open_spans[-1]:
+                    open_spans.append(end)
+                    lanes[i] = lane
+                    break
+            else:
+                lane_spans.append([end])
+                lanes[i] = len(lane_spans) - 1
+    return lanes
+
+
+def to_chrome_trace(events):
+    """Convert span events to the Chrome trace event format (complete "X" events, microseconds)."""
+    if not events:
+        return {'traceEvents': []}
+
+    origin = min(event['ts'] for event in events)
+    lanes = assign_lanes(events)
+    lane_ids = {}
+    trace_events = []
+    for i, event in enumerate(events):
+        lane_key = (event['pid'], event['tid'], lanes[i])
+        if lane_key not in lane_ids:
+            lane_ids[lane_key] = len(lane_ids) + 1
+            trace_events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': event['pid'], 'tid': lane_ids[lane_key],
+                'args': {'name': f"thread {event['tid']} lane {lanes[i]}"}
+            })
+        trace_events.append({
+            'name': event['name'],
+            'cat': event['cat'],
+            'ph': 'X',
+            'ts': (event['ts'] - origin) * 1e6,
+            'dur': event['dur'] * 1e6,
+            'pid': event['pid'],
+            'tid': lane_ids[lane_key],
+            'args': dict(event.get('attrs', {}), status=event['status'])
+        })
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+
+def stage_kind(name):
+    """Strip job prefixes and segment ids: "3/render:2" -> "render"."""
+    return re.sub(r':\d+$', '', name.rsplit('/', 1)[-1])
+
+
+def summarize(events):
+    """Count, total and max seconds per span kind, slowest total first."""
+    summary = {}
+    for event in events:
+        kind = (event['cat'], stage_kind(event['name']))
+        entry = summary.setdefault(kind, {'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0})
+        entry['count'] += 1
+        entry['total'] += event['dur']
+        entry['max'] = max(entry['max'], event['dur'])
+        entry['errors'] += event['status'] != 'ok'
+    return sorted(summary.items(), key=lambda item: -item[1]['total'])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert or summarize a JSON-lines trace.")
+    parser.add_argument('trace_file')
+    parser.add_argument('-o', '--output', default=None,
+                        help="Write a Chrome trace JSON file")
+    parser.add_argument('--summary', action='store_true',
+                        help="Print time per span kind")
+    args = parser.parse_args()
+
+    events = load_events(args.trace_file)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(to_chrome_trace(events), f)
+        print(f"Wrote {len(events)} spans to {args.output}")
+
+    if args.summary or not args.output:
+        if events:
+            wall = max(e['ts'] + e['dur'] for e in events) - min(e['ts'] for e in events)
+            print(f"{len(events)} spans over {wall:.2f}s wall time")
+        print(f"{'kind':<30}{'count':>7}{'total s':>10}{'max s':>9}{'errors':>8}")
+        for (cat, kind), entry in summarize(events):
+            print(f"{cat + ':' + kind:<30}{entry['count']:>7}{entry['total']:>10.2f}"
+                  f"{entry['max']:>9.2f}{entry['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import json
+import re
+import numpy as np
+
+
+class Transcript:
+    """Columnar transcript: start/duration arrays plus text offsets into one UTF-8 buffer.
+
+    Entries are kept sorted by start time so time-range lookups are binary searches,
+    and slices are views over the same arrays rather than copies.
+    """
+
+    def __init__(self, starts, durations, offsets, text_buffer):
+        self.starts = starts
+        self.durations = durations
+        self.offsets = offsets          # len(starts) + 1 offsets into text_buffer
+        self.text_buffer = text_buffer  # uint8 array of UTF-8 text
+        self._longest = None            # Longest duration, computed on first use
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Build from the list-of-dicts format returned by YouTubeTranscriptApi."""
+        entries = sorted(entries, key=lambda entry: entry['start'])
+        encoded = [entry['text'].encode('utf-8') for entry in entries]
+
+        starts = np.array([entry['start']
+                          for entry in entries], dtype=np.float64)
+        durations = np.array([entry['duration']
+                             for entry in entries], dtype=np.float64)
+        offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        text_buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+        return cls(starts, durations, offsets, text_buffer)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError("Transcript slices must be contiguous")
+            lo, hi, _ = index.indices(len(self))
+            hi = max(lo, hi)
+            return Transcript(self.starts[lo:hi], self.durations[lo:hi],
+                              self.offsets[lo:hi + 1], self.text_buffer)
+
+        if index < 0:
+            index += len(self)
+        return {
+            'start': float(self.starts[index]),
+            'duration': float(self.durations[index]),
+            'text': self.text(index)
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def text(self, index):
+        """Decode the text of one entry."""
+        return bytes(self.text_buffer[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+
+    def index_range(self, start_time, end_time):
+        """Indices (lo, hi) of entries whose start falls in [start_time, end_time)."""
+        lo = int(np.searchsorted(self.starts, start_time, side='left'))
+        hi = int(np.searchsorted(self.starts, end_time, side='left'))
+        return lo, max(lo, hi)
+
+    def between(self, start_time, end_time):
+        """Zero-copy view of the entries starting in [start_time, end_time)."""
+        lo, hi = self.index_range(start_time, end_time)
+        return self[lo:hi]
+
+    def overlapping(self, start_time, end_time):
+        """Zero-copy view of the entries overlapping [start_time, end_time), including
+        any that start before start_time but run into it."""
+        if self._longest is None:
+            self._longest = float(self.durations.max()) if len(self) else 0.0
+        return self.between(start_time - self._longest, end_time)
+
+    def shifted(self, offset):
+        """Copy of the timing with starts moved by offset; the text buffer is shared."""
+        return Transcript(self.starts + offset, self.durations, self.offsets, self.text_buffer)
+
+    def to_entries(self):
+        """Convert back to a list of dicts."""
+        return list(self)
+
+
+def as_transcript(data):
+    """Accept a Transcript or a list of entry dicts."""
+    if isinstance(data, Transcript):
+        return data
+    return Transcript.from_entries(data)
+
+
+def load_transcript_file(path, last_duration=3.0):
+    """Load a transcript saved as JSON entries or as "[start] text" lines (like transcript.txt).
+
+    Line files carry no durations, so each entry lasts until the next one starts.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    if content.lstrip().startswith('['):
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            pass  # "[0.199] text" lines also start with a bracket
+
+    entries = []
+    for line in content.splitlines():
+        match = re.match(r'\[([\d.]+)\]\s*(.*)', line)
+        if match:
+            entries.append(
+                {'start': float(match.group(1)), 'duration': last_duration, 'text': match.group(2)})
+
+    for entry, next_entry in zip(entries, entries[1:]):
+        entry['duration'] = max(0.0, next_entry['start'] - entry['start'])
+
+    return entries
@@ -1,32 +1,72 @@
+import asyncio
 import os
 import subprocess
 import time
 import uuid
 from subtitle_generator import create_word_by_word_subtitle_file
-from face_tracker import track_face_and_crop_mediapipe
+from face_tracker import track_face_and_crop_mediapipe, encode_args
+from transcript import as_transcript
+from ffmpeg_runner import run_ffmpeg
+from workspace import segment_workspace
+
+# Outputs the final render can emit from one decode, beside the full-quality short.
+# height/fps/seconds shrink a rendition; args are its output codec options.
+RENDITION_LADDER = {
+    'full': {'ext': '.mp4', 'audio': True, 'args': ['-c:a', 'copy']},
+    'preview': {'ext': '.mp4', 'audio': True, 'height': 480,
+                'args': ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '30',
+                         '-c:a', 'aac', '-b:a', '64k', '-movflags', '+faststart']},
+    'webp': {'ext': '.webp', 'audio': False, 'height': 240, 'fps': 10, 'seconds': 3,
+             'args': ['-c:v', 'libwebp', '-loop', '0', '-quality', '60']},
+    'gif': {'ext': '.gif', 'audio': False, 'height': 240, 'fps': 10, 'seconds': 3, 'palette': True,
+            'args': ['-loop', '0']},
+}
+
+
+def parse_renditions(value):
+    """Rendition names from a comma-separated list; 'full' always comes first."""
+    names = ['full'] + [name.strip() for name in value.split(',') if name.strip() not in ('', 'full')]
+    unknown = [name for name in names if name not in RENDITION_LADDER]
+    if unknown:
+        raise ValueError(f"Unknown renditions {', '.join(unknown)}, choose from {', '.join(RENDITION_LADDER)}")
+    return names
+
+
+# Renditions produced for every short, e.g. SHORTS_RENDITIONS=preview,webp
+RENDITIONS = parse_renditions(os.getenv("SHORTS_RENDITIONS", ""))
 
 
 def extract_segment(video_path, start_time, end_time, output_path):
     """Extract a segment from a video while preserving audio."""
+    return asyncio.run(extract_segment_async(video_path, start_time, end_time, output_path))
+
+
+async def extract_segment_async(video_path, start_time, end_time, output_path, threads=None, timeout=None):
+    """Cut a segment out of a local video with the same encoding as downloaded segments."""
     cmd = [
         'ffmpeg', '-y',
+        '-ss', str(start_time),  # Input seeking, frame-accurate when re-encoding
         '-i', video_path,
-        '-ss', str(start_time),
         '-t', str(end_time - start_time),
-        '-c:v', 'h264',  # Specify video codec
+        '-c:v', 'libx264',
+        '-preset', 'medium',
+        '-crf', '18',
         '-c:a', 'aac',   # Specify audio codec
         '-b:a', '192k',  # Good audio quality
         '-ac', '2',      # Stereo audio
-        output_path
+        '-ar', '48000',
+        '-vsync', 'cfr',
     ]
+    if threads:
+        cmd += ['-threads', str(threads)]
+    cmd.append(output_path)
 
     try:
-        result = subprocess.run(
-            cmd, check=True, capture_output=True, text=True)
-        return True
-    except subprocess.CalledProcessError as e:
+        await run_ffmpeg(cmd, duration=end_time - start_time, timeout=timeout, label='ffmpeg segment extract')
+        return output_path
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
         print(f"Error extracting segment: {e}")
-        if e.stderr:
+        if getattr(e, 'stderr', None):
             print(f"FFMPEG error: {e.stderr}")
         return False
 
@@ -53,68 +93,182 @@ def add_subtitles(video_path, subtitle_path, output_path, font_size=22):
         return False
 
 
-def process_segment(video_path, segment, transcript_data, aspect_ratio="9:16", output_path="output.mp4",
-                    font_size=42, words_per_subtitle=2, segment_id=1, total_segments=1, temp_dir=None):
-    """Process a single segment into a complete short video."""
+def create_segment_subtitles(segment, transcript_data, subtitle_file, words_per_subtitle=2, presliced=False):
+    """Write the word-by-word SRT for a segment, timed relative to the segment start.
+
+    Pass presliced=True when transcript_data already holds only the segment's entries.
+    """
+    # Get segment timestamps (these are used for subtitles)
+    start_time = float(segment.get('start_time', 0))
+    end_time = float(segment.get('end_time', start_time + 30))
+
+    # For creating subtitles, we need to adjust times to be relative to the segment
+    # Since we're downloading just the segment, the video starts at 0, not at start_time
+    local_start_time = 0
+    local_end_time = end_time - start_time
+
+    # Get transcript for this time range
+    segment_transcript = as_transcript(transcript_data)
+    if not presliced:
+        segment_transcript = segment_transcript.between(start_time, end_time)
+    segment_transcript = segment_transcript.shifted(-start_time)  # Adjust to start at 0
+
+    return create_word_by_word_subtitle_file(
+        segment_transcript,
+        local_start_time,  # now 0
+        local_end_time,    # relative duration
+        subtitle_file,
+        words_per_subtitle
+    )
+
+
+def burn_subtitles(video_path, subtitle_file, output_path, font_size=42, segment_id=1, threads=None, timeout=None,
+                   duration=None, draft=False):
+    """Burn the SRT into the tracked video."""
+    return asyncio.run(burn_subtitles_async(video_path, subtitle_file, output_path, font_size, segment_id, threads, timeout,
+                                            duration, draft))
+
+
+async def burn_subtitles_async(video_path, subtitle_file, output_path, font_size=42, segment_id=1, threads=None, timeout=None,
+                               duration=None, draft=False):
+    """Burn the SRT into the tracked video without blocking the event loop.
+
+    duration (seconds) only feeds the progress percentage and ETA; draft encodes with
+    the fastest preset.
+    """
+    cmd = [
+        'ffmpeg', '-y',
+        '-i', video_path,
+        '-vf', f"subtitles={subtitle_file}:force_style='FontName=Arial,FontSize={font_size},PrimaryColour=&HFFFFFF&,OutlineColour=&H000000&,BorderStyle=1,Outline=0,Shadow=0,Alignment=2'",
+        '-c:a', 'copy',  # Copy audio stream without re-encoding
+        '-vsync', 'cfr',  # Constant frame rate for better A/V sync
+    ]
+    if draft:
+        cmd += encode_args(draft=True)
+    if threads:
+        cmd += ['-threads', str(threads)]
+    cmd.append(output_path)
+
     try:
-        process_start_time = time.time()
+        await run_ffmpeg(cmd, duration=duration, timeout=timeout, label=f"[Segment {segment_id}] subtitle burn")
+        return True
+    except subprocess.TimeoutExpired as e:
+        print(f"[Segment {segment_id}] Error adding subtitles: {e}")
+        return False
+    except subprocess.CalledProcessError as e:
+        print(f"[Segment {segment_id}] Error adding subtitles: {e}")
+        if e.stderr:
+            print(f"FFMPEG error: {e.stderr}")
+        return False
+
+
+def rendition_path(output_path, name):
+    """Where a rendition of the short at output_path goes: short_1.mp4, short_1_preview.mp4, short_1_gif.gif."""
+    if name == 'full':
+        return output_path
+    return f"{os.path.splitext(output_path)[0]}_{name}{RENDITION_LADDER[name]['ext']}"
+
+
+def rendition_filtergraph(subtitle_filter, names):
+    """Burn the subtitles once, then split into one labelled stream [vN] per rendition."""
+    chains = [f"[0:v]{subtitle_filter},split={len(names)}" + ''.join(f"[s{i}]" for i in range(len(names)))]
+    for i, name in enumerate(names):
+        rendition = RENDITION_LADDER[name]
+        filters = []
+        if rendition.get('seconds'):
+            filters.append(f"trim=duration={rendition['seconds']}")
+        if rendition.get('fps'):
+            filters.append(f"fps={rendition['fps']}")
+        if rendition.get('height'):
+            filters.append(f"scale=-2:{rendition['height']}:flags=lanczos")
+        chain = ','.join(filters) or 'null'
+        if rendition.get('palette'):
+            # GIF needs its own palette to look acceptable
+            chains.append(f"[s{i}]{chain},split[g{i}][p{i}];[p{i}]palettegen[pal{i}];[g{i}][pal{i}]paletteuse[v{i}]")
+        else:
+            chains.append(f"[s{i}]{chain}[v{i}]")
+    return ';'.join(chains)
+
+
+async def burn_subtitle_renditions_async(video_path, subtitle_file, outputs, font_size=42, segment_id=1, threads=None,
+                                         timeout=None, duration=None, draft=False):
+    """Burn the SRT and write every rendition in outputs ({name: path}) from one decode.
+
+    A single ffmpeg process decodes the tracked video and renders the subtitles once;
+    a split filter feeds each rendition's scaler and encoder.
+    """
+    if list(outputs) == ['full']:
+        return await burn_subtitles_async(video_path, subtitle_file, outputs['full'], font_size, segment_id,
+                                          threads, timeout, duration, draft)
+
+    names = list(outputs)
+    subtitle_filter = f"subtitles={subtitle_file}:force_style='FontName=Arial,FontSize={font_size},PrimaryColour=&HFFFFFF&,OutlineColour=&H000000&,BorderStyle=1,Outline=0,Shadow=0,Alignment=2'"
+    cmd = [
+        'ffmpeg', '-y',
+        '-i', video_path,
+        '-filter_complex', rendition_filtergraph(subtitle_filter, names),
+        '-vsync', 'cfr',  # Constant frame rate for better A/V sync
+    ]
+    for i, name in enumerate(names):
+        rendition = RENDITION_LADDER[name]
+        cmd += ['-map', f"[v{i}]"]
+        cmd += ['-map', '0:a?'] if rendition['audio'] else ['-an']
+        cmd += rendition['args']
+        if threads:
+            cmd += ['-threads', str(threads)]
+        cmd.append(outputs[name])
+
+    try:
+        await run_ffmpeg(cmd, duration=duration, timeout=timeout,
+                         label=f"[Segment {segment_id}] subtitle burn ({', '.join(names)})")
+        return True
+    except subprocess.TimeoutExpired as e:
+        print(f"[Segment {segment_id}] Error rendering renditions: {e}")
+        return False
+    except subprocess.CalledProcessError as e:
+        print(f"[Segment {segment_id}] Error rendering renditions: {e}")
+        if e.stderr:
+            print(f"FFMPEG error: {e.stderr}")
+        return False
+
+
+def process_segment(video_path, segment, transcript_data, aspect_ratio="9:16", output_path="output.mp4",
+                    font_size=42, words_per_subtitle=2, segment_id=1, total_segments=1, temp_dir=None, threads=None,
+                    renditions=None):
+    """Process a single segment into a complete short video.
 
-        # Get segment timestamps (these are used for subtitles)
-        start_time = float(segment.get('start_time', 0))
-        end_time = float(segment.get('end_time', start_time + 30))
+    renditions (default RENDITIONS) lists the outputs written next to output_path,
+    all from one decode of the tracked video.
+    """
+    workspace = None
+    if temp_dir is None:
+        workspace = segment_workspace(
+            f"segment{segment_id}", float(segment['end_time']) - float(segment['start_time']))
+        temp_dir = workspace.root
 
-        # For creating subtitles, we need to adjust times to be relative to the segment
-        # Since we're downloading just the segment, the video starts at 0, not at start_time
-        local_start_time = 0
-        local_end_time = end_time - start_time
+    try:
+        process_start_time = time.time()
 
         # Create subtitle file
         subtitle_file = f"{temp_dir}/subtitles.srt"
         print(f"[Segment {segment_id}] Creating word-by-word subtitles...")
-
-        # Get transcript for this time range
-        segment_transcript = [
-            {
-                'start': entry['start'] - start_time,  # Adjust to start at 0
-                'duration': entry['duration'],
-                'text': entry['text']
-            }
-            for entry in transcript_data
-            if entry['start'] >= start_time and entry['start'] < end_time
-        ]
-
-        create_word_by_word_subtitle_file(
-            segment_transcript,
-            local_start_time,  # now 0
-            local_end_time,    # relative duration
-            subtitle_file,
-            words_per_subtitle
-        )
+        create_segment_subtitles(
+            segment, transcript_data, subtitle_file, words_per_subtitle)
 
         # Track faces and apply aspect ratio
         tracked_segment = f"{temp_dir}/tracked_segment.mp4"
         print(f"[Segment {segment_id}] Applying face tracking...")
-        if not track_face_and_crop_mediapipe(video_path, tracked_segment, aspect_ratio, segment_id, total_segments):
+        duration = float(segment['end_time']) - float(segment['start_time'])
+        max_shards = max(1, (os.cpu_count() or 1) // (threads or 1))
+        if not track_face_and_crop_mediapipe(video_path, tracked_segment, aspect_ratio, segment_id, total_segments, threads,
+                                             duration=duration, max_shards=max_shards):
             raise Exception("Failed face tracking")
 
         # Add subtitles
         print(f"[Segment {segment_id}] Adding subtitles...")
-        cmd = [
-            'ffmpeg', '-y',
-            '-i', tracked_segment,
-            '-vf', f"subtitles={subtitle_file}:force_style='FontName=Arial,FontSize={font_size},PrimaryColour=&HFFFFFF&,OutlineColour=&H000000&,BorderStyle=1,Outline=0,Shadow=0,Alignment=2'",
-            '-c:a', 'copy',  # Copy audio stream without re-encoding
-            '-vsync', 'cfr',  # Constant frame rate for better A/V sync
-            output_path
-        ]
-
-        try:
-            result = subprocess.run(
-                cmd, check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError as e:
-            print(f"[Segment {segment_id}] Error adding subtitles: {e}")
-            if e.stderr:
-                print(f"FFMPEG error: {e.stderr}")
+        outputs = {name: rendition_path(output_path, name) for name in renditions or RENDITIONS}
+        if not asyncio.run(burn_subtitle_renditions_async(tracked_segment, subtitle_file, outputs, font_size,
+                                                          segment_id, threads, duration=duration)):
             return False
 
         process_end_time = time.time()
@@ -125,3 +279,6 @@ def process_segment(video_path, segment, transcript_data, aspect_ratio="9:16", o
     except Exception as e:
         print(f"[Segment {segment_id}] Error processing segment: {e}")
         return False
+    finally:
+        if workspace:
+            workspace.cleanup()
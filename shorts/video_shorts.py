@@ -3,11 +3,23 @@ import yt_dlp
 from youtube_transcript_api import YouTubeTranscriptApi
 import json
 import os
+import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 import mediapipe as mp
 from datetime import datetime, timedelta
+from media_probe import probe, video_dimensions
+
+# Every piece of a compilation is encoded with this one profile, so joining them is a
+# pure stream copy: same size, frame rate, pixel format, GOP, timescale and audio layout
+COMPILATION_FPS = 30
+COMPILATION_GOP = 60  # Fixed 2 s GOP, no scene-cut keyframes
+COMPILATION_TIMESCALE = 90000
+COMPILATION_SAMPLE_RATE = 48000
+COMPILATION_CHANNELS = 2
 
 
 def get_video_id(youtube_url):
@@ -220,24 +232,12 @@ def get_aspect_ratio_choice():
 
 
 def get_video_dimensions(input_file):
-    """Get video dimensions using ffprobe"""
-    cmd = [
-        'ffprobe',
-        '-v', 'error',
-        '-select_streams', 'v:0',
-        '-show_entries', 'stream=width,height',
-        '-of', 'csv=p=0',
-        input_file
-    ]
-
-    try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, check=True)
-        width, height = map(int, result.stdout.strip().split(','))
-        return width, height
-    except subprocess.CalledProcessError as e:
-        print(f"Error getting video dimensions: {e}")
+    """Get video dimensions from the cached ffprobe probe"""
+    dimensions = video_dimensions(input_file)
+    if dimensions is None:
+        print(f"Error getting video dimensions of {input_file}")
         return 1920, 1080  # Default fallback dimensions
+    return dimensions
 
 
 def apply_aspect_ratio(input_file, output_file, aspect_ratio):
@@ -297,6 +297,33 @@ def apply_aspect_ratio(input_file, output_file, aspect_ratio):
     return output_file
 
 
+def crop_dimensions(width, height, aspect_ratio):
+    """Size of the face-tracking crop window for a frame of width x height."""
+    if aspect_ratio == "9:16":
+        target_width = height * 9 // 16
+        target_height = height
+    elif aspect_ratio == "1:1":
+        target_width = min(width, height)
+        target_height = min(width, height)
+    elif aspect_ratio == "4:5":
+        target_width = height * 4 // 5
+        target_height = height
+    else:  # Default to 16:9
+        target_width = width
+        target_height = width * 9 // 16
+
+    if target_width > width:
+        # If calculated width exceeds available width, adjust dimensions
+        target_width = width
+        if aspect_ratio == "9:16":
+            target_height = width * 16 // 9
+        elif aspect_ratio == "4:5":
+            target_height = width * 5 // 4
+
+    # libx264 rejects odd frame sizes with 4:2:0 chroma (720 * 9 // 16 == 405)
+    return target_width - target_width % 2, target_height - target_height % 2
+
+
 def track_face_and_crop_mediapipe(input_file, output_file, aspect_ratio="9:16"):
     """Track faces using MediaPipe (much faster than OpenCV) and crop video to follow faces"""
     print(f"Processing segment with face tracking: {input_file}")
@@ -318,27 +345,7 @@ def track_face_and_crop_mediapipe(input_file, output_file, aspect_ratio="9:16"):
     fps = cap.get(cv2.CAP_PROP_FPS)
     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-    # Calculate target dimensions based on aspect ratio
-    if aspect_ratio == "9:16":
-        target_width = height * 9 // 16
-        target_height = height
-    elif aspect_ratio == "1:1":
-        target_width = min(width, height)
-        target_height = min(width, height)
-    elif aspect_ratio == "4:5":
-        target_width = height * 4 // 5
-        target_height = height
-    else:  # Default to 16:9
-        target_width = width
-        target_height = width * 9 // 16
-
-    if target_width > width:
-        # If calculated width exceeds available width, adjust dimensions
-        target_width = width
-        if aspect_ratio == "9:16":
-            target_height = width * 16 // 9
-        elif aspect_ratio == "4:5":
-            target_height = width * 5 // 4
+    target_width, target_height = crop_dimensions(width, height, aspect_ratio)
 
     # Setup video writer
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -434,8 +441,167 @@ def track_face_and_crop_mediapipe(input_file, output_file, aspect_ratio="9:16"):
     return True
 
 
-def create_shorts_ffmpeg(video_path, segments, transcript_data, aspect_ratio="9:16", output_path="shorts.mp4"):
-    """Create shorts video using ffmpeg with transcript overlay and custom aspect ratio"""
+def profile_args():
+    """Encoder options shared by every piece of a compilation."""
+    return [
+        '-c:v', 'libx264',
+        '-preset', 'medium',
+        '-crf', '20',
+        '-pix_fmt', 'yuv420p',
+        '-r', str(COMPILATION_FPS),
+        '-g', str(COMPILATION_GOP),
+        '-keyint_min', str(COMPILATION_GOP),
+        '-sc_threshold', '0',
+        '-video_track_timescale', str(COMPILATION_TIMESCALE),
+        '-c:a', 'aac',
+        '-b:a', '160k',
+        '-ar', str(COMPILATION_SAMPLE_RATE),
+        '-ac', str(COMPILATION_CHANNELS),
+    ]
+
+
+def profile_filter(width, height):
+    """Video filters normalizing a piece to the compilation size, frame rate and pixel format."""
+    return f"scale={width}:{height},setsar=1,fps={COMPILATION_FPS},format=yuv420p"
+
+
+def prepare_compilation_segment(video_path, seg, index, transcript_data, aspect_ratio, work_dir):
+    """Extract, face-track and write the subtitles of one segment.
+
+    Returns (raw_segment, face_tracked_segment, subtitle_file, duration) with the probed
+    duration of the tracked video, or None on failure.
+    """
+    try:
+        # Extract segment's start and end time
+        start = float(seg.get('start_time', 0))
+        end = float(seg.get('end_time', start + 30))
+
+        if end <= start:
+            print(
+                f"Warning: end_time {end} <= start_time {start} for segment {index+1}, using default duration")
+            end = start + 30
+
+        duration = end - start
+        print(f"\nProcessing segment {index+1} - Duration: {duration:.2f}s")
+
+        # 1. Extract segment from full video (fast operation using ffmpeg)
+        raw_segment = os.path.join(work_dir, f"segment_raw_{index}.mp4")
+        print(f"Extracting segment {index+1} from full video...")
+        cmd = [
+            'ffmpeg', '-y',
+            '-i', video_path,
+            '-ss', str(start),
+            '-t', str(duration),
+            '-c', 'copy',  # Copy without re-encoding for speed
+            raw_segment
+        ]
+        subprocess.run(cmd, check=True)
+
+        # 2. Create subtitle file for this specific segment
+        subtitle_file = os.path.join(work_dir, f"subtitles_{index}.srt")
+        create_subtitle_file(transcript_data, start, end, subtitle_file)
+
+        # 3. Track faces and crop to desired aspect ratio
+        # This only processes the extracted segment, not the full video
+        face_tracked_segment = os.path.join(work_dir, f"segment_face_tracked_{index}.mp4")
+        if not track_face_and_crop_mediapipe(raw_segment, face_tracked_segment, aspect_ratio):
+            return None
+
+        # The cut can be shorter than asked for (end past the video, keyframe snapping)
+        info = probe(face_tracked_segment)
+        if info and info['duration']:
+            duration = info['duration']
+        return raw_segment, face_tracked_segment, subtitle_file, duration
+
+    except Exception as e:
+        print(f"Error processing segment {index+1}: {e}")
+        return None
+
+
+def render_compilation_segment(prepared, index, size, work_dir, transition_duration=0):
+    """Subtitle one prepared segment and encode it with the compilation profile.
+
+    Returns the list of pieces [body] or, with a transition, [head, body, tail] where head
+    and tail are the transition_duration seconds the joins cross-fade. Returns None on failure.
+    """
+    raw_segment, face_tracked_segment, subtitle_file, duration = prepared
+    try:
+        # 4. Add subtitles, normalize to the compilation profile and take the audio back
+        # from the raw cut (the tracked video has none)
+        print(f"Adding subtitles to segment {index+1}...")
+        video_filter = (
+            f"[0:v]subtitles={subtitle_file}:force_style='FontName=Arial,FontSize=30,PrimaryColour=&HFFFFFF&,OutlineColour=&H000000&,BorderStyle=1,Outline=2,Shadow=1,Alignment=2',"
+            + profile_filter(*size))
+        cmd = ['ffmpeg', '-y', '-i', face_tracked_segment, '-i', raw_segment]
+        info = probe(raw_segment)
+        if info is None or info['audio']:
+            audio = '1:a:0'
+        else:
+            # Silence keeps the audio layout of every piece the same, so the concat can
+            # still copy streams
+            audio = '2:a:0'
+            cmd += ['-f', 'lavfi', '-t', str(duration),
+                    '-i', f"anullsrc=r={COMPILATION_SAMPLE_RATE}:cl={COMPILATION_CHANNELS}c"]
+        if not transition_duration:
+            body = os.path.join(work_dir, f"segment_final_{index}.mp4")
+            cmd += ['-filter_complex', video_filter + "[v]",
+                    '-map', '[v]', '-map', audio, *profile_args(), '-shortest', body]
+            subprocess.run(cmd, check=True)
+            return [body]
+
+        # Cut head and tail off in the same encode, so the joins can cross-fade without
+        # re-encoding the body
+        fade = transition_duration
+        pieces = [os.path.join(work_dir, f"segment_{part}_{index}.mp4") for part in ('head', 'body', 'tail')]
+        ranges = [f"0:{fade}", f"{fade}:{duration - fade}", f"{duration - fade}:{duration}"]
+        graph = [video_filter + ",split=3[v0][v1][v2]", f"[{audio}]asplit=3[a0][a1][a2]"]
+        for i, time_range in enumerate(ranges):
+            graph.append(f"[v{i}]trim={time_range},setpts=PTS-STARTPTS[vo{i}]")
+            graph.append(f"[a{i}]atrim={time_range},asetpts=PTS-STARTPTS[ao{i}]")
+        cmd += ['-filter_complex', ';'.join(graph)]
+        for i, piece in enumerate(pieces):
+            cmd += ['-map', f"[vo{i}]", '-map', f"[ao{i}]", *profile_args(), piece]
+        subprocess.run(cmd, check=True)
+        return pieces
+
+    except Exception as e:
+        print(f"Error processing segment {index+1}: {e}")
+        return None
+
+
+def compile_segment(video_path, seg, index, transcript_data, aspect_ratio, size, work_dir):
+    """Prepare and render one segment in a single job, for compilations without transitions."""
+    prepared = prepare_compilation_segment(video_path, seg, index, transcript_data,
+                                           aspect_ratio, work_dir)
+    return render_compilation_segment(prepared, index, size, work_dir) if prepared else None
+
+
+def render_transition(tail, head, output_file, transition="fade", transition_duration=0.5):
+    """Cross-fade the tail of one segment into the head of the next, in the compilation profile."""
+    cmd = [
+        'ffmpeg', '-y',
+        '-i', tail,
+        '-i', head,
+        '-filter_complex',
+        f"[0:v][1:v]xfade=transition={transition}:duration={transition_duration}:offset=0[v];"
+        f"[0:a][1:a]acrossfade=d={transition_duration}[a]",
+        '-map', '[v]', '-map', '[a]',
+        *profile_args(),
+        output_file
+    ]
+    subprocess.run(cmd, check=True)
+    return output_file
+
+
+def create_shorts_ffmpeg(video_path, segments, transcript_data, aspect_ratio="9:16", output_path="shorts.mp4",
+                         workers=None, transition=None, transition_duration=0.5):
+    """Create shorts video using ffmpeg with transcript overlay and custom aspect ratio.
+
+    Segments are rendered in parallel (workers processes) with one encoder profile, so
+    they are joined by stream copy. transition (an ffmpeg xfade name such as "fade")
+    cross-fades the joins; only those transition_duration seconds are re-encoded.
+    """
+    work_dir = tempfile.mkdtemp(prefix="shorts_compile_")
     try:
         if not segments or len(segments) == 0:
             print("No segments provided. Creating a default segment.")
@@ -445,111 +611,82 @@ def create_shorts_ffmpeg(video_path, segments, transcript_data, aspect_ratio="9:
                 "reason": "Default segment (first minute of video)"
             }]
 
-        # Create temporary files for each segment
-        temp_files = []
-        final_temp_files = []
-
-        for i, seg in enumerate(segments):
-            try:
-                # Extract segment's start and end time
-                start = float(seg.get('start_time', 0))
-                end = float(seg.get('end_time', start + 30))
-
-                if end <= start:
-                    print(
-                        f"Warning: end_time {end} <= start_time {start} for segment {i+1}, using default duration")
-                    end = start + 30
-
-                duration = end - start
-                print(
-                    f"\nProcessing segment {i+1}/{len(segments)} - Duration: {duration:.2f}s")
-
-                # 1. Extract segment from full video (fast operation using ffmpeg)
-                raw_segment = f"temp_segment_raw_{i}.mp4"
-                print(f"Extracting segment {i+1} from full video...")
-                cmd = [
-                    'ffmpeg', '-y',
-                    '-i', video_path,
-                    '-ss', str(start),
-                    '-t', str(duration),
-                    '-c', 'copy',  # Copy without re-encoding for speed
-                    raw_segment
-                ]
-                subprocess.run(cmd, check=True)
-                temp_files.append(raw_segment)
-
-                # 2. Create subtitle file for this specific segment
-                subtitle_file = f"subtitles_{i}.srt"
-                create_subtitle_file(
-                    transcript_data, start, end, subtitle_file)
-                temp_files.append(subtitle_file)
-
-                # 3. Track faces and crop to desired aspect ratio
-                # This only processes the extracted segment, not the full video
-                face_tracked_segment = f"temp_segment_face_tracked_{i}.mp4"
-                track_face_and_crop_mediapipe(
-                    raw_segment, face_tracked_segment, aspect_ratio)
-                temp_files.append(face_tracked_segment)
-
-                # 4. Add subtitles to the face-tracked segment
-                final_segment = f"temp_segment_final_{i}.mp4"
-                print(f"Adding subtitles to segment {i+1}...")
-                cmd = [
-                    'ffmpeg', '-y',
-                    '-i', face_tracked_segment,
-                    '-vf', f"subtitles={subtitle_file}:force_style='FontName=Arial,FontSize=30,PrimaryColour=&HFFFFFF&,OutlineColour=&H000000&,BorderStyle=1,Outline=2,Shadow=1,Alignment=2'",
-                    '-c:a', 'copy',
-                    final_segment
-                ]
-                subprocess.run(cmd, check=True)
-
-                final_temp_files.append(final_segment)
-                temp_files.append(final_segment)
-
-                print(f"Completed processing segment {i+1}/{len(segments)}")
-
-            except Exception as e:
-                print(f"Error processing segment {i+1}: {e}")
-                continue  # Skip this segment and continue with others
-
-        if not final_temp_files:
+        # All segments come from the same video, so they share one output size
+        width, height = crop_dimensions(*get_video_dimensions(video_path), aspect_ratio)
+        size = (width - width % 2, height - height % 2)
+
+        workers = workers or min(len(segments), max(1, (os.cpu_count() or 2) // 2))
+        print(f"Rendering {len(segments)} segments with {workers} workers...")
+        fade = 0
+        with ProcessPoolExecutor(workers) as pool:
+            if not transition or len(segments) < 2:
+                # Segments are independent: each renders as soon as its own tracking is done
+                futures = [pool.submit(compile_segment, video_path, seg, i, transcript_data,
+                                       aspect_ratio, size, work_dir)
+                           for i, seg in enumerate(segments)]
+            else:
+                # The fade length depends on every probed duration, so all segments are
+                # prepared before any is rendered
+                futures = [pool.submit(prepare_compilation_segment, video_path, seg, i,
+                                       transcript_data, aspect_ratio, work_dir)
+                           for i, seg in enumerate(segments)]
+                prepared = [(i, future.result()) for i, future in enumerate(futures)]
+                prepared = [(i, segment) for i, segment in prepared if segment]
+
+                if len(prepared) > 1:
+                    # Head and tail must fit inside the shortest segment actually rendered
+                    shortest = min(segment[3] for _, segment in prepared)
+                    fade = max(0, min(transition_duration, shortest / 3))
+
+                futures = [pool.submit(render_compilation_segment, segment, i, size, work_dir, fade)
+                           for i, segment in prepared]
+            rendered = [future.result() for future in futures]
+        rendered = [pieces for pieces in rendered if pieces]
+
+        if not rendered:
             raise ValueError("No segments were successfully processed")
 
-        # 5. Concatenate all processed segments
+        # 5. Lay out the pieces: with transitions each join becomes one cross-faded clip
+        pieces = []
+        for i, segment_pieces in enumerate(rendered):
+            if not fade:
+                pieces += segment_pieces
+                continue
+            head, body, tail = segment_pieces
+            if i == 0:
+                pieces.append(head)
+            pieces.append(body)
+            if i + 1 < len(rendered):
+                pieces.append(render_transition(
+                    tail, rendered[i + 1][0], os.path.join(work_dir, f"transition_{i}.mp4"),
+                    transition, fade))
+            else:
+                pieces.append(tail)
+
+        # 6. Concatenate all processed segments
         print("\nCombining all segments into final video...")
-        with open('segments.txt', 'w') as f:
-            for temp_file in final_temp_files:
-                f.write(f"file '{temp_file}'\n")
+        list_file = os.path.join(work_dir, 'segments.txt')
+        with open(list_file, 'w') as f:
+            for piece in pieces:
+                f.write(f"file '{os.path.abspath(piece)}'\n")
 
         concat_cmd = [
             'ffmpeg', '-y',
             '-f', 'concat',
             '-safe', '0',
-            '-i', 'segments.txt',
-            '-c', 'copy',
+            '-i', list_file,
+            '-c', 'copy',  # Every piece shares the profile, so this never re-encodes
             output_path
         ]
         subprocess.run(concat_cmd, check=True)
 
-        # Clean up temporary files
-        print("Cleaning up temporary files...")
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-        os.remove('segments.txt')
-
         print(f"Shorts video created successfully! Saved to: {output_path}")
     except Exception as e:
         print(f"Error creating Shorts video: {e}")
-        print("Attempting to clean up temporary files...")
-        try:
-            for temp_file in temp_files:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            if os.path.exists('segments.txt'):
-                os.remove('segments.txt')
-        except Exception as cleanup_error:
-            print(f"Error during cleanup: {cleanup_error}")
+    finally:
+        # Clean up temporary files
+        print("Cleaning up temporary files...")
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 
 def main():
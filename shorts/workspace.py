@@ -0,0 +1,156 @@
+import atexit
+import errno
+import fcntl
+import os
+import shutil
+import threading
+import time
+import uuid
+from artifact_store import STORE_ROOT
+
+# tmpfs mount used for intermediates when they fit
+RAM_ROOT = os.getenv("SHORTS_RAM_DIR", "/dev/shm")
+# Total bytes this process may keep in RAM-backed workspaces at once
+RAM_BUDGET = int(os.getenv("SHORTS_RAM_BUDGET_MB", "1024")) * 1024 * 1024
+# Never take more than this share of the tmpfs free space
+RAM_FREE_SHARE = 0.5
+# Disk fallback, next to the artifact store so finished outputs move in by rename
+DISK_ROOT = os.path.join(STORE_ROOT, 'work')
+
+# Rough size of a segment's intermediates per second of clip (raw cut, render, final)
+BYTES_PER_SECOND = 3 * 1024 * 1024
+
+PREFIX = "shorts_"
+
+_lock = threading.Lock()
+_reserved = 0
+_live = {}
+_swept = False
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def sweep_stale():
+    """Remove workspaces left behind by processes that were killed before cleaning up."""
+    for root in (RAM_ROOT, DISK_ROOT):
+        if not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            if not name.startswith(PREFIX):
+                continue
+            try:
+                pid = int(name[len(PREFIX):].split('_', 1)[0])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _pid_alive(pid):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _ram_available(expected_bytes):
+    """Whether expected_bytes more fit in tmpfs under the budget; reserves them if so."""
+    global _reserved
+    if not os.path.isdir(RAM_ROOT) or not os.access(RAM_ROOT, os.W_OK):
+        return False
+    stat = os.statvfs(RAM_ROOT)
+    free = stat.f_bavail * stat.f_frsize
+    with _lock:
+        if _reserved + expected_bytes > RAM_BUDGET or expected_bytes > free * RAM_FREE_SHARE:
+            return False
+        _reserved += expected_bytes
+    return True
+
+
+class Workspace:
+    """Scratch directory for one task's intermediates, on tmpfs when they fit the RAM budget.
+
+    Directory names carry the owner's pid so sweep_stale() can remove what a killed
+    process left behind; cleanup() also runs at interpreter exit.
+    """
+
+    def __init__(self, name, expected_bytes=0, prefer_ram=True):
+        global _swept
+        if not _swept:
+            _swept = True
+            sweep_stale()
+
+        self.expected_bytes = expected_bytes
+        self.in_ram = prefer_ram and _ram_available(expected_bytes)
+        base = RAM_ROOT if self.in_ram else DISK_ROOT
+        self.root = os.path.join(
+            base, f"{PREFIX}{os.getpid()}_{name}_{uuid.uuid4().hex[:8]}")
+        os.makedirs(self.root)
+        with _lock:
+            _live[self.root] = self
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def fifo(self, name):
+        """Create a named pipe in the workspace for streaming between a producer and a consumer."""
+        path = self.path(name)
+        os.mkfifo(path)
+        return path
+
+    def cleanup(self):
+        global _reserved
+        with _lock:
+            if _live.pop(self.root, None) is None:
+                return
+            if self.in_ram:
+                _reserved -= self.expected_bytes
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+def segment_workspace(name, duration, bytes_per_second=None):
+    """Workspace sized for a segment of the given length in seconds.
+
+    bytes_per_second is the expected size of its intermediates, BYTES_PER_SECOND if unknown.
+    """
+    return Workspace(name, expected_bytes=int(max(0, duration) * (bytes_per_second or BYTES_PER_SECOND)))
+
+
+def open_fifo_writer(path, reader_alive, timeout=30):
+    """Open a FIFO for writing once its reader has opened it.
+
+    A plain open() blocks forever if the reader dies first, so poll non-blocking
+    while reader_alive() holds.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+        if not reader_alive():
+            raise BrokenPipeError(errno.EPIPE, f"Reader of {path} exited before opening it")
+        if time.time() > deadline:
+            raise TimeoutError(f"No reader opened {path} within {timeout}s")
+        time.sleep(0.01)
+
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+    return os.fdopen(fd, 'wb')
+
+
+def _cleanup_all():
+    for workspace in list(_live.values()):
+        workspace.cleanup()
+
+
+atexit.register(_cleanup_all)
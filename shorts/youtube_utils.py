@@ -1,9 +1,12 @@
-import yt_dlp
-from youtube_transcript_api import YouTubeTranscriptApi
+import asyncio
 import os
 import subprocess
 import shutil
 import json
+from process_runner import run_command, stage_timeout, DOWNLOAD_TIMEOUT
+from ffmpeg_runner import run_ffmpeg
+from tracing import span
+from workspace import Workspace, segment_workspace
 
 
 def get_video_id(youtube_url):
@@ -15,23 +18,84 @@ def get_video_id(youtube_url):
 
 def fetch_transcript(video_id):
     """Fetch transcript of a YouTube video."""
+    from youtube_transcript_api import YouTubeTranscriptApi
     try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)
+        with span('transcript_fetch', cat='network', video_id=video_id) as attrs:
+            transcript = YouTubeTranscriptApi.get_transcript(video_id)
+            attrs['entries'] = len(transcript)
         return transcript
     except Exception as e:
         print("Error fetching transcript:", e)
         return None
 
 
-def download_video_segment(youtube_url, start_time, end_time, output_path):
+def get_audio_stream_url(youtube_url):
+    """Get a direct URL to the lowest-cost audio stream, for analysis without downloading the video."""
+    cmd = [
+        'yt-dlp',
+        '--no-warnings',
+        '--get-url',
+        '--format', 'worstaudio/bestaudio/best',
+        youtube_url
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=60)
+        urls = result.stdout.strip().splitlines()
+        return urls[0] if urls else None
+    except Exception as e:
+        print(f"Error getting audio stream URL: {e}")
+        return None
+
+
+def get_video_stream_url(youtube_url, max_height=720):
+    """Get a direct URL to a video-only stream, for sampling frames without downloading the video."""
+    cmd = [
+        'yt-dlp',
+        '--no-warnings',
+        '--get-url',
+        '--format', f'bestvideo[height<={max_height}]/best[height<={max_height}]/best',
+        youtube_url
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=60)
+        urls = result.stdout.strip().splitlines()
+        return urls[0] if urls else None
+    except Exception as e:
+        print(f"Error getting video stream URL: {e}")
+        return None
+
+
+def download_video_segment(youtube_url, start_time, end_time, output_path, threads=None, timeout=None,
+                           segment_id=None):
     """Download highest quality segment from YouTube video with proper audio sync."""
+    return asyncio.run(download_video_segment_async(
+        youtube_url, start_time, end_time, output_path, threads, timeout, segment_id))
+
+
+async def download_video_segment_async(youtube_url, start_time, end_time, output_path, threads=None, timeout=None,
+                                       segment_id=None):
+    """Download highest quality segment from YouTube video with proper audio sync.
+
+    Every yt-dlp/ffmpeg call gets its own timeout and is killed with its children on
+    timeout or cancellation. segment_id tags the calls' labels and trace spans.
+    """
     print(f"Downloading segment from {start_time:.2f}s to {end_time:.2f}s...")
+    timeout = timeout or stage_timeout(DOWNLOAD_TIMEOUT, end_time - start_time)
+    prefix = f"[Segment {segment_id}] " if segment_id is not None else ""
+    trace_attrs = {'segment': segment_id} if segment_id is not None else None
 
-    try:
-        # Create a unique temp directory
-        temp_dir = f"temp_download_{os.path.basename(output_path).replace('.mp4', '')}"
-        os.makedirs(temp_dir, exist_ok=True)
+    # Explicit encoder thread budget when running under the stage scheduler
+    thread_args = ['-threads', str(threads)] if threads else []
 
+    # Intermediates live in a RAM-backed workspace when they fit; the full-video
+    # fallback always goes to disk
+    workspace = segment_workspace(
+        f"download_{os.path.basename(output_path).replace('.mp4', '')}", end_time - start_time + 10)
+    full_workspace = None
+
+    try:
         # Calculate duration
         duration = end_time - start_time
 
@@ -42,8 +106,8 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
         padded_duration = duration + (start_time - padded_start) + padding
 
         # Temp files
-        padded_file = os.path.join(temp_dir, "padded_segment.mp4")
-        temp_file = os.path.join(temp_dir, "temp_segment.mp4")
+        padded_file = workspace.path("padded_segment.mp4")
+        temp_file = workspace.path("temp_segment.mp4")
 
         # Download command
         download_cmd = [
@@ -57,7 +121,7 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
         ]
 
         print(f"Downloading padded segment using yt-dlp...")
-        result = subprocess.run(download_cmd, capture_output=True, text=True)
+        result = await run_command(download_cmd, timeout=timeout, label=f'{prefix}download method 1: yt-dlp padded section', trace_attrs=trace_attrs, check=False)
 
         if os.path.exists(padded_file) and os.path.getsize(padded_file) > 0:
             # Step 2: Extract the exact segment with proper sync
@@ -78,16 +142,16 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
                 '-ar', '48000',        # Standard sample rate
                 '-vsync', 'cfr',       # Constant frame rate for better sync
                 '-async', '1',         # Force audio sync
+                *thread_args,
                 temp_file
             ]
 
             print("Extracting precise segment with audio sync...")
-            subprocess.run(sync_cmd, check=True)
+            await run_ffmpeg(sync_cmd, duration=duration, timeout=timeout, label=f'{prefix}download method 1: ffmpeg precise cut', trace_attrs=trace_attrs)
 
             if os.path.exists(temp_file) and os.path.getsize(temp_file) > 0:
                 # Success - copy to output location
                 shutil.copy2(temp_file, output_path)
-                shutil.rmtree(temp_dir, ignore_errors=True)
 
                 file_size = os.path.getsize(output_path) / (1024 * 1024)
                 print(
@@ -107,8 +171,7 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
         ]
 
         print("Getting direct video URL...")
-        result = subprocess.run(
-            info_cmd, capture_output=True, text=True, check=True)
+        result = await run_command(info_cmd, timeout=timeout, label=f'{prefix}download method 2: yt-dlp get url', trace_attrs=trace_attrs)
         direct_url = result.stdout.strip()
 
         if direct_url:
@@ -128,14 +191,14 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
                 '-async', '1',           # Force audio sync
                 '-max_delay', '500000',  # Increase max A/V delay
                 '-max_muxing_queue_size', '9999',  # Handle large queue
+                *thread_args,
                 output_path
             ]
 
             print("Downloading with improved sync parameters...")
-            subprocess.run(fallback_cmd, check=True)
+            await run_ffmpeg(fallback_cmd, duration=duration, timeout=timeout, label=f'{prefix}download method 2: ffmpeg direct url', trace_attrs=trace_attrs)
 
             if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                shutil.rmtree(temp_dir, ignore_errors=True)
                 file_size = os.path.getsize(output_path) / (1024 * 1024)
                 print(
                     f"Successfully downloaded segment ({file_size:.2f}MB): {output_path}")
@@ -143,7 +206,8 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
 
         # Method 3: Last resort - download full video then extract
         print("Trying final method - downloading video then extracting segment...")
-        full_video = os.path.join(temp_dir, "full_video.mp4")
+        full_workspace = Workspace("download_full", prefer_ram=False)
+        full_video = full_workspace.path("full_video.mp4")
 
         download_cmd = [
             'yt-dlp',
@@ -153,11 +217,11 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
             youtube_url
         ]
 
-        subprocess.run(download_cmd, check=True)
+        await run_command(download_cmd, timeout=timeout, label=f'{prefix}download method 3: yt-dlp full video', trace_attrs=trace_attrs)
 
         if os.path.exists(full_video):
             # First create a clean cut at keyframes
-            keyframe_cut = os.path.join(temp_dir, "keyframe_cut.mp4")
+            keyframe_cut = workspace.path("keyframe_cut.mp4")
 
             cut_cmd = [
                 'ffmpeg', '-y',
@@ -168,7 +232,7 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
                 keyframe_cut
             ]
 
-            subprocess.run(cut_cmd, check=True)
+            await run_ffmpeg(cut_cmd, duration=duration, timeout=timeout, label=f'{prefix}download method 3: ffmpeg keyframe cut', trace_attrs=trace_attrs)
 
             # Then re-encode with forced sync
             final_cmd = [
@@ -181,29 +245,25 @@ def download_video_segment(youtube_url, start_time, end_time, output_path):
                 '-b:a', '192k',
                 '-vsync', 'cfr',
                 '-async', '1',
+                *thread_args,
                 output_path
             ]
 
-            subprocess.run(final_cmd, check=True)
+            await run_ffmpeg(final_cmd, duration=duration, timeout=timeout, label=f'{prefix}download method 3: ffmpeg re-encode', trace_attrs=trace_attrs)
 
             if os.path.exists(output_path):
-                shutil.rmtree(temp_dir, ignore_errors=True)
                 file_size = os.path.getsize(output_path) / (1024 * 1024)
                 print(
                     f"Successfully downloaded segment ({file_size:.2f}MB): {output_path}")
                 return output_path
 
-        # Clean up
-        shutil.rmtree(temp_dir, ignore_errors=True)
         print("All download methods failed")
         return None
 
     except Exception as e:
         print(f"Error downloading segment: {e}")
-        # Try to clean up temp dir if it exists
-        try:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
-        except:
-            pass
         return None
+    finally:
+        workspace.cleanup()
+        if full_workspace:
+            full_workspace.cleanup()